@@ -1,18 +1,96 @@
-from fastapi import APIRouter, HTTPException, status, Path
+import json
+import math
+import pydantic_core
+from fastapi import APIRouter, HTTPException, status, Path, Query, Header, Depends, Request
+from fastapi.responses import StreamingResponse, FileResponse, JSONResponse
 from pydantic import BaseModel, Field, HttpUrl
-from typing import Optional
+from typing import Optional, Any
 
-from app.schemas.video import VideoCreateRequest, VbenResponse, TaskResponse
-from app.services.video_gen import VideoGenService, APIConnectionError, InvalidParameterError, VideoGenerationError
+from app.config import settings
+
+from app.schemas.video import VideoCreateRequest, VideoBatchCreateRequest, VbenResponse, TaskResponse
+from app.services.video_gen import (
+    VideoGenService, VideoGenError, APIConnectionError, InvalidParameterError, VideoGenerationError,
+    TaskNotReadyError, TaskNotFoundError, DeadlineExceededError
+)
+from app.services.providers import GenerationOptions
 
 # Create router
 router = APIRouter(prefix="/api/v1/videos", tags=["Videos"])
 
-# Initialize service
-video_service = VideoGenService()
+async def get_video_service(request: Request) -> VideoGenService:
+    """The worker's VideoGenService, created by the app lifespan"""
+    # async so FastAPI calls it inline instead of hopping to the threadpool per request
+    return request.app.state.video_service
+
+
+class TaskJSONResponse(JSONResponse):
+    """JSON response encoded by pydantic-core in a single call"""
+
+    def render(self, content: Any) -> bytes:
+        return pydantic_core.to_json(content)
+
+
+def vben_response(message: str, data: Any, status_code: int = status.HTTP_200_OK) -> TaskJSONResponse:
+    """
+    Envelope data as {"code": 0, "message", "data"} and encode it directly
 
-@router.post("/tasks", status_code=status.HTTP_201_CREATED)
-async def create_video_task(request: VideoCreateRequest):
+    Returning a Response skips FastAPI's response_model validation and
+    jsonable_encoder walk over upstream payloads; response_model is kept on
+    the routes for the OpenAPI schema only.
+    """
+    return TaskJSONResponse({"code": 0, "message": message, "data": data}, status_code=status_code)
+
+
+def retry_after_headers(error: Exception) -> Optional[dict]:
+    """Retry-After header for errors raised while upstream is being shed"""
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after is None:
+        return None
+    return {"Retry-After": str(max(1, math.ceil(retry_after)))}
+
+
+def build_content_list(request: VideoCreateRequest) -> list:
+    """Convert a create request into the upstream content array (validated by the service)"""
+    content_list = [{
+        "type": "text",
+        "text": request.prompt
+    }]
+    if request.image_url:
+        content_list.append({
+            "type": "image_url",
+            "image_url": {
+                "url": str(request.image_url)
+            }
+        })
+    return content_list
+
+
+def build_options(request: VideoCreateRequest) -> GenerationOptions:
+    """Generation options set on a create request (checked against the models by the service)"""
+    return GenerationOptions(
+        duration=request.duration,
+        resolution=request.resolution,
+        ratio=request.ratio,
+        generate_audio=request.generate_audio
+    )
+
+
+@router.post("/tasks", status_code=status.HTTP_201_CREATED, response_model=VbenResponse)
+async def create_video_task(
+    request: VideoCreateRequest,
+    idempotency_key: Optional[str] = Header(
+        None,
+        max_length=255,
+        description="Retries with the same key return the original task instead of creating a new one"
+    ),
+    api_key: Optional[str] = Header(
+        None,
+        alias="X-API-Key",
+        description="Caller API key; submissions are queued fairly per key"
+    ),
+    video_service: VideoGenService = Depends(get_video_service)
+):
     """
     Create video generation task
     
@@ -20,48 +98,50 @@ async def create_video_task(request: VideoCreateRequest):
     - **content**: Content array with text and optional image
         - Text content: {"type": "text", "text": "your prompt --duration 5"}
         - Image content: {"type": "image_url", "image_url": {"url": "https://..."}}
+    - **callback_url**: Optional URL that receives the final task result via POST
+    - **priority**: Optional admission priority (interactive, standard, batch)
+    - **duration** / **resolution** / **ratio** / **generate_audio**: Optional generation options
+    - **preview**: Optional; also create a quick low-resolution preview task
+    - **Idempotency-Key** header: Optional; safe retries without duplicate tasks
+    - **X-API-Key** header: Optional tenant key for fair queuing
     
     Returns:
-        Task ID and creation info
+        Task ID and creation info, with the expected latency and cost
     """
     try:
         # Convert Pydantic models to dict for the service
-        content_list = []
-        if not request.prompt:
-            raise InvalidParameterError("Prompt cannot be empty")
-        
-        content_list.append({
-            "type": "text",
-            "text": request.prompt
-        })
-        if request.image_url:
-            content_list.append({
-                "type": "image_url",
-                "image_url": {
-                    "url": str(request.image_url)
-                }
-            })
-        
+        content_list = build_content_list(request)
+
         # Call service to create task
         result = await video_service.create_video_task(
-            content=content_list
+            content=content_list,
+            callback_url=request.callback_url,
+            idempotency_key=idempotency_key,
+            tenant=api_key,
+            priority=request.priority,
+            options=build_options(request),
+            preview=request.preview
         )
         
-        return {
-            "code": 0,
-            "message": "Video generation task created successfully",
-            "data": result
-        }
+        return vben_response(
+            "Video generation task created successfully", result, status_code=status.HTTP_201_CREATED
+        )
         
     except InvalidParameterError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(e)
         )
+    except DeadlineExceededError as e:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=str(e)
+        )
     except APIConnectionError as e:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail=str(e)
+            detail=str(e),
+            headers=retry_after_headers(e)
         )
     except VideoGenerationError as e:
         raise HTTPException(
@@ -75,32 +155,137 @@ async def create_video_task(request: VideoCreateRequest):
         )
 
 
+@router.post("/tasks:batch", response_model=VbenResponse)
+async def create_video_tasks_batch(
+    request: VideoBatchCreateRequest,
+    api_key: Optional[str] = Header(
+        None,
+        alias="X-API-Key",
+        description="Caller API key; submissions are queued fairly per key"
+    ),
+    video_service: VideoGenService = Depends(get_video_service)
+):
+    """
+    Create many video generation tasks in one request
+
+    - **items**: List of create requests (same fields as POST /tasks; preview is not used)
+
+    All items are validated first; valid ones are then sent upstream with
+    bounded concurrency. Each item succeeds or fails independently.
+
+    Returns:
+        Per-item results in request order
+    """
+    if len(request.items) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Batch cannot exceed {settings.BATCH_MAX_ITEMS} items, current size: {len(request.items)}"
+        )
+
+    try:
+        # Invalid items are reported per item by the service's validation
+        items = [
+            {
+                "content": build_content_list(item),
+                "callback_url": item.callback_url,
+                "priority": item.priority,
+                "options": build_options(item)
+            }
+            for item in request.items
+        ]
+        results = await video_service.create_video_tasks_batch(items, tenant=api_key)
+
+        succeeded = sum(1 for r in results if r["ok"])
+        return vben_response("Batch processed", {
+            "total": len(results),
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "items": results
+        })
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Unexpected error: {str(e)}"
+        )
+
+
+@router.get("/tasks", response_model=VbenResponse)
+async def list_video_tasks(
+    page: int = Query(1, ge=1, description="Page number, starting from 1"),
+    page_size: int = Query(20, ge=1, le=100, description="Items per page"),
+    status_filter: Optional[str] = Query(None, alias="status", description="Only tasks with this status"),
+    video_service: VideoGenService = Depends(get_video_service)
+):
+    """
+    List tasks created through this service, newest first
+
+    Served from the local task registry without calling upstream.
+
+    Returns:
+        Task records with pagination info
+    """
+    try:
+        items, total = await video_service.list_tasks(page, page_size, status_filter)
+        return vben_response("Task list successful", {
+            "items": items,
+            "total": total,
+            "page": page,
+            "page_size": page_size
+        })
+
+    except VideoGenerationError as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+
 @router.get("/tasks/{task_id}", response_model=VbenResponse)
 async def query_video_task(
-    task_id: str = Path(..., description="Task ID returned from create task endpoint")
+    task_id: str = Path(..., description="Task ID returned from create task endpoint"),
+    wait: Optional[float] = Query(
+        None,
+        ge=0,
+        le=settings.TASK_LONG_POLL_MAX_SECONDS,
+        description="Long-poll: hold the request up to this many seconds until the status changes"
+    ),
+    video_service: VideoGenService = Depends(get_video_service)
 ):
     """
     Query video generation task status
     
     - **task_id**: Task ID from the create task response
+    - **wait**: Optional long-poll timeout in seconds
+    - **timeout** (or X-Request-Timeout header): Optional deadline in seconds; 504 once it passes
     
     Returns:
         Task status, progress, and result (if completed)
     """
     try:
         # Call service to query task
-        result = await video_service.query_task(task_id)
+        if wait:
+            result = await video_service.wait_for_task(task_id, wait)
+        else:
+            result = await video_service.query_task(task_id)
         
-        return VbenResponse(
-            code=0,
-            message="Task query successful",
-            data=result
-        )
+        return vben_response("Task query successful", result)
         
+    except TaskNotFoundError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    except DeadlineExceededError as e:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=str(e)
+        )
     except APIConnectionError as e:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail=str(e)
+            detail=str(e),
+            headers=retry_after_headers(e)
         )
     except VideoGenerationError as e:
         raise HTTPException(
@@ -114,6 +299,97 @@ async def query_video_task(
         )
 
 
+@router.get("/tasks/{task_id}/events")
+async def stream_video_task_events(
+    task_id: str = Path(..., description="Task ID returned from create task endpoint"),
+    video_service: VideoGenService = Depends(get_video_service)
+):
+    """
+    Stream task status transitions as Server-Sent Events
+
+    Sends a `status` event with the current task result, then one on every
+    status change, and closes after a terminal status. Keep-alive comments
+    are sent while nothing changes.
+    """
+    async def event_stream():
+        try:
+            async for result in video_service.watch_task(task_id, settings.TASK_SSE_HEARTBEAT_SECONDS):
+                if result is None:
+                    yield ": keep-alive\n\n"
+                else:
+                    yield f"event: status\ndata: {json.dumps(result)}\n\n"
+        except VideoGenError as e:
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/tasks/{task_id}/video")
+async def download_video_task_result(
+    task_id: str = Path(..., description="Task ID returned from create task endpoint"),
+    video_service: VideoGenService = Depends(get_video_service)
+):
+    """
+    Download the generated MP4 for a succeeded task
+
+    The file is fetched from upstream once and then served from the local
+    cache, with HTTP Range support for seeking.
+    """
+    try:
+        path = await video_service.get_video_file(task_id)
+    except TaskNotFoundError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    except TaskNotReadyError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
+    except DeadlineExceededError as e:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=str(e)
+        )
+    except APIConnectionError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers=retry_after_headers(e)
+        )
+    except VideoGenerationError as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+    return FileResponse(
+        path,
+        media_type="video/mp4",
+        filename=f"{task_id}.mp4",
+        content_disposition_type="inline"
+    )
+
+
+@router.get(
+    "/stats",
+    summary="Service Statistics",
+    description="Upstream connection reuse counters for this worker"
+)
+async def service_stats(video_service: VideoGenService = Depends(get_video_service)):
+    """Service statistics endpoint"""
+    return {
+        "code": 0,
+        "message": "ok",
+        "data": video_service.get_stats()
+    }
+
+
 @router.get(
     "/health",
     summary="Health Check",
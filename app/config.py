@@ -1,3 +1,5 @@
+from typing import Dict
+
 from pydantic import Field
 from pydantic_settings import BaseSettings
 
@@ -11,6 +13,166 @@ class Settings(BaseSettings):
     # ByteDance Ark API Key
     BYTEDANCE_ARK_API_KEY: str = Field(..., env="BYTEDANCE_ARK_API_KEY")
     BYTEDANCE_MODEL_ID: str = Field(..., env="BYTEDANCE_MODEL_ID")
+    ARK_BASE_URL: str = Field(
+        default="https://ark.ap-southeast.bytepluses.com/api/v3",
+        description="ByteDance Ark API base URL",
+    )
+
+    # Upstream HTTP client (one pooled client per worker)
+    ARK_HTTP_TIMEOUT: float = Field(default=30.0, description="Upstream read/write timeout in seconds")
+    ARK_HTTP_CONNECT_TIMEOUT: float = Field(default=5.0, description="Upstream connect timeout in seconds")
+    ARK_HTTP_MAX_CONNECTIONS: int = Field(default=100, description="Maximum concurrent upstream connections")
+    ARK_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = Field(default=20, description="Maximum idle keep-alive connections")
+    ARK_HTTP_KEEPALIVE_EXPIRY: float = Field(default=30.0, description="Idle keep-alive connection expiry in seconds")
+    ARK_HTTP2: bool = Field(default=False, description="Enable HTTP/2 to upstream (requires the h2 package)")
+    HTTP_CLIENTS_LAZY: bool = Field(default=True, description="Build HTTP clients on first use instead of at startup")
+
+    # Upstream protection (rate limit, adaptive concurrency, circuit breaker, retries)
+    UPSTREAM_RATE_PER_SECOND: float = Field(default=50.0, description="Maximum upstream requests per second")
+    UPSTREAM_RATE_BURST: int = Field(default=50, description="Upstream request burst size")
+    UPSTREAM_CONCURRENCY_INITIAL: int = Field(default=32, description="Initial upstream concurrency limit")
+    UPSTREAM_CONCURRENCY_MIN: int = Field(default=4, description="Lowest adaptive concurrency limit")
+    UPSTREAM_CONCURRENCY_MAX: int = Field(default=128, description="Highest adaptive concurrency limit")
+    UPSTREAM_CONCURRENCY_DECREASE: float = Field(default=0.5, description="Limit multiplier on 429/timeouts")
+    UPSTREAM_BREAKER_FAILURES: int = Field(default=5, description="Consecutive failures that open the circuit")
+    UPSTREAM_BREAKER_COOLDOWN: float = Field(default=30.0, description="Seconds the circuit stays open")
+    UPSTREAM_MAX_RETRIES: int = Field(default=2, description="Retries for idempotent upstream calls")
+    UPSTREAM_RETRY_BASE_DELAY: float = Field(default=0.2, description="First retry delay in seconds")
+    UPSTREAM_RETRY_MAX_DELAY: float = Field(default=2.0, description="Maximum retry delay in seconds")
+
+    # Tail latency (request deadlines, hedged status lookups)
+    REQUEST_DEFAULT_TIMEOUT_SECONDS: float = Field(default=0.0, description="Deadline for requests without X-Request-Timeout / ?timeout= (0: none)")
+    REQUEST_MAX_TIMEOUT_SECONDS: float = Field(default=300.0, description="Cap on caller-supplied deadlines (0: no cap)")
+    HEDGE_ENABLED: bool = Field(default=True, description="Send a second status lookup when the first is slower than usual")
+    HEDGE_PERCENTILE: float = Field(default=0.95, description="Observed lookup latency percentile after which a hedge is sent")
+    HEDGE_MIN_DELAY_SECONDS: float = Field(default=0.05, description="Lower bound on the hedge delay")
+    HEDGE_BUDGET_PERCENT: float = Field(default=5.0, description="Hedges allowed as a percentage of status lookups")
+    HEDGE_MIN_SAMPLES: int = Field(default=100, description="Lookups observed before hedging starts")
+
+    # Multi-worker deployment
+    WEB_CONCURRENCY: int = Field(default=1, description="Worker processes (also read by uvicorn --workers)")
+    SHARED_STATE_BACKEND: str = Field(default="local", description="local (budgets split per worker) or redis (shared)")
+    SHARED_TASK_RESULT_TTL_SECONDS: float = Field(default=3600.0, description="How long finished task results stay in shared state")
+    SHUTDOWN_DRAIN_SECONDS: float = Field(default=20.0, description="Time allowed for in-flight work to finish on shutdown")
+
+    # Video providers and routing
+    VIDEO_PROVIDERS: str = Field(default="ark", description="Comma-separated providers to route between: ark, openai")
+    OPENAI_BASE_URL: str = Field(default="https://api.openai.com/v1", description="OpenAI API base URL")
+    OPENAI_VIDEO_MODEL: str = Field(default="sora-2", description="OpenAI video model")
+    OPENAI_VIDEO_SIZE: str = Field(default="1280x720", description="OpenAI video resolution (WIDTHxHEIGHT)")
+    OPENAI_HTTP_TIMEOUT: float = Field(default=60.0, description="OpenAI request timeout in seconds")
+    ARK_COST_PER_SECOND: float = Field(default=0.05, description="Ark price per generated second at 720p (USD), for routing and estimates")
+    OPENAI_COST_PER_SECOND: float = Field(default=0.10, description="OpenAI price per generated second at 720p (USD), for routing and estimates")
+    ROUTING_DEFAULT_QUEUE_SECONDS: float = Field(default=30.0, description="Assumed queue time before any is observed")
+    ROUTING_ERROR_PENALTY: float = Field(default=300.0, description="Score seconds added at a 100% create error rate")
+    ROUTING_COST_WEIGHT: float = Field(default=50.0, description="Score seconds per USD of task cost")
+    ROUTING_EWMA_ALPHA: float = Field(default=0.2, description="Smoothing factor for queue time and error rate")
+
+    # Generation options (per request; these apply when a request leaves them out)
+    VIDEO_DEFAULT_DURATION: int = Field(default=12, description="Video length in seconds when not requested")
+    VIDEO_DEFAULT_GENERATE_AUDIO: bool = Field(default=False, description="Generate audio when not requested (Ark)")
+    ARK_MIN_DURATION: int = Field(default=2, description="Shortest video the Ark model accepts, in seconds")
+    ARK_MAX_DURATION: int = Field(default=12, description="Longest video the Ark model accepts, in seconds")
+    ARK_RESOLUTIONS: str = Field(default="480p,720p,1080p", description="Comma-separated resolutions the Ark model accepts")
+    ARK_RATIOS: str = Field(default="16:9,4:3,1:1,3:4,9:16,21:9,adaptive", description="Comma-separated aspect ratios the Ark model accepts")
+    ARK_GENERATE_AUDIO: bool = Field(default=True, description="Whether the Ark model can generate audio")
+
+    # Latency / cost estimates and preview tasks
+    ESTIMATE_DEFAULT_SECONDS_PER_VIDEO_SECOND: float = Field(default=10.0, description="Assumed completion seconds per video second before any is observed")
+    ESTIMATE_DECAY: float = Field(default=0.95, description="Weight kept by older completions per new one")
+    PREVIEW_DURATION: int = Field(default=4, description="Target length of preview tasks in seconds")
+    PREVIEW_AUTO_SECONDS: float = Field(default=120.0, description="Interactive creates expected to take longer get a preview task too (0 disables)")
+
+    # Task status cache
+    TASK_CACHE_TTL_SECONDS: float = Field(default=2.0, description="TTL for cached non-terminal task statuses")
+    TASK_CACHE_MAX_ENTRIES: int = Field(default=10000, description="Maximum cached non-terminal tasks")
+    TASK_CACHE_MAX_TERMINAL_ENTRIES: int = Field(default=50000, description="Maximum pinned terminal tasks")
+
+    # Background task poller
+    TASK_POLLER_ENABLED: bool = Field(default=True, description="Refresh live tasks from a background poller")
+    TASK_POLLER_MIN_INTERVAL: float = Field(default=2.0, description="Initial seconds between polls of a task")
+    TASK_POLLER_MAX_INTERVAL: float = Field(default=30.0, description="Maximum seconds between polls of a task")
+    TASK_POLLER_BACKOFF: float = Field(default=1.5, description="Poll interval growth factor per poll")
+    TASK_POLLER_BATCH_SIZE: int = Field(default=50, description="Tasks refreshed per task-list request")
+    TASK_POLLER_MAX_TRACK_SECONDS: float = Field(default=7200.0, description="Stop tracking tasks older than this")
+    TASK_WATCH_INTERVAL: float = Field(default=1.0, description="Poll interval for tasks with long-poll/SSE waiters")
+    TASK_LONG_POLL_MAX_SECONDS: float = Field(default=60.0, description="Maximum ?wait= accepted by the query route")
+    TASK_SSE_HEARTBEAT_SECONDS: float = Field(default=15.0, description="Seconds between SSE keep-alive comments")
+
+    # Task registry
+    TASK_STORE_BACKEND: str = Field(default="sqlite", description="Task registry backend: sqlite or redis")
+    TASK_STORE_PATH: str = Field(default="data/tasks.db", description="SQLite task registry file")
+    REDIS_URL: str = Field(default="redis://localhost:6379/0", description="Redis URL for shared state")
+
+    # Upstream reconciliation (cancel abandoned tasks, purge old records)
+    RECONCILE_ENABLED: bool = Field(default=False, description="Periodically reconcile upstream tasks with the task registry")
+    RECONCILE_INTERVAL_SECONDS: float = Field(default=900.0, description="Seconds between reconciliation runs")
+    RECONCILE_PAGE_SIZE: int = Field(default=100, description="Tasks per upstream task-list page")
+    RECONCILE_MAX_PAGES: int = Field(default=20, description="Pages listed per status per run")
+    RECONCILE_RATE_PER_SECOND: float = Field(default=1.0, description="Upstream calls per second for the job, deployment-wide")
+    RECONCILE_MAX_LOAD: float = Field(default=0.5, description="Pause while live calls exceed this fraction of the upstream concurrency limit")
+    RECONCILE_MAX_TASK_AGE_SECONDS: float = Field(default=7200.0, description="Cancel tasks still queued upstream after this long")
+    RECONCILE_IDLE_SECONDS: float = Field(default=0.0, description="Cancel queued tasks no client asked about for this long (0 disables)")
+    RECONCILE_CANCEL_UNKNOWN: bool = Field(default=False, description="Also cancel queued tasks missing from the task registry")
+    RECONCILE_PURGE_AFTER_SECONDS: float = Field(default=7 * 86400.0, description="Remove finished tasks older than this from the registry and caches (0 disables)")
+
+    # Duplicate submission protection
+    IDEMPOTENCY_TTL_SECONDS: float = Field(default=86400.0, description="How long Idempotency-Key results are kept")
+    DEDUPE_ENABLED: bool = Field(default=False, description="Reuse tasks for identical content submissions")
+    DEDUPE_WINDOW_SECONDS: float = Field(default=600.0, description="Window in which identical content is reused")
+    DEDUPE_MAX_ENTRIES: int = Field(default=10000, description="Maximum remembered submissions")
+
+    # Generated video cache / download proxy
+    VIDEO_CACHE_DIR: str = Field(default="data/videos", description="Directory for cached result videos")
+    VIDEO_CACHE_MAX_BYTES: int = Field(default=10 * 1024 ** 3, description="Disk budget for cached videos")
+    VIDEO_DOWNLOAD_CHUNK_SIZE: int = Field(default=1024 * 1024, description="Chunk size for video downloads")
+    VIDEO_DOWNLOAD_TIMEOUT: float = Field(default=120.0, description="Video download read timeout in seconds")
+
+    # First-frame image preprocessing
+    IMAGE_PREPROCESS_ENABLED: bool = Field(default=False, description="Resize/pad image_url inputs before upload")
+    IMAGE_TARGET_RESOLUTION: str = Field(default="landscape_720p", description="Size key from SORA_RESOLUTIONS for tasks whose resolution and ratio leave the frame size open")
+    IMAGE_PREPROCESS_MODE: str = Field(default="pad", description="pad (letterbox to exact size) or resize (downscale only)")
+    IMAGE_FORMAT: str = Field(default="JPEG", description="Re-encode format: JPEG, PNG or WEBP")
+    IMAGE_QUALITY: int = Field(default=90, description="JPEG/WEBP quality")
+    IMAGE_MAX_BYTES: int = Field(default=20 * 1024 * 1024, description="Largest accepted source image")
+    IMAGE_WORKERS: int = Field(default=2, description="Processes in the image preprocessing pool")
+    IMAGE_CACHE_DIR: str = Field(default="data/images", description="Directory for processed image cache")
+    IMAGE_CACHE_MAX_BYTES: int = Field(default=1024 ** 3, description="Disk budget for processed images")
+
+    # Batch task creation
+    BATCH_MAX_ITEMS: int = Field(default=200, description="Maximum tasks per batch request")
+    BATCH_CONCURRENCY: int = Field(default=8, description="Concurrent upstream creates per batch")
+    BATCH_RATE_PER_SECOND: float = Field(default=10.0, description="Upstream creates per second for batches")
+    BATCH_RATE_BURST: int = Field(default=10, description="Token bucket burst size for batch creates")
+
+    # Admission queue (priority classes + per-API-key weighted fair queuing)
+    ADMISSION_ENABLED: bool = Field(default=False, description="Queue submissions locally and dispatch as upstream capacity frees")
+    ADMISSION_MAX_ACTIVE_TASKS: int = Field(default=50, description="Maximum tasks running upstream at once")
+    ADMISSION_MAX_QUEUE: int = Field(default=10000, description="Maximum queued submissions before rejecting")
+    ADMISSION_DEFAULT_PRIORITY: str = Field(default="standard", description="Priority for single creates: interactive, standard or batch")
+    ADMISSION_BATCH_PRIORITY: str = Field(default="batch", description="Priority for items submitted through the batch endpoint")
+    ADMISSION_TENANT_WEIGHTS: Dict[str, float] = Field(
+        default_factory=dict,
+        description='JSON map of API key to fair-share weight, e.g. {"key-a": 2}; others get 1'
+    )
+    ADMISSION_ID_RETENTION_SECONDS: float = Field(default=7 * 86400.0, description="How long local task ids keep resolving after dispatch")
+
+    # Completion webhooks
+    WEBHOOK_ENABLED: bool = Field(default=True, description="Deliver callback_url webhooks on task completion")
+    WEBHOOK_DB_PATH: str = Field(default="data/webhooks.db", description="SQLite file for the delivery queue")
+    WEBHOOK_SECRET: str = Field(default="", description="HMAC-SHA256 signing secret (unsigned if empty)")
+    WEBHOOK_CONCURRENCY: int = Field(default=8, description="Maximum concurrent webhook deliveries")
+    WEBHOOK_MAX_ATTEMPTS: int = Field(default=8, description="Delivery attempts before giving up")
+    WEBHOOK_BACKOFF_BASE: float = Field(default=2.0, description="First retry delay in seconds, doubled per attempt")
+    WEBHOOK_BACKOFF_MAX: float = Field(default=600.0, description="Maximum retry delay in seconds")
+    WEBHOOK_TIMEOUT: float = Field(default=10.0, description="Webhook request timeout in seconds")
+    
+    # Traffic capture for offline replay (tests/replay_traces.py)
+    TRACE_CAPTURE_PATH: str = Field(default="", description="JSON Lines file for redacted request/upstream traces (empty disables)")
+    TRACE_SAMPLE_RATE: float = Field(default=1.0, description="Fraction of requests captured")
+    TRACE_MAX_BODY_BYTES: int = Field(default=65536, description="Larger bodies are recorded by size only")
+    TRACE_MAX_FILE_BYTES: int = Field(default=100 * 1024 * 1024, description="Trace file size before it is rotated and gzipped")
+    TRACE_BACKUP_COUNT: int = Field(default=5, description="Rotated trace files kept")
     
      # Environment
     ENV: str = Field(default="dev", description="Environment")
@@ -21,6 +183,9 @@ class Settings(BaseSettings):
     )
     DEBUG: bool = Field(default=True, description="Debug mode")
     LOG_LEVEL: str = Field(default="INFO", description="Log level")
+    LOG_FORMAT: str = Field(default="text", description="Log line format: text or json")
+    LOG_SAMPLE_RATE: float = Field(default=1.0, description="Fraction of routine task polling log lines to keep")
+    LOG_QUEUE_SIZE: int = Field(default=10000, description="Log records buffered for the writer thread before dropping")
 
     class Config:
         env_file = ".env"
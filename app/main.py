@@ -1,22 +1,64 @@
+# First import, so the startup report covers everything below
+from app.utils.startup import startup_timer
+
+import os
+import asyncio
 import logging
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from prometheus_client import CONTENT_TYPE_LATEST
 
 from app.config import settings
-from app.utils.logger import setup_logging
+from app.utils.logger import setup_logging, RequestContextMiddleware
 from app.api.router import router as video_router
+from app.services.video_gen import VideoGenService
+from app.utils.metrics import (
+    MetricsMiddleware, monitor_event_loop, register_service_stats, observe_startup, render_metrics, worker_exited
+)
+from app.utils.trace import TraceCaptureMiddleware, setup_tracing, stop_tracing
+from app.utils.deadline import DeadlineMiddleware
+startup_timer.mark("import")
 
 # Setup logging
 setup_logging(settings)
 logger = logging.getLogger(__name__)
+startup_timer.mark("logging")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Build this worker's service and pools on startup, drain and release them on shutdown
+
+    Runs once per worker process, so nothing is shared by fork.
+    """
+    setup_tracing(settings)
+    with startup_timer.phase("service_init"):
+        video_service = VideoGenService()
+    app.state.video_service = video_service
+    await video_service.startup()
+    register_service_stats(video_service.get_stats)
+    loop_monitor = asyncio.create_task(monitor_event_loop())
+    timings = startup_timer.report()
+    observe_startup(timings)
+    logger.info("Worker started - pid: %s, startup ms: %s", os.getpid(), timings)
+    try:
+        yield
+    finally:
+        loop_monitor.cancel()
+        await video_service.shutdown(drain_timeout=settings.SHUTDOWN_DRAIN_SECONDS)
+        stop_tracing()
+        worker_exited()
+        logger.info("Worker stopped - pid: %s", os.getpid())
 
 
 # Create FastAPI application
 app = FastAPI(
     title="Sora2 Video Generation API",
     description="Video generation API based on ByteDance Ark",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Setup CORS
@@ -28,6 +70,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Innermost: capture redacted traces when TRACE_CAPTURE_PATH is set
+app.add_middleware(TraceCaptureMiddleware)
+
+# Record per-route latency for /metrics
+app.add_middleware(MetricsMiddleware)
+
+# Request deadline from X-Request-Timeout / ?timeout=, honoured by every upstream call
+app.add_middleware(
+    DeadlineMiddleware,
+    default_seconds=settings.REQUEST_DEFAULT_TIMEOUT_SECONDS,
+    max_seconds=settings.REQUEST_MAX_TIMEOUT_SECONDS
+)
+
+# Outermost: give every request a correlation id for its log lines
+app.add_middleware(RequestContextMiddleware)
+
 # Include router
 app.include_router(video_router)
 
@@ -42,6 +100,12 @@ async def root():
     }
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics (all workers with PROMETHEUS_MULTIPROC_DIR, else the answering one)"""
+    return Response(render_metrics(), media_type=CONTENT_TYPE_LATEST)
+
+
 @app.get("/health")
 async def health():
     """Overall health check"""
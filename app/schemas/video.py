@@ -6,6 +6,20 @@ from typing import Optional, Any, List, Literal
 class VideoCreateRequest(BaseModel):
     prompt: str = Field(..., description="Text prompt for video generation")
     image_url: Optional[str] = Field(None, description="Optional image URL for video generation")
+    callback_url: Optional[str] = Field(None, description="Optional URL that receives the final task result via POST")
+    priority: Optional[Literal["interactive", "standard", "batch"]] = Field(
+        None,
+        description="Admission priority class when the submission queue is enabled"
+    )
+    duration: Optional[int] = Field(None, ge=1, description="Video length in seconds (model default when omitted)")
+    resolution: Optional[str] = Field(None, description="Output resolution, e.g. 480p, 720p, 1080p")
+    ratio: Optional[str] = Field(None, description="Aspect ratio, e.g. 16:9, 9:16, 1:1, adaptive")
+    generate_audio: Optional[bool] = Field(None, description="Generate an audio track, where the model allows the choice")
+    preview: Optional[bool] = Field(
+        None,
+        description="Also create a short low-resolution preview task; by default only for interactive "
+                    "requests expected to take long"
+    )
     
     # class Config:
     #     json_schema_extra = {
@@ -26,6 +40,9 @@ class VideoCreateRequest(BaseModel):
     #         }
     #     }
 
+class VideoBatchCreateRequest(BaseModel):
+    items: List[VideoCreateRequest] = Field(..., min_length=1, description="Tasks to create")
+
 # Task response model
 class TaskResponse(BaseModel):
     id: str = Field(..., description="Task ID")
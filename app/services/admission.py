@@ -0,0 +1,417 @@
+import time
+import uuid
+import heapq
+import asyncio
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, List, Callable, Awaitable
+
+from app.services.task_cache import TERMINAL_STATUSES
+from app.services.task_store import TaskStore
+from app.utils.metrics import ADMISSION_QUEUE_DEPTH, ADMISSION_WAIT_SECONDS, ADMISSION_ACTIVE_TASKS
+
+
+logger = logging.getLogger(__name__)
+
+# Served strictly in this order; tenants share each class by weight
+PRIORITY_CLASSES = ("interactive", "standard", "batch")
+
+# Task ids handed out for submissions still in the queue
+LOCAL_ID_PREFIX = "local-"
+
+# Seconds between task store checks while waiting on another worker's submission
+SETTLE_POLL_SECONDS = 1.0
+
+
+class QueueFullError(Exception):
+    """Admission queue is at capacity"""
+    pass
+
+
+@dataclass
+class Submission:
+    local_id: str
+    tenant: str
+    priority: str
+    payload: Dict[str, Any]
+    enqueued_at: float
+    created_at: float = field(default_factory=time.time)
+    status: str = "queued"
+    upstream_id: Optional[str] = None
+    error: Optional[str] = None
+    dispatched_at: Optional[float] = None
+    # Recorded in the task store, so other workers and the next start can see it
+    persisted: bool = False
+    # Set once the submission leaves the queue (dispatched or failed)
+    settled: asyncio.Event = field(default_factory=asyncio.Event)
+
+
+@dataclass(order=True)
+class _QueueEntry:
+    finish_tag: float
+    seq: int
+    submission: Submission = field(compare=False)
+
+
+class AdmissionController:
+    """
+    Admission layer in front of upstream task creation
+
+    Submissions get a local id immediately and wait in a queue per priority
+    class. Classes are served in strict priority order; inside a class,
+    tenants (API keys) share dispatch slots by weighted fair queuing using
+    start-time fair queuing tags. At most max_active tasks run upstream at
+    once; a slot frees when the task reaches a terminal state.
+
+    With a task store, queued submissions are recorded there: they survive
+    a restart (recover() queues them again), a worker claims one before
+    sending it so it is dispatched once, and local ids resolve on every
+    worker for retention seconds after dispatch.
+    """
+
+    def __init__(
+        self,
+        dispatch: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+        max_active: int,
+        max_queue: int,
+        tenant_weights: Dict[str, float],
+        active_timeout: float,
+        max_tracked: int = 100000,
+        store: Optional[TaskStore] = None,
+        retention: float = 7 * 86400.0
+    ):
+        self.dispatch = dispatch
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.tenant_weights = tenant_weights
+        self.active_timeout = active_timeout
+        self.max_tracked = max_tracked
+        self.store = store
+        self.retention = retention
+        self._queues: Dict[str, List[_QueueEntry]] = {p: [] for p in PRIORITY_CLASSES}
+        self._virtual_time: Dict[str, float] = {p: 0.0 for p in PRIORITY_CLASSES}
+        self._last_finish: Dict[tuple, float] = {}
+        self._seq = 0
+        # upstream_id -> dispatch time of tasks holding a slot
+        self._active: Dict[str, float] = {}
+        self._dispatching = 0
+        self._submissions: "OrderedDict[str, Submission]" = OrderedDict()
+        self._wakeup = asyncio.Event()
+        self._runner: Optional[asyncio.Task] = None
+        self._dispatches: set = set()
+        self.counters = {
+            "submitted": 0, "dispatched": 0, "dispatch_failed": 0, "rejected": 0,
+            "recovered": 0, "claimed_elsewhere": 0
+        }
+
+    @property
+    def queued(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    async def start(self) -> None:
+        if self._runner is None:
+            self._wakeup = asyncio.Event()
+            self._runner = asyncio.create_task(self._run())
+            logger.info("Admission controller started - max_active: %s", self.max_active)
+
+    async def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop dispatching; submissions already being sent get up to timeout seconds to finish"""
+        if self._runner is not None:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+            if self._dispatches:
+                _, pending = await asyncio.wait(self._dispatches, timeout=timeout)
+                for task in pending:
+                    task.cancel()
+                if pending:
+                    # Let them record the interruption while the task store is still open
+                    await asyncio.wait(pending)
+            queued = [e.submission for q in self._queues.values() for e in q]
+            lost = sum(1 for submission in queued if not submission.persisted)
+            if lost:
+                logger.warning("Admission controller stopped with %s undispatched submissions not in the task store", lost)
+            if len(queued) > lost:
+                logger.info("Admission controller left %s queued submissions for the next start", len(queued) - lost)
+            logger.info("Admission controller stopped - stats: %s", self.counters)
+
+    async def submit(self, payload: Dict[str, Any], tenant: str, priority: str) -> Dict[str, Any]:
+        """
+        Queue a validated create request
+
+        payload must be JSON-serializable when a task store is used.
+
+        Returns:
+            The local task result ({"id", "status": "queued", ...})
+
+        Raises:
+            QueueFullError: Queue already holds max_queue submissions
+        """
+        if priority not in self._queues:
+            priority = "standard"
+        if self.queued >= self.max_queue:
+            self.counters["rejected"] += 1
+            raise QueueFullError(f"Submission queue is full ({self.max_queue} tasks)")
+
+        submission = Submission(
+            local_id=f"{LOCAL_ID_PREFIX}{uuid.uuid4().hex}",
+            tenant=tenant,
+            priority=priority,
+            payload=payload,
+            enqueued_at=time.monotonic()
+        )
+        if self.store is not None:
+            try:
+                await self.store.save_submission({
+                    "id": submission.local_id,
+                    "tenant": tenant,
+                    "priority": priority,
+                    "payload": payload,
+                    "status": "queued",
+                    "created_at": submission.created_at
+                })
+                submission.persisted = True
+            except Exception as e:
+                # Still queued in memory; only lost if this worker stops first
+                logger.warning("Task store insert failed - local_id: %s, error: %s", submission.local_id, e)
+
+        self._push(submission)
+        self.counters["submitted"] += 1
+        return self.as_result(submission)
+
+    async def recover(self) -> int:
+        """Queue the task store's undispatched submissions again, e.g. after a restart; returns how many"""
+        if self.store is None:
+            return 0
+        try:
+            records = await self.store.queued_submissions(self.max_queue)
+        except Exception as e:
+            logger.warning("Queued submission recovery failed: %s", e)
+            return 0
+        now = time.time()
+        recovered = 0
+        for record in records:
+            if record["id"] in self._submissions:
+                continue
+            self._push(Submission(
+                local_id=record["id"],
+                tenant=record["tenant"],
+                priority=record["priority"] if record["priority"] in self._queues else "standard",
+                payload=record["payload"],
+                # Wait metrics count the time spent queued before the restart too
+                enqueued_at=time.monotonic() - max(0.0, now - record["created_at"]),
+                created_at=record["created_at"],
+                persisted=True
+            ))
+            recovered += 1
+        if recovered:
+            self.counters["recovered"] += recovered
+            logger.info("Recovered queued submissions from the task store - count: %s", recovered)
+        return recovered
+
+    def _push(self, submission: Submission) -> None:
+        priority, tenant = submission.priority, submission.tenant
+        # Start-time fair queuing: each tenant's tag advances by 1/weight per submission
+        weight = max(self.tenant_weights.get(tenant, 1.0), 0.01)
+        start = max(self._virtual_time[priority], self._last_finish.get((priority, tenant), 0.0))
+        finish = start + 1.0 / weight
+        self._last_finish[(priority, tenant)] = finish
+        self._seq += 1
+        heapq.heappush(self._queues[priority], _QueueEntry(finish, self._seq, submission))
+
+        self._remember(submission)
+        ADMISSION_QUEUE_DEPTH.labels(priority=priority).inc()
+        self._wakeup.set()
+
+    def _remember(self, submission: Submission) -> None:
+        self._submissions[submission.local_id] = submission
+        while len(self._submissions) > self.max_tracked:
+            oldest_id, oldest = next(iter(self._submissions.items()))
+            if oldest.status == "queued":
+                break
+            del self._submissions[oldest_id]
+
+    def get(self, local_id: str) -> Optional[Submission]:
+        return self._submissions.get(local_id)
+
+    async def find(self, local_id: str) -> Optional[Submission]:
+        """A submission of this worker, else one recorded in the task store (any worker), or None"""
+        submission = self._submissions.get(local_id)
+        if submission is not None or self.store is None:
+            return submission
+        try:
+            record = await self.store.get_submission(local_id)
+        except Exception as e:
+            logger.warning("Task store lookup failed - local_id: %s, error: %s", local_id, e)
+            return None
+        if record is None:
+            return None
+        return Submission(
+            local_id=record["id"],
+            tenant=record["tenant"],
+            priority=record["priority"],
+            payload={},
+            enqueued_at=0.0,
+            created_at=record["created_at"],
+            # Claimed by a worker but not sent yet
+            status="queued" if record["status"] == "dispatching" else record["status"],
+            upstream_id=record["upstream_id"],
+            error=record["error"],
+            persisted=True
+        )
+
+    async def wait_settled(self, local_id: str, timeout: float) -> bool:
+        """Wait up to timeout seconds for a queued submission to be dispatched or fail"""
+        submission = self._submissions.get(local_id)
+        if submission is None:
+            # Queued by another worker: watch its record
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + timeout
+            while loop.time() < deadline:
+                await asyncio.sleep(min(SETTLE_POLL_SECONDS, deadline - loop.time()))
+                found = await self.find(local_id)
+                if found is None or found.status != "queued":
+                    return found is not None
+            return False
+        try:
+            await asyncio.wait_for(submission.settled.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def as_result(self, submission: Submission) -> Dict[str, Any]:
+        result = {"id": submission.local_id, "status": submission.status, "priority": submission.priority}
+        if submission.status == "queued" and self._submissions.get(submission.local_id) is submission:
+            # Only known for this worker's own queue
+            result["queue_position"] = self._position(submission)
+        if submission.error:
+            result["error"] = {"message": submission.error}
+        return result
+
+    def _position(self, submission: Submission) -> int:
+        position = 0
+        for priority in PRIORITY_CLASSES:
+            queue = self._queues[priority]
+            if priority == submission.priority:
+                mine = next((e for e in queue if e.submission is submission), None)
+                if mine is None:
+                    return position
+                return position + sum(1 for e in queue if e < mine) + 1
+            position += len(queue)
+        return position
+
+    def task_finished(self, upstream_id: str) -> None:
+        """Release the slot held by a task that reached a terminal state"""
+        if self._active.pop(upstream_id, None) is not None:
+            ADMISSION_ACTIVE_TASKS.set(len(self._active))
+            self._wakeup.set()
+
+    def _expire_active(self) -> None:
+        cutoff = time.monotonic() - self.active_timeout
+        for upstream_id in [k for k, v in self._active.items() if v < cutoff]:
+            logger.warning("Releasing admission slot of untracked task - task_id: %s", upstream_id)
+            del self._active[upstream_id]
+        ADMISSION_ACTIVE_TASKS.set(len(self._active))
+
+    def _next(self) -> Optional[Submission]:
+        for priority in PRIORITY_CLASSES:
+            queue = self._queues[priority]
+            if queue:
+                entry = heapq.heappop(queue)
+                self._virtual_time[priority] = entry.finish_tag
+                ADMISSION_QUEUE_DEPTH.labels(priority=priority).dec()
+                return entry.submission
+        return None
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            self._expire_active()
+            while len(self._active) + self._dispatching < self.max_active:
+                submission = self._next()
+                if submission is None:
+                    break
+                self._dispatching += 1
+                task = asyncio.create_task(self._dispatch(submission))
+                self._dispatches.add(task)
+                task.add_done_callback(self._dispatches.discard)
+            try:
+                async with asyncio.timeout(5.0):
+                    await self._wakeup.wait()
+            except TimeoutError:
+                pass
+
+    async def _claim(self, submission: Submission) -> bool:
+        """Take a persisted submission for dispatch; False if another worker already did"""
+        if not submission.persisted:
+            return True
+        try:
+            return await self.store.claim_submission(submission.local_id)
+        except Exception as e:
+            # Sending it anyway beats leaving it queued forever
+            logger.warning("Task store claim failed - local_id: %s, error: %s", submission.local_id, e)
+            return True
+
+    async def _settle(self, submission: Submission) -> None:
+        if not submission.persisted:
+            return
+        try:
+            await self.store.settle_submission(
+                submission.local_id, submission.status, submission.upstream_id, submission.error, self.retention
+            )
+        except Exception as e:
+            logger.warning("Task store update failed - local_id: %s, error: %s", submission.local_id, e)
+
+    async def _dispatch(self, submission: Submission) -> None:
+        if not await self._claim(submission):
+            # Recovered by several workers; whoever claimed it reports its outcome
+            self.counters["claimed_elsewhere"] += 1
+            self._submissions.pop(submission.local_id, None)
+            submission.settled.set()
+            self._dispatching -= 1
+            self._wakeup.set()
+            return
+        waited = time.monotonic() - submission.enqueued_at
+        ADMISSION_WAIT_SECONDS.labels(priority=submission.priority).observe(waited)
+        try:
+            result = await self.dispatch(submission.payload)
+            submission.upstream_id = result.get("id")
+            submission.status = "dispatched"
+            submission.dispatched_at = time.monotonic()
+            if submission.upstream_id and result.get("status") not in TERMINAL_STATUSES:
+                self._active[submission.upstream_id] = submission.dispatched_at
+                ADMISSION_ACTIVE_TASKS.set(len(self._active))
+            self.counters["dispatched"] += 1
+            logger.info(
+                "Queued task dispatched - local_id: %s, task_id: %s, waited: %.2fs",
+                submission.local_id, submission.upstream_id, waited
+            )
+        except Exception as e:
+            submission.status = "failed"
+            submission.error = str(e)
+            self.counters["dispatch_failed"] += 1
+            logger.error("Queued task dispatch failed - local_id: %s, error: %s", submission.local_id, e)
+        except asyncio.CancelledError:
+            # Shutdown drain timed out: upstream may or may not have the task, so never resend it
+            submission.status = "failed"
+            submission.error = "Dispatch interrupted by shutdown"
+            raise
+        finally:
+            await self._settle(submission)
+            # Drop the request body; only the id mapping is needed from now on
+            submission.payload = {}
+            submission.settled.set()
+            self._dispatching -= 1
+            self._wakeup.set()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "queued": {p: len(q) for p, q in self._queues.items()},
+            "active": len(self._active),
+            "dispatching": self._dispatching
+        }
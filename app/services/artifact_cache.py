@@ -0,0 +1,135 @@
+import os
+import asyncio
+import hashlib
+import logging
+from typing import Dict, Any, Callable, Awaitable, Tuple, Union
+
+
+logger = logging.getLogger(__name__)
+
+
+def evict_lru(directory: str, max_bytes: int, suffixes: Union[str, Tuple[str, ...]]) -> int:
+    """
+    Remove the least recently used files ending in suffixes (mtime order)
+    until directory holds at most max_bytes of them; returns files removed
+
+    Blocking, call from a thread. The most recent file is kept even if it
+    alone exceeds the budget.
+    """
+    entries = []
+    total = 0
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                if not entry.name.endswith(suffixes):
+                    continue
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+    except FileNotFoundError:
+        return 0
+
+    removed = 0
+    entries.sort()
+    for _, size, path in entries[:-1]:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+class ArtifactCache:
+    """
+    Size-bounded on-disk LRU cache for generated video files
+
+    Files are written in chunks to a temporary name and renamed into place
+    once complete, so readers never see partial files. Access time is tracked
+    through the file mtime, and the least recently used files are removed
+    once the total size exceeds max_bytes. Concurrent first requests for the
+    same key share a single download.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._downloads: Dict[str, asyncio.Future] = {}
+        self.counters = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "bytes_downloaded": 0}
+
+    def path_for(self, key: str) -> str:
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.directory, f"{digest}.mp4")
+
+    def _touch(self, path: str) -> bool:
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    async def get_or_download(
+        self,
+        key: str,
+        download: Callable[[str], Awaitable[int]]
+    ) -> str:
+        """
+        Return the cached file path for key, downloading it on first access
+
+        Args:
+            key: Cache key (e.g. task id)
+            download: Coroutine function that writes the file to the given
+                temporary path and returns the number of bytes written
+
+        Returns:
+            Path of the complete cached file
+        """
+        path = self.path_for(key)
+        if await asyncio.to_thread(self._touch, path):
+            self.counters["hits"] += 1
+            return path
+
+        future = self._downloads.get(key)
+        if future is not None:
+            self.counters["coalesced"] += 1
+            return await asyncio.shield(future)
+
+        self.counters["misses"] += 1
+        future = asyncio.ensure_future(self._download(key, path, download))
+        self._downloads[key] = future
+        future.add_done_callback(lambda f: self._downloads.pop(key, None))
+        return await asyncio.shield(future)
+
+    def remove(self, key: str) -> bool:
+        """Delete key's cached file, if any; blocking, call from a thread"""
+        try:
+            os.remove(self.path_for(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    async def _download(self, key: str, path: str, download: Callable[[str], Awaitable[int]]) -> str:
+        await asyncio.to_thread(os.makedirs, self.directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.part"
+        try:
+            size = await download(tmp_path)
+            await asyncio.to_thread(os.replace, tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        self.counters["bytes_downloaded"] += size
+        logger.info("Video cached - key: %s, bytes: %s", key, size)
+        await asyncio.to_thread(self._evict)
+        return path
+
+    def _evict(self) -> None:
+        self.counters["evictions"] += evict_lru(self.directory, self.max_bytes, ".mp4")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.counters, "downloading": len(self._downloads)}
@@ -0,0 +1,168 @@
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Callable, Awaitable, Tuple
+
+from app.services.shared_state import SharedState
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds another worker's in-progress submission holds its key, and between checks on it
+RESERVATION_SECONDS = 60.0
+RESERVATION_POLL_SECONDS = 0.2
+
+
+class DuplicateRequestMismatch(Exception):
+    """An idempotency key was reused with a different request body"""
+    pass
+
+
+def fingerprint_request(content: List[Dict[str, Any]], **params: Any) -> str:
+    """
+    Stable hash of a create request
+
+    Text items are whitespace-normalized so trivially different retries of
+    the same prompt map to the same fingerprint.
+    """
+    normalized = []
+    for item in content:
+        if item.get("type") == "text":
+            normalized.append({"type": "text", "text": " ".join(item.get("text", "").split())})
+        else:
+            normalized.append(item)
+    payload = json.dumps({"content": normalized, **params}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def idempotency_scope(tenant: Optional[str], key: str) -> str:
+    """Deduplication key for a client Idempotency-Key, private to its tenant (API key, hashed)"""
+    owner = hashlib.sha256(tenant.encode()).hexdigest()[:16] if tenant else "-"
+    return f"idempotency:{owner}:{key}"
+
+
+class SubmissionDeduper:
+    """
+    Bounded cache of recent task submissions
+
+    run() returns the stored result for a key seen within its TTL instead of
+    calling submit again; concurrent submissions with the same key share a
+    single call. Failed submissions are not remembered, so retries proceed.
+
+    With shared (Redis) state, entries are also kept there: a key submitted
+    through one worker is recognised by all of them, and a worker waits for
+    another's in-progress submission of the key instead of repeating it.
+    """
+
+    def __init__(self, max_entries: int, shared: Optional[SharedState] = None):
+        self.max_entries = max_entries
+        self.shared = shared if shared is not None and shared.shared else None
+        self._entries: "OrderedDict[str, Tuple[float, str, Dict[str, Any]]]" = OrderedDict()
+        self._inflight: Dict[str, Tuple[str, asyncio.Future]] = {}
+        self.counters = {"saved_upstream_calls": 0, "stored": 0, "evictions": 0, "shared_hits": 0}
+
+    def _lookup(self, key: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, fingerprint, result = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return fingerprint, result
+
+    def _store(self, key: str, fingerprint: str, result: Dict[str, Any], ttl: float) -> None:
+        self._entries[key] = (time.monotonic() + ttl, fingerprint, result)
+        self._entries.move_to_end(key)
+        self.counters["stored"] += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    async def run(
+        self,
+        key: str,
+        fingerprint: str,
+        ttl: float,
+        submit: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """
+        Submit once per key within ttl seconds
+
+        Args:
+            key: Deduplication key (idempotency key or content hash)
+            fingerprint: Hash of the request body, checked for key reuse
+            ttl: Seconds to remember a successful submission
+            submit: Coroutine function performing the upstream create
+
+        Returns:
+            The (possibly shared) submission result
+
+        Raises:
+            DuplicateRequestMismatch: key already used with another body
+        """
+        found = self._lookup(key)
+        if found is not None:
+            if found[0] != fingerprint:
+                raise DuplicateRequestMismatch("Idempotency-Key was already used with a different request")
+            self.counters["saved_upstream_calls"] += 1
+            logger.info("Duplicate submission served from cache - task_id: %s", found[1].get('id'))
+            return found[1]
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            if inflight[0] != fingerprint:
+                raise DuplicateRequestMismatch("Idempotency-Key was already used with a different request")
+            self.counters["saved_upstream_calls"] += 1
+            return await asyncio.shield(inflight[1])
+
+        future = asyncio.ensure_future(self._submit_shared(key, fingerprint, ttl, submit))
+        self._inflight[key] = (fingerprint, future)
+        future.add_done_callback(lambda f: self._on_submitted(key, fingerprint, ttl, f))
+        # Shield so a disconnecting client cannot cancel a create others are waiting on
+        return await asyncio.shield(future)
+
+    async def _submit_shared(
+        self,
+        key: str,
+        fingerprint: str,
+        ttl: float,
+        submit: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """Submit unless another worker already did (or is doing) so for the key"""
+        if self.shared is None:
+            return await submit()
+        while True:
+            entry = await self.shared.get_submission(key)
+            if entry is not None:
+                if entry["fingerprint"] != fingerprint:
+                    raise DuplicateRequestMismatch("Idempotency-Key was already used with a different request")
+                if entry["result"] is not None:
+                    self.counters["saved_upstream_calls"] += 1
+                    self.counters["shared_hits"] += 1
+                    logger.info("Duplicate submission served from shared state - task_id: %s", entry["result"].get("id"))
+                    return entry["result"]
+                # Being submitted by another worker; its reservation expires if that worker dies
+                await asyncio.sleep(RESERVATION_POLL_SECONDS)
+                continue
+            if await self.shared.reserve_submission(key, fingerprint, RESERVATION_SECONDS):
+                break
+        try:
+            result = await submit()
+        except BaseException:
+            await asyncio.shield(self.shared.release_submission(key))
+            raise
+        await self.shared.put_submission(key, fingerprint, result, ttl)
+        return result
+
+    def _on_submitted(self, key: str, fingerprint: str, ttl: float, future: asyncio.Future) -> None:
+        self._inflight.pop(key, None)
+        if not future.cancelled() and future.exception() is None:
+            self._store(key, fingerprint, future.result(), ttl)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.counters, "entries": len(self._entries), "inflight": len(self._inflight)}
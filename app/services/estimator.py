@@ -0,0 +1,106 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Tuple
+
+from app.services.providers import VideoProvider, GenerationOptions
+
+
+# Observations needed before the fitted line (rather than the mean rate) is trusted
+MIN_FIT_SAMPLES = 5.0
+
+
+class _DecayedFit:
+    """Exponentially weighted least squares fit of seconds = a + b * duration"""
+
+    def __init__(self):
+        self.weight = 0.0
+        self.sx = self.sy = self.sxx = self.sxy = 0.0
+        self.samples = 0
+
+    def add(self, x: float, y: float, decay: float) -> None:
+        self.weight = self.weight * decay + 1.0
+        self.sx = self.sx * decay + x
+        self.sy = self.sy * decay + y
+        self.sxx = self.sxx * decay + x * x
+        self.sxy = self.sxy * decay + x * y
+        self.samples += 1
+
+    def predict(self, x: float) -> float:
+        mean_x, mean_y = self.sx / self.weight, self.sy / self.weight
+        variance = self.sxx / self.weight - mean_x * mean_x
+        if self.weight >= MIN_FIT_SAMPLES and variance > 0.25:
+            slope = (self.sxy / self.weight - mean_x * mean_y) / variance
+            if slope >= 0:
+                return max(mean_y + slope * (x - mean_x), 0.0)
+        # One duration seen so far (or a noisy negative slope): scale the mean rate
+        return mean_y / mean_x * x if mean_x > 0 else mean_y
+
+
+class CompletionEstimator:
+    """
+    Expected completion time and cost of a task at submit time
+
+    Learns how long succeeded tasks took (upstream created_at to finish,
+    falling back to time since submission) per provider and resolution, as
+    a line over the requested duration fitted by exponentially weighted
+    least squares, so recent upstream speed counts most. Until a provider
+    and resolution has been observed, default_seconds_per_second * duration
+    is assumed. Each worker learns from the tasks it submitted.
+    """
+
+    def __init__(self, default_seconds_per_second: float, decay: float, max_pending: int = 10000):
+        self.default_seconds_per_second = default_seconds_per_second
+        self.decay = decay
+        self.max_pending = max_pending
+        self._fits: Dict[Tuple[str, str], _DecayedFit] = {}
+        # task_id -> (fit key, duration, submitted at) until the task finishes
+        self._pending: "OrderedDict[str, tuple]" = OrderedDict()
+        self.observed = 0
+
+    @staticmethod
+    def _key(provider: str, options: GenerationOptions) -> Tuple[str, str]:
+        return provider, options.resolution or "default"
+
+    def estimate(self, provider: VideoProvider, options: GenerationOptions) -> Dict[str, Any]:
+        """Expected latency and cost for a task with resolved options on provider"""
+        duration = options.duration or 0
+        fit = self._fits.get(self._key(provider.name, options))
+        if fit is not None:
+            latency = fit.predict(duration)
+        else:
+            latency = self.default_seconds_per_second * duration
+        return {
+            "provider": provider.name,
+            "duration": duration,
+            "resolution": options.resolution,
+            "latency_seconds": round(latency, 1),
+            "cost": round(provider.cost(options), 4),
+            "samples": fit.samples if fit is not None else 0
+        }
+
+    def task_submitted(self, task_id: str, provider: str, options: GenerationOptions) -> None:
+        self._pending[task_id] = (self._key(provider, options), options.duration or 0, time.time())
+        while len(self._pending) > self.max_pending:
+            self._pending.popitem(last=False)
+
+    def task_finished(self, task_id: str, result: Dict[str, Any]) -> None:
+        """Terminal result seen: learn from it if it succeeded"""
+        pending = self._pending.pop(task_id, None)
+        if pending is None or result.get("status") != "succeeded":
+            return
+        key, duration, submitted_at = pending
+        created_at, updated_at = result.get("created_at"), result.get("updated_at")
+        if isinstance(created_at, (int, float)) and isinstance(updated_at, (int, float)) and updated_at > created_at:
+            seconds = updated_at - created_at
+        else:
+            seconds = time.time() - submitted_at
+        self._fits.setdefault(key, _DecayedFit()).add(duration, seconds, self.decay)
+        self.observed += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "observed": self.observed,
+            "pending": len(self._pending),
+            **{f"{provider}_{resolution}_seconds_per_10s": round(fit.predict(10), 1)
+               for (provider, resolution), fit in self._fits.items()}
+        }
@@ -0,0 +1,127 @@
+import asyncio
+from collections import deque
+from typing import Optional, Dict, Any, Callable, Awaitable, TypeVar
+
+from app.utils.deadline import remaining
+
+
+T = TypeVar("T")
+
+# Latency samples kept, and observations between percentile recomputations
+LATENCY_WINDOW = 1000
+RECOMPUTE_EVERY = 50
+
+
+class LatencyTracker:
+    """Sliding window of recent call latencies with a cached percentile"""
+
+    def __init__(self, percentile: float, window: int = LATENCY_WINDOW):
+        self.percentile = percentile
+        self._samples: deque = deque(maxlen=window)
+        self._value: Optional[float] = None
+        self._stale = 0
+
+    def observe(self, seconds: float) -> None:
+        self._samples.append(seconds)
+        self._stale += 1
+        if self._stale >= RECOMPUTE_EVERY:
+            self._value = None
+
+    @property
+    def count(self) -> int:
+        return len(self._samples)
+
+    def value(self) -> Optional[float]:
+        if not self._samples:
+            return None
+        if self._value is None:
+            ordered = sorted(self._samples)
+            self._value = ordered[min(int(len(ordered) * self.percentile), len(ordered) - 1)]
+            self._stale = 0
+        return self._value
+
+
+class Hedger:
+    """
+    Hedged requests for idempotent upstream reads
+
+    When a call has not answered after the observed latency percentile
+    (at least min_delay), a second identical call is started and the first
+    success wins; the other is cancelled. Hedges are paid for from a budget
+    earned at budget_ratio per call (capped at burst), so they never add
+    more than that fraction of extra load, and none are sent until
+    min_samples latencies have been observed or when the request deadline
+    leaves no time for one.
+    """
+
+    def __init__(self, percentile: float, min_delay: float, budget_ratio: float, min_samples: int, burst: float = 10.0):
+        self.latency = LatencyTracker(percentile)
+        self.min_delay = min_delay
+        self.budget_ratio = budget_ratio
+        self.min_samples = min_samples
+        self.burst = burst
+        self._credits = 0.0
+        self.counters = {"calls": 0, "hedged": 0, "hedge_wins": 0, "budget_denied": 0}
+
+    def observe(self, seconds: float) -> None:
+        """Record the latency of one successful upstream call"""
+        self.latency.observe(seconds)
+
+    def delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None while too few calls were observed"""
+        if self.latency.count < self.min_samples:
+            return None
+        return max(self.min_delay, self.latency.value())
+
+    async def run(self, call: Callable[[], Awaitable[T]]) -> T:
+        self.counters["calls"] += 1
+        self._credits = min(self.burst, self._credits + self.budget_ratio)
+        delay = self.delay()
+        if delay is None:
+            return await call()
+
+        primary = asyncio.ensure_future(call())
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return primary.result()
+            left = remaining()
+            if left is not None and left <= 0:
+                return await primary
+            if self._credits < 1.0:
+                self.counters["budget_denied"] += 1
+                return await primary
+            self._credits -= 1.0
+            self.counters["hedged"] += 1
+            hedge = asyncio.ensure_future(call())
+            tasks.add(hedge)
+
+            error: Optional[BaseException] = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = None
+                for task in done:
+                    if task.exception() is None:
+                        winner = task
+                    else:
+                        # A failure: the other call may still answer
+                        error = task.exception()
+                if winner is not None:
+                    if winner is hedge:
+                        self.counters["hedge_wins"] += 1
+                    return winner.result()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def get_stats(self) -> Dict[str, Any]:
+        value = self.latency.value()
+        return {
+            **self.counters,
+            "delay_ms": round(max(self.min_delay, value) * 1000, 1) if value is not None else 0,
+            "budget": round(self._credits, 2)
+        }
@@ -0,0 +1,238 @@
+import io
+import os
+import base64
+import asyncio
+import hashlib
+import logging
+from typing import Optional, Dict, Any, Tuple, TYPE_CHECKING
+
+import httpx
+
+from app.services.artifact_cache import evict_lru
+
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+    from PIL import Image
+
+
+logger = logging.getLogger(__name__)
+
+SORA_RESOLUTIONS = {
+    "landscape_720p": (1280, 720),
+    "portrait_720p": (720, 1280),
+    "landscape_1080p": (1792, 1024),
+    "portrait_1080p": (1024, 1792),
+}
+
+MIME_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+
+
+class ImageProcessingError(Exception):
+    """Reference image could not be fetched or decoded"""
+    pass
+
+
+async def fetch_image(client: httpx.AsyncClient, url: str, max_bytes: int) -> Tuple[bytes, Optional[str]]:
+    """
+    Download an image, giving up as soon as it grows past max_bytes
+
+    Returns:
+        The image bytes and the response's Content-Type, if any
+
+    Raises:
+        ImageProcessingError: Fetch failed or image too large
+    """
+    try:
+        async with client.stream("GET", url) as response:
+            response.raise_for_status()
+            chunks = []
+            size = 0
+            async for chunk in response.aiter_bytes():
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ImageProcessingError(f"image_url exceeds {max_bytes} bytes")
+                chunks.append(chunk)
+            return b"".join(chunks), response.headers.get("Content-Type")
+    except httpx.HTTPError as e:
+        raise ImageProcessingError(f"Failed to fetch image_url: {str(e)}")
+
+
+def normalize_mode(img: "Image.Image", image_format: str) -> "Image.Image":
+    """
+    Convert img to RGB, or RGBA when it has transparency and image_format
+    keeps it (PNG, WEBP), so padding and every encoder accept it
+    """
+    has_alpha = "A" in img.getbands() or "transparency" in img.info
+    target = "RGBA" if has_alpha and image_format in ("PNG", "WEBP") else "RGB"
+    if img.mode == target:
+        return img
+    if img.mode.startswith("I"):
+        # 16/32-bit samples: scale to 8 bits instead of clipping everything above 255 to white
+        img = img.convert("I").point(lambda v: v / 256).convert("L")
+    return img.convert(target)
+
+
+def process_image(
+    data: bytes,
+    target_size: Tuple[int, int],
+    mode: str,
+    image_format: str,
+    quality: int
+) -> bytes:
+    """
+    Fit an encoded image to target_size and re-encode it
+
+    Runs in a worker process. mode "pad" letterboxes to exactly target_size
+    (like preprocess_image_for_sora); mode "resize" only scales down to fit
+    within target_size, keeping the aspect ratio.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as img:
+        img = ImageOps.exif_transpose(img)
+        img = normalize_mode(img, image_format)
+
+        if mode == "pad":
+            processed = ImageOps.pad(img, target_size, color=(0, 0, 0))
+        else:
+            processed = img.copy()
+            processed.thumbnail(target_size)
+
+        out = io.BytesIO()
+        if image_format == "PNG":
+            processed.save(out, format="PNG", compress_level=3)
+        else:
+            processed.save(out, format=image_format, quality=quality)
+        return out.getvalue()
+
+
+class ImagePreprocessor:
+    """
+    Fetches first-frame images and normalizes them for generation
+
+    Images are fitted to the frame size of the task they are sent with,
+    falling back to target_resolution when the task leaves it open. Pillow
+    work runs in a process pool so it never blocks the event loop. Results
+    are cached on disk by content hash plus processing options, so a
+    reference frame is processed once per size no matter which URL it came
+    from; the least recently used files are removed beyond cache_max_bytes.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        target_resolution: str,
+        mode: str,
+        image_format: str,
+        quality: int,
+        max_bytes: int,
+        workers: int,
+        cache_max_bytes: int
+    ):
+        if target_resolution not in SORA_RESOLUTIONS:
+            raise ValueError(f"Unknown image target resolution: {target_resolution}")
+        if image_format.upper() not in MIME_TYPES:
+            raise ValueError(f"Unknown image format: {image_format} (expected one of {', '.join(MIME_TYPES)})")
+        self.cache_dir = cache_dir
+        self.cache_max_bytes = cache_max_bytes
+        self.target_size = SORA_RESOLUTIONS[target_resolution]
+        self.mode = mode
+        self.image_format = image_format.upper()
+        self.quality = quality
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self._pool: Optional["ProcessPoolExecutor"] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.counters = {"processed": 0, "cache_hits": 0, "coalesced": 0, "evictions": 0}
+
+    def _get_pool(self) -> "ProcessPoolExecutor":
+        if self._pool is None:
+            # Imported here: multiprocessing is only needed once an image is processed
+            from concurrent.futures import ProcessPoolExecutor
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def to_data_url(
+        self,
+        client: httpx.AsyncClient,
+        url: str,
+        target_size: Optional[Tuple[int, int]] = None
+    ) -> str:
+        """
+        Fetch url and return the processed image as a base64 data URL
+
+        Args:
+            client: HTTP client for the fetch
+            url: Image URL
+            target_size: Frame size of the video (width, height); None uses target_resolution
+
+        Raises:
+            ImageProcessingError: Fetch failed, image too large or undecodable
+        """
+        target_size = tuple(target_size) if target_size else self.target_size
+        data = await self._fetch(client, url)
+        key = hashlib.sha256(
+            data + f"|{target_size}|{self.mode}|{self.image_format}|{self.quality}".encode()
+        ).hexdigest()
+        path = os.path.join(self.cache_dir, f"{key}.{self.image_format.lower()}")
+
+        future = self._inflight.get(key)
+        if future is not None:
+            self.counters["coalesced"] += 1
+        else:
+            future = asyncio.ensure_future(self._process_cached(data, path, target_size))
+            self._inflight[key] = future
+            future.add_done_callback(lambda f: self._inflight.pop(key, None))
+        processed = await asyncio.shield(future)
+
+        encoded = base64.b64encode(processed).decode()
+        return f"data:{MIME_TYPES[self.image_format]};base64,{encoded}"
+
+    async def _fetch(self, client: httpx.AsyncClient, url: str) -> bytes:
+        data, _ = await fetch_image(client, url, self.max_bytes)
+        return data
+
+    async def _process_cached(self, data: bytes, path: str, target_size: Tuple[int, int]) -> bytes:
+        try:
+            cached = await asyncio.to_thread(self._read, path)
+        except FileNotFoundError:
+            cached = None
+        if cached is not None:
+            self.counters["cache_hits"] += 1
+            return cached
+
+        loop = asyncio.get_running_loop()
+        try:
+            processed = await loop.run_in_executor(
+                self._get_pool(), process_image,
+                data, target_size, self.mode, self.image_format, self.quality
+            )
+        except Exception as e:
+            raise ImageProcessingError(f"Failed to process image: {str(e)}")
+        self.counters["processed"] += 1
+        await asyncio.to_thread(self._write, path, processed)
+        return processed
+
+    def _read(self, path: str) -> bytes:
+        with open(path, "rb") as f:
+            data = f.read()
+        # The mtime is the last access for LRU eviction
+        os.utime(path)
+        return data
+
+    def _write(self, path: str, data: bytes) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.part"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        suffixes = tuple(f".{name.lower()}" for name in MIME_TYPES)
+        self.counters["evictions"] += evict_lru(self.cache_dir, self.cache_max_bytes, suffixes)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.counters, "inflight": len(self._inflight)}
@@ -0,0 +1,689 @@
+import time
+import base64
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Optional, Dict, Any, List, Callable, Tuple
+
+import httpx
+
+from app.services.upstream_guard import UpstreamGuard, CircuitOpenError
+from app.services.hedging import Hedger
+from app.services.image_preprocess import fetch_image
+from app.services.shared_state import SharedState
+from app.utils.metrics import (
+    UPSTREAM_REQUEST_DURATION, UPSTREAM_ERRORS, UPSTREAM_REQUESTS_IN_FLIGHT, classify_error
+)
+from app.utils.http import ssl_context
+from app.utils.trace import trace_upstream
+from app.utils.deadline import DeadlineExceeded, enforce_deadline, expired as deadline_expired
+
+
+logger = logging.getLogger(__name__)
+
+# Tasks stored before ids carried a provider prefix all came from Ark
+LEGACY_PROVIDER = "ark"
+
+# Pixels per frame; per-second prices are quoted at 720p and scale with these
+RESOLUTION_PIXELS = {"480p": 854 * 480, "720p": 1280 * 720, "1080p": 1920 * 1080}
+PRICE_RESOLUTION = "720p"
+# Short side in pixels of each resolution tier
+RESOLUTION_HEIGHTS = {"480p": 480, "720p": 720, "1080p": 1080}
+
+
+def make_task_id(provider: str, native_id: str) -> str:
+    """Unified task id exposed by the API: "<provider>:<provider task id>" """
+    return f"{provider}:{native_id}"
+
+
+@dataclass(frozen=True)
+class GenerationOptions:
+    """Per-task generation options; None leaves the choice to the provider's default"""
+    duration: Optional[int] = None
+    resolution: Optional[str] = None
+    ratio: Optional[str] = None
+    generate_audio: Optional[bool] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass(frozen=True)
+class ModelCapabilities:
+    """Option values a provider's model accepts"""
+    durations: Tuple[int, ...]
+    resolutions: Tuple[str, ...]
+    ratios: Tuple[str, ...]
+    generate_audio: Tuple[bool, ...]
+
+    def check(self, options: GenerationOptions) -> Optional[str]:
+        """Why the options cannot be used with this model, or None if they can"""
+        for name, supported in (
+            ("duration", self.durations),
+            ("resolution", self.resolutions),
+            ("ratio", self.ratios),
+            ("generate_audio", self.generate_audio),
+        ):
+            value = getattr(options, name)
+            if value is not None and value not in supported:
+                return f"{name} {value} is not supported, expected one of: {', '.join(map(str, supported))}"
+        return None
+
+    def preview(self, options: GenerationOptions, duration: int) -> GenerationOptions:
+        """Shortest, lowest resolution and silent variant of (resolved) options, for quick previews"""
+        return GenerationOptions(
+            duration=min(
+                min(self.durations, key=lambda d: abs(d - duration)),
+                options.duration or max(self.durations)
+            ),
+            resolution=min(self.resolutions, key=lambda r: RESOLUTION_PIXELS.get(r, 0)) if self.resolutions else None,
+            ratio=options.ratio,
+            generate_audio=False if False in self.generate_audio else options.generate_audio
+        )
+
+
+class VideoProvider(ABC):
+    """
+    A video generation backend
+
+    Subclasses translate create / fetch calls to one upstream API and return
+    results in the Ark task shape (id, status, content.video_url, created_at,
+    updated_at, error) that the rest of the service works with. Every call
+    goes through the provider's own UpstreamGuard.
+    """
+
+    name: str = ""
+
+    def __init__(
+        self,
+        model: str,
+        guard: UpstreamGuard,
+        cost_per_second: float,
+        media_client: Callable[[], httpx.AsyncClient],
+        chunk_size: int,
+        capabilities: ModelCapabilities,
+        defaults: GenerationOptions,
+        hedger: Optional[Hedger] = None
+    ):
+        self.model = model
+        self.guard = guard
+        self.hedger = hedger
+        self.cost_per_second = cost_per_second
+        self.capabilities = capabilities
+        self.defaults = defaults
+        self.media_client = media_client
+        self.chunk_size = chunk_size
+        self._http: Optional[httpx.AsyncClient] = None
+        self.http_stats = {"requests": 0, "connections_opened": 0}
+
+    @abstractmethod
+    def _build_http_client(self) -> httpx.AsyncClient:
+        pass
+
+    @abstractmethod
+    async def create(self, content: List[Dict[str, Any]], options: GenerationOptions) -> Dict[str, Any]:
+        """Create a task upstream with resolved options; returns the result with the provider task id"""
+        pass
+
+    def resolve(self, options: GenerationOptions) -> GenerationOptions:
+        """Fill options the request left open with this provider's defaults"""
+        return GenerationOptions(**{
+            name: value if value is not None else getattr(self.defaults, name)
+            for name, value in options.to_dict().items()
+        })
+
+    def frame_size(self, options: GenerationOptions) -> Optional[Tuple[int, int]]:
+        """Width and height of the video resolved options produce; None when they leave it to the model"""
+        short = RESOLUTION_HEIGHTS.get(options.resolution)
+        if short is None or not options.ratio or ":" not in options.ratio:
+            # e.g. "adaptive": the model follows the first frame
+            return None
+        width, height = (float(part) for part in options.ratio.split(":", 1))
+        # Even sizes, as video encoders require
+        long = round(short * max(width, height) / min(width, height) / 2) * 2
+        return (long, short) if width >= height else (short, long)
+
+    def cost(self, options: GenerationOptions) -> float:
+        """Expected price of a task with resolved options"""
+        scale = RESOLUTION_PIXELS.get(options.resolution, RESOLUTION_PIXELS[PRICE_RESOLUTION]) / RESOLUTION_PIXELS[PRICE_RESOLUTION]
+        return self.cost_per_second * (options.duration or 0) * scale
+
+    @abstractmethod
+    async def fetch(self, native_id: str) -> Dict[str, Any]:
+        """Fetch one task's current result"""
+        pass
+
+    async def fetch_many(self, native_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Fetch several tasks; ids missing from the result are retried one by one by the caller"""
+        results = await asyncio.gather(*(self.fetch(i) for i in native_ids), return_exceptions=True)
+        return {i: r for i, r in zip(native_ids, results) if not isinstance(r, BaseException)}
+
+    async def download(self, native_id: str, result: Dict[str, Any], path: str) -> int:
+        """Stream the task's video into path; returns bytes written"""
+        url = (result.get("content") or {}).get("video_url")
+        # Result files live on a CDN and must not get the provider key
+        return await self._stream_to_file(self.media_client(), url, path)
+
+    async def _stream_to_file(self, client: httpx.AsyncClient, url: str, path: str) -> int:
+        size = 0
+        async with client.stream("GET", url) as response:
+            response.raise_for_status()
+            # File I/O runs in worker threads: a slow disk must not stall the event loop
+            f = await asyncio.to_thread(open, path, "wb")
+            try:
+                async for chunk in response.aiter_bytes(self.chunk_size):
+                    await asyncio.to_thread(f.write, chunk)
+                    size += len(chunk)
+            finally:
+                await asyncio.to_thread(f.close)
+        return size
+
+    @property
+    def available(self) -> bool:
+        return self.guard.breaker.state != "open"
+
+    async def open(self) -> None:
+        if self._http is None:
+            self._http = self._build_http_client()
+
+    async def close(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+            logger.info("Upstream HTTP client closed - provider: %s, stats: %s", self.name, self.http_stats)
+
+    async def _trace(self, event_name: str, info: Dict[str, Any]) -> None:
+        # httpcore emits this only when a brand-new TCP connection is dialled,
+        # so requests - connections_opened is the number of reused connections.
+        if event_name == "connection.connect_tcp.complete":
+            self.http_stats["connections_opened"] += 1
+
+    async def _request(self, method: str, path: str, operation: str, hedge: bool = False, **kwargs) -> httpx.Response:
+        """
+        Send a request over the provider's shared client
+
+        Every call goes through the upstream guard (rate limit, adaptive
+        concurrency, circuit breaker); GETs are retried on transient errors.
+        operation labels the call in metrics (create, query, list, ...).
+        Reads are cut off at the request deadline, writes are only refused
+        once it has passed; with hedge (idempotent reads only) a slow call
+        is raced by a second one when the hedger allows.
+
+        Raises:
+            CircuitOpenError: Circuit breaker is open
+            DeadlineExceeded: Request deadline passed
+            httpx.HTTPError: Request failed after any retries
+        """
+        if self._http is None:
+            await self.open()
+
+        in_flight = UPSTREAM_REQUESTS_IN_FLIGHT.labels(provider=self.name, operation=operation)
+        duration = UPSTREAM_REQUEST_DURATION.labels(provider=self.name, operation=operation)
+        hedger = self.hedger if hedge else None
+
+        async def send() -> httpx.Response:
+            self.http_stats["requests"] += 1
+            in_flight.inc()
+            started = time.time()
+            start = time.perf_counter()
+            response = None
+            error = None
+            try:
+                if method == "GET":
+                    async with enforce_deadline():
+                        response = await self._http.request(
+                            method, path, extensions={"trace": self._trace}, **kwargs
+                        )
+                else:
+                    # Writes are not cut off once sent: the upstream may act on them regardless
+                    if deadline_expired():
+                        raise DeadlineExceeded()
+                    response = await self._http.request(
+                        method, path, extensions={"trace": self._trace}, **kwargs
+                    )
+                response.raise_for_status()
+                if hedger is not None:
+                    hedger.observe(time.perf_counter() - start)
+                return response
+            except Exception as e:
+                error = classify_error(e)
+                UPSTREAM_ERRORS.labels(provider=self.name, operation=operation, error_class=error).inc()
+                raise
+            finally:
+                in_flight.dec()
+                elapsed = time.perf_counter() - start
+                duration.observe(elapsed)
+                trace_upstream(
+                    self.name, operation, method, path, kwargs.get("params"), started, elapsed, response, error
+                )
+
+        try:
+            if hedger is not None:
+                return await hedger.run(lambda: self.guard.call(send, idempotent=True))
+            return await self.guard.call(send, idempotent=method == "GET")
+        except CircuitOpenError:
+            UPSTREAM_ERRORS.labels(provider=self.name, operation=operation, error_class="circuit_open").inc()
+            raise
+
+    def get_stats(self) -> Dict[str, Any]:
+        requests = self.http_stats["requests"]
+        opened = self.http_stats["connections_opened"]
+        return {
+            "requests": requests,
+            "connections_opened": opened,
+            "connections_reused": max(requests - opened, 0),
+            "reuse_ratio": round((requests - opened) / requests, 4) if requests else 0.0,
+            "guard": self.guard.get_stats(),
+            "hedging": self.hedger.get_stats() if self.hedger is not None else {}
+        }
+
+
+class ReconcilableProvider(VideoProvider):
+    """A provider whose upstream can list tasks by status and cancel queued ones (used by the reconciler)"""
+
+    @abstractmethod
+    async def list_page(
+        self,
+        page_num: int,
+        page_size: int,
+        status: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """One page of this provider's model's upstream tasks (native ids), optionally by status, and the total count"""
+        pass
+
+    @abstractmethod
+    async def cancel(self, native_id: str) -> None:
+        """Cancel a queued task upstream"""
+        pass
+
+
+class ArkProvider(ReconcilableProvider):
+    """ByteDance Ark content generation tasks (REST API)"""
+
+    name = "ark"
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str,
+        timeout: float,
+        connect_timeout: float,
+        max_connections: int,
+        max_keepalive_connections: int,
+        keepalive_expiry: float,
+        http2: bool,
+        **kwargs
+    ):
+        super().__init__(**kwargs)
+        self.base_url = base_url
+        self.api_key = api_key
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = http2
+
+    def _build_http_client(self) -> httpx.AsyncClient:
+        http2 = self.http2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("ARK_HTTP2 is enabled but the h2 package is not installed, falling back to HTTP/1.1")
+                http2 = False
+
+        logger.info(
+            "Upstream HTTP client opened - provider: ark, http2: %s, max_connections: %s",
+            http2, self.max_connections
+        )
+        return httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {self.api_key}"
+            },
+            timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry
+            ),
+            http2=http2,
+            verify=ssl_context(http2)
+        )
+
+    async def create(self, content: List[Dict[str, Any]], options: GenerationOptions) -> Dict[str, Any]:
+        # Talk to the REST endpoint directly: the Ark SDK client is synchronous
+        # and would block the event loop for the whole upstream round trip.
+        body = {
+            "model": self.model,
+            "content": content,
+            "duration": options.duration,
+            "generate_audio": options.generate_audio
+        }
+        # Left out unless requested, so the model's own defaults apply
+        if options.resolution:
+            body["resolution"] = options.resolution
+        if options.ratio:
+            body["ratio"] = options.ratio
+        response = await self._request("POST", "/contents/generations/tasks", "create", json=body)
+        return response.json()
+
+    async def fetch(self, native_id: str) -> Dict[str, Any]:
+        response = await self._request("GET", f"/contents/generations/tasks/{native_id}", "query", hedge=True)
+        return response.json()
+
+    async def fetch_many(self, native_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """One call to the Ark task-list endpoint"""
+        params = [("page_num", 1), ("page_size", len(native_ids))]
+        params.extend(("filter.task_ids", native_id) for native_id in native_ids)
+        response = await self._request("GET", "/contents/generations/tasks", "list", params=params)
+        items = response.json().get("items") or []
+        return {item["id"]: item for item in items if item.get("id")}
+
+    async def list_page(
+        self,
+        page_num: int,
+        page_size: int,
+        status: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        # Only this service's model: the API key may also run other models' tasks
+        params = [("page_num", page_num), ("page_size", page_size), ("filter.model", self.model)]
+        if status:
+            params.append(("filter.status", status))
+        response = await self._request("GET", "/contents/generations/tasks", "list", params=params)
+        body = response.json()
+        return body.get("items") or [], body.get("total") or 0
+
+    async def cancel(self, native_id: str) -> None:
+        # Ark only cancels queued tasks; running ones are rejected with a 4xx
+        await self._request("DELETE", f"/contents/generations/tasks/{native_id}", "cancel")
+
+
+class OpenAIProvider(VideoProvider):
+    """OpenAI Sora video API (POST /videos, GET /videos/{id}, GET /videos/{id}/content)"""
+
+    name = "openai"
+
+    # OpenAI video statuses mapped to the Ark names used everywhere else
+    STATUS_MAP = {"queued": "queued", "in_progress": "running", "completed": "succeeded", "failed": "failed"}
+    SECONDS = (4, 8, 12)
+    # (resolution, ratio) -> size; the larger sizes are only offered by the pro models
+    SIZES = {
+        ("720p", "16:9"): "1280x720",
+        ("720p", "9:16"): "720x1280",
+        ("1080p", "16:9"): "1792x1024",
+        ("1080p", "9:16"): "1024x1792",
+    }
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str,
+        size: str,
+        timeout: float,
+        default_duration: int,
+        max_image_bytes: int,
+        **kwargs
+    ):
+        resolution, ratio = next((key for key, value in self.SIZES.items() if value == size), (None, None))
+        pro = kwargs["model"].endswith("-pro")
+        super().__init__(
+            # Sora always generates audio and only accepts a few clip lengths and sizes
+            capabilities=ModelCapabilities(
+                durations=self.SECONDS,
+                resolutions=("720p", "1080p") if pro else ("720p",),
+                ratios=("16:9", "9:16"),
+                generate_audio=(True,)
+            ),
+            defaults=GenerationOptions(
+                duration=min(self.SECONDS, key=lambda s: abs(s - default_duration)),
+                resolution=resolution,
+                ratio=ratio,
+                generate_audio=True
+            ),
+            **kwargs
+        )
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.size = size
+        self.timeout = timeout
+        self.max_image_bytes = max_image_bytes
+
+    def frame_size(self, options: GenerationOptions) -> Optional[Tuple[int, int]]:
+        width, height = self.SIZES.get((options.resolution, options.ratio), self.size).split("x")
+        return int(width), int(height)
+
+    def _build_http_client(self) -> httpx.AsyncClient:
+        logger.info("Upstream HTTP client opened - provider: openai")
+        return httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={"Authorization": f"Bearer {self.api_key}"},
+            timeout=httpx.Timeout(self.timeout),
+            verify=ssl_context()
+        )
+
+    def _normalize(self, raw: Dict[str, Any]) -> Dict[str, Any]:
+        status = self.STATUS_MAP.get(raw.get("status"), raw.get("status"))
+        result = {
+            "id": raw.get("id"),
+            "model": raw.get("model", self.model),
+            "status": status,
+            "progress": raw.get("progress"),
+            "created_at": raw.get("created_at"),
+            "updated_at": raw.get("completed_at") or raw.get("created_at")
+        }
+        if status == "succeeded":
+            result["content"] = {"video_url": f"{self.base_url}/videos/{raw.get('id')}/content"}
+        if raw.get("error"):
+            result["error"] = raw["error"]
+        return result
+
+    async def create(self, content: List[Dict[str, Any]], options: GenerationOptions) -> Dict[str, Any]:
+        data = {
+            "model": self.model,
+            "prompt": next((item.get("text") for item in content if item.get("type") == "text"), ""),
+            "seconds": str(options.duration),
+            "size": self.SIZES.get((options.resolution, options.ratio), self.size)
+        }
+        image_url = next(
+            (item.get("image_url", {}).get("url") for item in content if item.get("type") == "image_url"),
+            None
+        )
+        if image_url:
+            image, mime_type = await self._load_image(image_url)
+            extension = mime_type.split("/")[-1]
+            response = await self._request(
+                "POST", "/videos", "create",
+                data=data, files={"input_reference": (f"reference.{extension}", image, mime_type)}
+            )
+        else:
+            response = await self._request("POST", "/videos", "create", json=data)
+        return self._normalize(response.json())
+
+    async def _load_image(self, url: str):
+        """input_reference is an upload, not a URL: inline data URLs or fetch without the API key"""
+        if url.startswith("data:"):
+            header, _, encoded = url.partition(",")
+            return base64.b64decode(encoded), header[5:].split(";")[0] or "image/png"
+        data, content_type = await fetch_image(self.media_client(), url, self.max_image_bytes)
+        return data, (content_type or "image/png").split(";")[0]
+
+    async def fetch(self, native_id: str) -> Dict[str, Any]:
+        response = await self._request("GET", f"/videos/{native_id}", "query", hedge=True)
+        return self._normalize(response.json())
+
+    async def download(self, native_id: str, result: Dict[str, Any], path: str) -> int:
+        # The content endpoint needs the API key, unlike Ark's CDN links
+        if self._http is None:
+            await self.open()
+        return await self._stream_to_file(self._http, f"/videos/{native_id}/content", path)
+
+
+class ProviderRouter:
+    """
+    Orders providers for new tasks
+
+    Score (lower is better, in seconds) = observed queue time EWMA
+    + error_penalty * create error rate EWMA + cost_weight * task cost.
+    Queue time is measured from submission until the task is first seen
+    past "queued". Providers whose model cannot produce the requested
+    options are left out; those whose circuit breaker is open go last, so
+    creation fails over to them only when nothing else is left.
+    """
+
+    def __init__(
+        self,
+        providers: Dict[str, VideoProvider],
+        default_queue_seconds: float,
+        error_penalty: float,
+        cost_weight: float,
+        alpha: float,
+        max_pending: int = 10000
+    ):
+        self.providers = providers
+        self.error_penalty = error_penalty
+        self.cost_weight = cost_weight
+        self.alpha = alpha
+        self.max_pending = max_pending
+        self.queue_seconds = {name: default_queue_seconds for name in providers}
+        self.error_rate = {name: 0.0 for name in providers}
+        self.created = {name: 0 for name in providers}
+        self.failovers = 0
+        # task_id -> (provider, submitted at) until the task leaves the upstream queue
+        self._pending: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def score(self, provider: VideoProvider, options: GenerationOptions) -> float:
+        return (
+            self.queue_seconds[provider.name]
+            + self.error_penalty * self.error_rate[provider.name]
+            + self.cost_weight * provider.cost(provider.resolve(options))
+        )
+
+    def rank(self, options: GenerationOptions) -> List[VideoProvider]:
+        return sorted(
+            (p for p in self.providers.values() if p.capabilities.check(options) is None),
+            key=lambda p: (not p.available, self.score(p, options))
+        )
+
+    def record_create(self, name: str, ok: bool) -> None:
+        self.error_rate[name] += self.alpha * ((0.0 if ok else 1.0) - self.error_rate[name])
+        if ok:
+            self.created[name] += 1
+
+    def task_submitted(self, task_id: str, name: str) -> None:
+        self._pending[task_id] = (name, time.monotonic())
+        while len(self._pending) > self.max_pending:
+            self._pending.popitem(last=False)
+
+    def task_started(self, task_id: str) -> None:
+        """Task seen past the upstream queue: feed its queue time into the EWMA"""
+        pending = self._pending.pop(task_id, None)
+        if pending is None:
+            return
+        name, submitted_at = pending
+        waited = time.monotonic() - submitted_at
+        self.queue_seconds[name] += self.alpha * (waited - self.queue_seconds[name])
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "failovers": self.failovers,
+            **{name: {
+                "queue_seconds": round(self.queue_seconds[name], 2),
+                "error_rate": round(self.error_rate[name], 4),
+                "created": self.created[name],
+                "available": provider.available
+            } for name, provider in self.providers.items()}
+        }
+
+
+def create_providers(
+    settings,
+    media_client: Callable[[], httpx.AsyncClient],
+    shared: SharedState
+) -> Dict[str, VideoProvider]:
+    """Build the providers listed in settings.VIDEO_PROVIDERS, in that order"""
+
+    def guard(name: str) -> UpstreamGuard:
+        return UpstreamGuard(
+            rate=settings.UPSTREAM_RATE_PER_SECOND,
+            burst=settings.UPSTREAM_RATE_BURST,
+            concurrency_initial=settings.UPSTREAM_CONCURRENCY_INITIAL,
+            concurrency_min=settings.UPSTREAM_CONCURRENCY_MIN,
+            concurrency_max=settings.UPSTREAM_CONCURRENCY_MAX,
+            concurrency_decrease=settings.UPSTREAM_CONCURRENCY_DECREASE,
+            failure_threshold=settings.UPSTREAM_BREAKER_FAILURES,
+            cooldown=settings.UPSTREAM_BREAKER_COOLDOWN,
+            max_retries=settings.UPSTREAM_MAX_RETRIES,
+            retry_base_delay=settings.UPSTREAM_RETRY_BASE_DELAY,
+            retry_max_delay=settings.UPSTREAM_RETRY_MAX_DELAY,
+            # The request rate budget is per deployment, split across or shared by workers
+            bucket=shared.token_bucket(
+                f"upstream:{name}", settings.UPSTREAM_RATE_PER_SECOND, settings.UPSTREAM_RATE_BURST
+            )
+        )
+
+    def hedger() -> Optional[Hedger]:
+        if not settings.HEDGE_ENABLED:
+            return None
+        return Hedger(
+            percentile=settings.HEDGE_PERCENTILE,
+            min_delay=settings.HEDGE_MIN_DELAY_SECONDS,
+            budget_ratio=settings.HEDGE_BUDGET_PERCENT / 100,
+            min_samples=settings.HEDGE_MIN_SAMPLES
+        )
+
+    providers: Dict[str, VideoProvider] = {}
+    for name in (n.strip().lower() for n in settings.VIDEO_PROVIDERS.split(",")):
+        if not name:
+            continue
+        common = {
+            "guard": guard(name),
+            "hedger": hedger(),
+            "media_client": media_client,
+            "chunk_size": settings.VIDEO_DOWNLOAD_CHUNK_SIZE
+        }
+        if name == "ark":
+            providers[name] = ArkProvider(
+                base_url=settings.ARK_BASE_URL,
+                api_key=settings.BYTEDANCE_ARK_API_KEY,
+                timeout=settings.ARK_HTTP_TIMEOUT,
+                connect_timeout=settings.ARK_HTTP_CONNECT_TIMEOUT,
+                max_connections=settings.ARK_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.ARK_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.ARK_HTTP_KEEPALIVE_EXPIRY,
+                http2=settings.ARK_HTTP2,
+                model=settings.BYTEDANCE_MODEL_ID,
+                cost_per_second=settings.ARK_COST_PER_SECOND,
+                capabilities=ModelCapabilities(
+                    durations=tuple(range(settings.ARK_MIN_DURATION, settings.ARK_MAX_DURATION + 1)),
+                    resolutions=tuple(r.strip() for r in settings.ARK_RESOLUTIONS.split(",") if r.strip()),
+                    ratios=tuple(r.strip() for r in settings.ARK_RATIOS.split(",") if r.strip()),
+                    generate_audio=(False, True) if settings.ARK_GENERATE_AUDIO else (False,)
+                ),
+                defaults=GenerationOptions(
+                    duration=settings.VIDEO_DEFAULT_DURATION,
+                    generate_audio=settings.VIDEO_DEFAULT_GENERATE_AUDIO
+                ),
+                **common
+            )
+        elif name == "openai":
+            providers[name] = OpenAIProvider(
+                base_url=settings.OPENAI_BASE_URL,
+                api_key=settings.OPENAI_API_KEY,
+                size=settings.OPENAI_VIDEO_SIZE,
+                timeout=settings.OPENAI_HTTP_TIMEOUT,
+                default_duration=settings.VIDEO_DEFAULT_DURATION,
+                max_image_bytes=settings.IMAGE_MAX_BYTES,
+                model=settings.OPENAI_VIDEO_MODEL,
+                cost_per_second=settings.OPENAI_COST_PER_SECOND,
+                **common
+            )
+        else:
+            raise ValueError(f"Unknown video provider: {name}")
+    if not providers:
+        raise ValueError("VIDEO_PROVIDERS must name at least one provider")
+    return providers
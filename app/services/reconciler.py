@@ -0,0 +1,303 @@
+import time
+import random
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Set, Callable, Awaitable
+
+from app.services.providers import VideoProvider, ReconcilableProvider, make_task_id
+from app.services.task_cache import TERMINAL_STATUSES
+from app.services.task_store import TaskStore
+from app.services.shared_state import SharedState
+
+
+logger = logging.getLogger(__name__)
+
+# Upstream statuses listed each run; only queued tasks can be cancelled
+LIVE_STATUSES = ("queued", "running")
+
+# Tasks created this recently may not be registered yet, so they are never "unknown"
+UNKNOWN_GRACE_SECONDS = 60.0
+
+# How long a run waits for a busy provider before giving up until the next interval
+BUSY_WAIT_SECONDS = 30.0
+
+# Finished task records removed per store call
+PURGE_BATCH = 500
+
+CANCEL_REASONS = ("expired", "abandoned", "unknown")
+
+
+class ReconcileDeferred(Exception):
+    """Live traffic needs the upstream; the run stops and retries next interval"""
+    pass
+
+
+class TaskReconciler:
+    """
+    Periodic job that compares upstream tasks with the local task registry
+
+    Each run lists queued and running tasks page by page from every
+    provider that supports it, then:
+
+    - refreshes registry entries from the listed results, so tasks the
+      poller stopped tracking still get their latest status
+    - cancels registered queued tasks older than max_age ("expired") or
+      that no client has asked about for idle_seconds ("abandoned": no
+      query, long-poll, SSE or pending webhook) and, only with
+      cancel_unknown, tasks missing from the registry ("unknown")
+    - purges finished tasks created more than purge_after seconds ago from
+      the registry, the task cache and the video cache
+
+    Upstream calls are paced by the job's own token bucket, and the run
+    backs off while the provider is busy (in-flight calls above max_load of
+    its concurrency limit, or a circuit that is not closed), so live traffic
+    keeps priority. With shared state in Redis only one worker runs per
+    interval.
+    """
+
+    def __init__(
+        self,
+        providers: Dict[str, VideoProvider],
+        task_store: TaskStore,
+        shared: SharedState,
+        bucket,
+        apply_result: Callable[[str, Dict[str, Any]], None],
+        forget: Callable[[List[str]], Awaitable[None]],
+        client_interest: Callable[[List[str]], Awaitable[Set[str]]],
+        interval: float,
+        page_size: int,
+        max_pages: int,
+        max_load: float,
+        max_age: float,
+        idle_seconds: float,
+        cancel_unknown: bool,
+        purge_after: float,
+        max_interest_entries: int = 100000
+    ):
+        self.providers = providers
+        self.task_store = task_store
+        self.shared = shared
+        self.bucket = bucket
+        self.apply_result = apply_result
+        self.forget = forget
+        self.client_interest = client_interest
+        self.interval = interval
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.max_load = max_load
+        self.max_age = max_age
+        self.idle_seconds = idle_seconds
+        self.cancel_unknown = cancel_unknown
+        self.purge_after = purge_after
+        self.max_interest_entries = max_interest_entries
+        # task_id -> wall time a client last asked about it, oldest first
+        self._interest: "OrderedDict[str, float]" = OrderedDict()
+        self._runner: Optional[asyncio.Task] = None
+        self.last_run: Optional[Dict[str, Any]] = None
+        self.counters = {
+            "runs": 0, "deferred": 0, "errors": 0, "listed": 0, "refreshed": 0, "unknown": 0,
+            **{f"cancelled_{reason}": 0 for reason in CANCEL_REASONS},
+            "cancel_failed": 0, "purged": 0
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._runner is not None and not self._runner.done()
+
+    def touch(self, task_id: str) -> bool:
+        """
+        Note that a client asked about a task
+
+        Returns True when the deployment-wide record should be refreshed
+        (shared state in Redis, at most a few times per idle period).
+        """
+        if self.idle_seconds <= 0:
+            return False
+        now = time.time()
+        last = self._interest.get(task_id)
+        self._interest[task_id] = now
+        self._interest.move_to_end(task_id)
+        while len(self._interest) > self.max_interest_entries:
+            self._interest.popitem(last=False)
+        return self.shared.shared and (last is None or now - last > self.idle_seconds / 4)
+
+    async def start(self) -> None:
+        if not self.running:
+            self._runner = asyncio.create_task(self._run())
+            logger.info(
+                "Task reconciler started - interval: %ss, idle cancel: %s",
+                self.interval, self.idle_seconds > 0
+            )
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+            logger.info("Task reconciler stopped - stats: %s", self.counters)
+
+    async def _run(self) -> None:
+        while True:
+            # Jittered so workers and restarts do not line up
+            await asyncio.sleep(self.interval * random.uniform(0.9, 1.1))
+            if not await self.shared.acquire_lease("reconcile", self.interval * 0.9):
+                continue
+            try:
+                await self.run_once()
+            except Exception as e:
+                self.counters["errors"] += 1
+                logger.error("Reconciliation run failed: %s", e)
+
+    async def run_once(self) -> Dict[str, Any]:
+        """Run one reconciliation pass and return its summary"""
+        started = time.monotonic()
+        summary: Dict[str, Any] = {
+            "pages": 0, "listed": 0, "refreshed": 0, "unknown": 0,
+            **{f"cancelled_{reason}": 0 for reason in CANCEL_REASONS},
+            "cancel_failed": 0, "purged": 0, "truncated": False, "deferred": False
+        }
+        try:
+            for provider in self.providers.values():
+                if isinstance(provider, ReconcilableProvider):
+                    await self._reconcile_provider(provider, summary)
+        except ReconcileDeferred as e:
+            summary["deferred"] = True
+            self.counters["deferred"] += 1
+            logger.info("Reconciliation deferred: %s", e)
+
+        # Local only, so it runs even when upstream work was deferred
+        summary["purged"] = await self._purge()
+        self._prune_interest()
+
+        summary["duration_seconds"] = round(time.monotonic() - started, 3)
+        self.counters["runs"] += 1
+        for name in self.counters:
+            if name in summary and not isinstance(summary[name], bool):
+                self.counters[name] += summary[name]
+        self.last_run = {"finished_at": time.time(), **summary}
+        logger.info("Reconciliation finished - %s", summary)
+        return summary
+
+    async def _pace(self, provider: VideoProvider) -> None:
+        """Wait for the job's budget, yielding to live traffic first"""
+        guard = provider.guard
+        waited = 0.0
+        while guard.breaker.state != "closed" or guard.limiter.inflight >= max(1.0, guard.limiter.limit * self.max_load):
+            if waited >= BUSY_WAIT_SECONDS:
+                raise ReconcileDeferred(f"provider {provider.name} busy")
+            await asyncio.sleep(1.0)
+            waited += 1.0
+        await self.bucket.acquire()
+
+    async def _reconcile_provider(self, provider: ReconcilableProvider, summary: Dict[str, Any]) -> None:
+        # Collect every page before acting: cancelling shifts later pages of the queued listing
+        listed: List[Dict[str, Any]] = []
+        for status in LIVE_STATUSES:
+            for page_num in range(1, self.max_pages + 1):
+                await self._pace(provider)
+                items, total = await provider.list_page(page_num, self.page_size, status)
+                summary["pages"] += 1
+                listed.extend(item for item in items if item.get("id"))
+                if len(items) < self.page_size or page_num * self.page_size >= total:
+                    break
+            else:
+                summary["truncated"] = True
+        summary["listed"] += len(listed)
+        if not listed:
+            return
+
+        task_ids = [make_task_id(provider.name, item["id"]) for item in listed]
+        known = await self.task_store.known(task_ids)
+        interested = await self._interested(task_ids) if self.idle_seconds > 0 else set()
+
+        now = time.time()
+        for task_id, item in zip(task_ids, listed):
+            result = {**item, "id": task_id}
+            if task_id in known:
+                self.apply_result(task_id, result)
+                summary["refreshed"] += 1
+            else:
+                summary["unknown"] += 1
+
+            if item.get("status") != "queued":
+                continue
+            age = now - (item.get("created_at") or now)
+            if task_id not in known:
+                # Possibly another service's task on the same API key: only touched when asked to
+                reason = "unknown" if self.cancel_unknown and age > UNKNOWN_GRACE_SECONDS else None
+            elif age > self.max_age:
+                reason = "expired"
+            elif self.idle_seconds > 0 and age > self.idle_seconds and task_id not in interested:
+                reason = "abandoned"
+            else:
+                reason = None
+            if reason is not None:
+                await self._cancel(provider, task_id, item["id"], result if task_id in known else None, reason, summary)
+
+    async def _interested(self, task_ids: List[str]) -> Set[str]:
+        """Tasks a client asked about within idle_seconds, on this or (with Redis) any worker"""
+        cutoff = time.time() - self.idle_seconds
+        interested = {task_id for task_id in task_ids if self._interest.get(task_id, 0.0) > cutoff}
+        interested |= await self.client_interest(task_ids)
+        if self.shared.shared:
+            interested |= await self.shared.interested([t for t in task_ids if t not in interested])
+        return interested
+
+    async def _cancel(
+        self,
+        provider: ReconcilableProvider,
+        task_id: str,
+        native_id: str,
+        result: Optional[Dict[str, Any]],
+        reason: str,
+        summary: Dict[str, Any]
+    ) -> None:
+        await self._pace(provider)
+        try:
+            await provider.cancel(native_id)
+        except Exception as e:
+            # Typically the task started running since it was listed
+            summary["cancel_failed"] += 1
+            logger.warning("Task cancel failed - task_id: %s, reason: %s, error: %s", task_id, reason, e)
+            return
+        summary[f"cancelled_{reason}"] += 1
+        logger.info("Task cancelled upstream - task_id: %s, reason: %s", task_id, reason)
+        if result is not None:
+            # Registry, cache, admission slot and webhooks see the final status
+            self.apply_result(task_id, {**result, "status": "cancelled"})
+
+    async def _purge(self) -> int:
+        if self.purge_after <= 0:
+            return 0
+        before = time.time() - self.purge_after
+        purged = 0
+        while True:
+            task_ids = await self.task_store.stale(before, TERMINAL_STATUSES, PURGE_BATCH)
+            if not task_ids:
+                break
+            await self.forget(task_ids)
+            await self.task_store.delete(task_ids)
+            purged += len(task_ids)
+            if len(task_ids) < PURGE_BATCH:
+                break
+        return purged
+
+    def _prune_interest(self) -> None:
+        cutoff = time.time() - self.idle_seconds
+        while self._interest:
+            task_id, seen = next(iter(self._interest.items()))
+            if seen > cutoff:
+                break
+            self._interest.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "interest_entries": len(self._interest),
+            "last_run_at": self.last_run["finished_at"] if self.last_run else 0,
+            "running": self.running
+        }
@@ -0,0 +1,211 @@
+import json
+import uuid
+import logging
+from typing import Optional, Dict, Any, List, Set
+
+from app.utils.rate_limit import TokenBucket, RedisTokenBucket
+
+
+logger = logging.getLogger(__name__)
+
+# Delete a lease only while this worker still holds it
+RELEASE_LEASE_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+
+class SharedState:
+    """
+    State shared by all worker processes
+
+    With backend "redis", rate-limit budgets, fresh task results and
+    idempotency entries live in Redis, so N workers together stay within one
+    upstream budget, a task fetched by one worker is served to the others
+    without another upstream call, and a retried create is recognised by any
+    worker. With backend "local", every worker keeps its own state and budgets
+    are divided by the number of workers instead.
+
+    Requires the optional "redis" package for the redis backend.
+    """
+
+    def __init__(self, backend: str, redis_url: str, workers: int, prefix: str = "sora2"):
+        if backend not in ("local", "redis"):
+            raise ValueError(f"Unknown shared state backend: {backend}")
+        self.backend = backend
+        self.redis_url = redis_url
+        self.workers = max(1, workers)
+        self.prefix = prefix
+        self._redis = None
+        # Identifies this worker as the holder of leases it takes
+        self._owner = uuid.uuid4().hex
+        self.counters = {"result_hits": 0, "result_misses": 0, "result_writes": 0, "errors": 0}
+
+    @property
+    def shared(self) -> bool:
+        return self.backend == "redis"
+
+    async def open(self) -> None:
+        if self.shared and self._redis is None:
+            try:
+                import redis.asyncio as aioredis
+            except ImportError:
+                raise RuntimeError("SHARED_STATE_BACKEND=redis requires the 'redis' package")
+            self._redis = aioredis.from_url(self.redis_url, decode_responses=True)
+            logger.info("Shared state opened - backend: redis, workers: %s", self.workers)
+
+    async def close(self) -> None:
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    def token_bucket(self, name: str, rate: float, capacity: float):
+        """A rate budget of rate/s for the whole deployment, not per worker"""
+        local = TokenBucket(rate=rate / self.workers, capacity=max(1.0, capacity / self.workers))
+        if not self.shared:
+            return local
+        return RedisTokenBucket(
+            lambda: self._redis, f"{self.prefix}:bucket:{name}", rate, capacity, fallback=local
+        )
+
+    def local_share(self, limit: int) -> int:
+        """This worker's part of a deployment-wide limit"""
+        return max(1, limit // self.workers)
+
+    async def get_result(self, task_id: str) -> Optional[Dict[str, Any]]:
+        if self._redis is None:
+            return None
+        try:
+            raw = await self._redis.get(f"{self.prefix}:task:{task_id}")
+        except Exception as e:
+            self.counters["errors"] += 1
+            logger.warning("Shared task result lookup failed - task_id: %s, error: %s", task_id, e)
+            return None
+        if raw is None:
+            self.counters["result_misses"] += 1
+            return None
+        self.counters["result_hits"] += 1
+        return json.loads(raw)
+
+    async def put_result(self, task_id: str, result: Dict[str, Any], ttl: float) -> None:
+        if self._redis is None or ttl <= 0:
+            return
+        try:
+            await self._redis.set(f"{self.prefix}:task:{task_id}", json.dumps(result), px=int(ttl * 1000))
+            self.counters["result_writes"] += 1
+        except Exception as e:
+            self.counters["errors"] += 1
+            logger.warning("Shared task result write failed - task_id: %s, error: %s", task_id, e)
+
+    async def get_submission(self, key: str) -> Optional[Dict[str, Any]]:
+        """A deduplication entry: {"fingerprint", "result"}, result None while it is being submitted"""
+        if self._redis is None:
+            return None
+        try:
+            raw = await self._redis.get(f"{self.prefix}:submission:{key}")
+        except Exception as e:
+            self.counters["errors"] += 1
+            logger.warning("Shared submission lookup failed: %s", e)
+            return None
+        return json.loads(raw) if raw is not None else None
+
+    async def reserve_submission(self, key: str, fingerprint: str, ttl: float) -> bool:
+        """
+        Mark a deduplication key as being submitted by this worker for up to ttl seconds
+
+        False if another worker holds it. Granted when Redis is unreachable:
+        a possible duplicate beats refusing the create.
+        """
+        if self._redis is None:
+            return True
+        try:
+            return bool(await self._redis.set(
+                f"{self.prefix}:submission:{key}",
+                json.dumps({"fingerprint": fingerprint, "result": None}),
+                nx=True,
+                px=int(ttl * 1000)
+            ))
+        except Exception as e:
+            self.counters["errors"] += 1
+            logger.warning("Shared submission reservation failed: %s", e)
+            return True
+
+    async def put_submission(self, key: str, fingerprint: str, result: Dict[str, Any], ttl: float) -> None:
+        if self._redis is None or ttl <= 0:
+            return
+        try:
+            await self._redis.set(
+                f"{self.prefix}:submission:{key}",
+                json.dumps({"fingerprint": fingerprint, "result": result}),
+                px=int(ttl * 1000)
+            )
+        except Exception as e:
+            self.counters["errors"] += 1
+            logger.warning("Shared submission write failed: %s", e)
+
+    async def release_submission(self, key: str) -> None:
+        """Drop a reservation whose submission failed, so a retry can proceed"""
+        if self._redis is None:
+            return
+        try:
+            await self._redis.delete(f"{self.prefix}:submission:{key}")
+        except Exception as e:
+            self.counters["errors"] += 1
+            logger.warning("Shared submission release failed: %s", e)
+
+    async def acquire_lease(self, name: str, ttl: float) -> bool:
+        """
+        Claim a deployment-wide lease for ttl seconds; False if another worker holds it
+
+        Always granted with the local backend, where workers cannot see each
+        other. If Redis is unreachable the lease is refused, so periodic jobs
+        skip a run rather than all running at once.
+        """
+        if self._redis is None:
+            return True
+        try:
+            return bool(await self._redis.set(
+                f"{self.prefix}:lease:{name}", self._owner, nx=True, px=int(ttl * 1000)
+            ))
+        except Exception as e:
+            self.counters["errors"] += 1
+            logger.warning("Shared lease unavailable - name: %s, error: %s", name, e)
+            return False
+
+    async def release_lease(self, name: str) -> None:
+        """Give up a lease this worker holds before its ttl runs out"""
+        if self._redis is None:
+            return
+        try:
+            await self._redis.eval(RELEASE_LEASE_SCRIPT, 1, f"{self.prefix}:lease:{name}", self._owner)
+        except Exception as e:
+            self.counters["errors"] += 1
+            logger.warning("Shared lease release failed - name: %s, error: %s", name, e)
+
+    async def mark_interest(self, task_id: str, ttl: float) -> None:
+        """Record that a client asked about a task within the last ttl seconds"""
+        if self._redis is None or ttl <= 0:
+            return
+        try:
+            await self._redis.set(f"{self.prefix}:interest:{task_id}", 1, px=int(ttl * 1000))
+        except Exception as e:
+            self.counters["errors"] += 1
+            logger.warning("Shared interest write failed - task_id: %s, error: %s", task_id, e)
+
+    async def interested(self, task_ids: List[str]) -> Set[str]:
+        """The subset of task_ids some worker's clients asked about recently"""
+        if self._redis is None or not task_ids:
+            return set()
+        try:
+            values = await self._redis.mget([f"{self.prefix}:interest:{task_id}" for task_id in task_ids])
+        except Exception as e:
+            self.counters["errors"] += 1
+            logger.warning("Shared interest lookup failed: %s", e)
+            # Unknown: treat every task as wanted so nothing is cancelled by mistake
+            return set(task_ids)
+        return {task_id for task_id, value in zip(task_ids, values) if value is not None}
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.counters, "workers": self.workers, "shared": self.shared}
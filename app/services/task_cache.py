@@ -0,0 +1,125 @@
+import asyncio
+import time
+import logging
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Callable, Awaitable, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+# Ark task statuses after which a task never changes again
+TERMINAL_STATUSES = frozenset({"succeeded", "failed", "cancelled"})
+
+
+def is_terminal(result: Dict[str, Any]) -> bool:
+    """Whether an upstream task result is in a final state"""
+    return result.get("status") in TERMINAL_STATUSES
+
+
+class TaskCache:
+    """
+    In-process cache of upstream task results keyed by task_id
+
+    Terminal results are pinned (never expire) in their own LRU bounded by
+    max_terminal_entries. Non-terminal results expire after ttl seconds.
+    Concurrent misses for the same task share a single upstream fetch.
+    """
+
+    def __init__(self, ttl: float, max_entries: int, max_terminal_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_terminal_entries = max_terminal_entries
+        self._live: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._terminal: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.counters = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0}
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Return a cached result, or None if absent or expired"""
+        result = self._terminal.get(task_id)
+        if result is not None:
+            self._terminal.move_to_end(task_id)
+            return result
+
+        entry = self._live.get(task_id)
+        if entry is None:
+            return None
+        expires_at, result = entry
+        if expires_at <= time.monotonic():
+            del self._live[task_id]
+            return None
+        return result
+
+    def put(self, task_id: str, result: Dict[str, Any]) -> None:
+        """Store a result, pinning it if the task has finished"""
+        if is_terminal(result):
+            self._live.pop(task_id, None)
+            self._terminal[task_id] = result
+            self._terminal.move_to_end(task_id)
+            while len(self._terminal) > self.max_terminal_entries:
+                self._terminal.popitem(last=False)
+                self.counters["evictions"] += 1
+            return
+
+        self._live[task_id] = (time.monotonic() + self.ttl, result)
+        self._live.move_to_end(task_id)
+        while len(self._live) > self.max_entries:
+            self._live.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def invalidate(self, task_id: str) -> None:
+        """Drop any cached result for a task"""
+        self._live.pop(task_id, None)
+        self._terminal.pop(task_id, None)
+
+    async def get_or_fetch(
+        self,
+        task_id: str,
+        fetch: Callable[[str], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """
+        Return the cached result for a task, fetching it on a miss
+
+        Args:
+            task_id: Task ID
+            fetch: Coroutine function that loads the task from upstream
+
+        Returns:
+            Task status and result
+        """
+        result = self.get(task_id)
+        if result is not None:
+            self.counters["hits"] += 1
+            return result
+
+        future = self._inflight.get(task_id)
+        if future is not None:
+            self.counters["coalesced"] += 1
+        else:
+            self.counters["misses"] += 1
+            future = asyncio.ensure_future(fetch(task_id))
+            self._inflight[task_id] = future
+            future.add_done_callback(lambda f: self._on_fetched(task_id, f))
+
+        # Shield so a disconnecting client does not cancel the fetch other waiters share
+        return await asyncio.shield(future)
+
+    def _on_fetched(self, task_id: str, future: asyncio.Future) -> None:
+        self._inflight.pop(task_id, None)
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            # Errors are not cached; the next query retries upstream
+            return
+        self.put(task_id, future.result())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Cache size and hit/miss/coalesce counters"""
+        lookups = self.counters["hits"] + self.counters["misses"] + self.counters["coalesced"]
+        return {
+            **self.counters,
+            "hit_ratio": round(self.counters["hits"] / lookups, 4) if lookups else 0.0,
+            "live_entries": len(self._live),
+            "terminal_entries": len(self._terminal),
+            "inflight": len(self._inflight)
+        }
@@ -0,0 +1,286 @@
+import asyncio
+import time
+import logging
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, List, Callable, Awaitable
+
+from app.services.task_cache import is_terminal
+
+
+logger = logging.getLogger(__name__)
+
+TaskListener = Callable[[str, Dict[str, Any]], None]
+
+
+@dataclass
+class TrackedTask:
+    task_id: str
+    registered_at: float
+    next_poll: float
+    interval: float
+    result: Optional[Dict[str, Any]] = None
+    # Backoff interval to return to when the last waiter leaves
+    unwatched_interval: Optional[float] = None
+
+
+class TaskPoller:
+    """
+    Background scheduler that keeps the status of every live task fresh
+
+    Each registered task is polled on its own backoff schedule: every
+    min_interval seconds at first, growing by backoff after each poll up to
+    max_interval. Tasks that are due at the same time are refreshed together
+    through fetch_many (the Ark task-list endpoint), so upstream traffic
+    scales with the number of live tasks rather than with polling clients.
+
+    Tasks with waiters (long-poll or SSE clients) are polled every
+    watch_interval instead, and every waiter on the same task is woken by
+    the same upstream refresh. Once the last waiter times out or goes away
+    the task returns to its backoff schedule.
+    """
+
+    def __init__(
+        self,
+        fetch_many: Callable[[List[str]], Awaitable[Dict[str, Dict[str, Any]]]],
+        fetch_one: Callable[[str], Awaitable[Dict[str, Any]]],
+        min_interval: float,
+        max_interval: float,
+        backoff: float,
+        batch_size: int,
+        max_track_seconds: float,
+        watch_interval: float
+    ):
+        self.fetch_many = fetch_many
+        self.fetch_one = fetch_one
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.batch_size = batch_size
+        self.max_track_seconds = max_track_seconds
+        self.watch_interval = watch_interval
+        self._tasks: Dict[str, TrackedTask] = {}
+        self._listeners: List[TaskListener] = []
+        # One shared future per watched task, resolved on its next status transition
+        self._watchers: Dict[str, asyncio.Future] = {}
+        # Waiters per task, across the futures they wait on
+        self._waiters: Dict[str, int] = {}
+        self._wakeup = asyncio.Event()
+        self._runner: Optional[asyncio.Task] = None
+        self.counters = {"polls": 0, "batch_requests": 0, "single_requests": 0, "errors": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._runner is not None and not self._runner.done()
+
+    def add_listener(self, listener: TaskListener) -> None:
+        """Call listener(task_id, result) whenever a tracked task is refreshed"""
+        self._listeners.append(listener)
+
+    def register(self, task_id: str, result: Optional[Dict[str, Any]] = None) -> None:
+        """Start tracking a task; polls begin after min_interval"""
+        tracked = self._tasks.get(task_id)
+        if tracked is not None:
+            if tracked.result is None:
+                tracked.result = result
+            return
+        now = time.monotonic()
+        self._tasks[task_id] = TrackedTask(
+            task_id=task_id,
+            registered_at=now,
+            next_poll=now + self.min_interval,
+            interval=self.min_interval,
+            result=result
+        )
+        self._wakeup.set()
+
+    def unregister(self, task_id: str) -> None:
+        self._tasks.pop(task_id, None)
+
+    def is_tracked(self, task_id: str) -> bool:
+        """Whether the poller is keeping the task fresh (registered and running)"""
+        return self.running and task_id in self._tasks
+
+    def is_watched(self, task_id: str) -> bool:
+        """Whether a long-poll or SSE client is waiting on the task"""
+        return task_id in self._watchers
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Latest known result for a tracked task, or None"""
+        if not self.running:
+            return None
+        tracked = self._tasks.get(task_id)
+        return tracked.result if tracked else None
+
+    async def wait_for_change(
+        self,
+        task_id: str,
+        status: Optional[str],
+        timeout: float
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Wait until a tracked task leaves the given status
+
+        Args:
+            task_id: Task ID
+            status: Status the caller has already seen
+            timeout: Maximum seconds to wait
+
+        Returns:
+            The new task result, or None on timeout or if the task is not tracked
+        """
+        tracked = self._tasks.get(task_id)
+        if tracked is None or not self.running:
+            return None
+        if tracked.result is not None and tracked.result.get("status") != status:
+            return tracked.result
+
+        future = self._watchers.get(task_id)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._watchers[task_id] = future
+            # Switch the task to the fast watch schedule right away
+            tracked.unwatched_interval = tracked.interval
+            tracked.interval = self.watch_interval
+            tracked.next_poll = min(tracked.next_poll, time.monotonic() + self.watch_interval)
+            self._wakeup.set()
+
+        self._waiters[task_id] = self._waiters.get(task_id, 0) + 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self._release_waiter(task_id)
+
+    def _release_waiter(self, task_id: str) -> None:
+        count = self._waiters.get(task_id, 0) - 1
+        if count > 0:
+            self._waiters[task_id] = count
+            return
+        self._waiters.pop(task_id, None)
+        # Nobody is waiting any more, on this future or one that replaced it after a change
+        future = self._watchers.pop(task_id, None)
+        if future is not None:
+            future.cancel()
+        self._unwatch(task_id)
+
+    def _notify(self, task_id: str, result: Optional[Dict[str, Any]]) -> None:
+        future = self._watchers.pop(task_id, None)
+        if future is not None and not future.done():
+            future.set_result(result)
+        # Waiters return now; ones that come back switch to the watch schedule again
+        self._unwatch(task_id)
+
+    def _unwatch(self, task_id: str) -> None:
+        """Put the task back on its backoff schedule"""
+        tracked = self._tasks.get(task_id)
+        if tracked is not None and tracked.unwatched_interval is not None:
+            tracked.interval = tracked.unwatched_interval
+            tracked.unwatched_interval = None
+
+    async def start(self) -> None:
+        if not self.running:
+            # Bind the wake-up event to the loop the poller runs on
+            self._wakeup = asyncio.Event()
+            self._runner = asyncio.create_task(self._run())
+            logger.info("Task poller started")
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+            for task_id in list(self._watchers):
+                self._notify(task_id, None)
+            logger.info("Task poller stopped - stats: %s", self.counters)
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            due = [t for t in self._tasks.values() if t.next_poll <= now]
+            if due:
+                try:
+                    await self._poll(due)
+                except Exception as e:
+                    self.counters["errors"] += 1
+                    logger.error("Task poller cycle failed: %s", e)
+                    await asyncio.sleep(self.min_interval)
+                continue
+
+            if self._tasks:
+                delay = min(t.next_poll for t in self._tasks.values()) - now
+            else:
+                delay = self.max_interval
+            try:
+                # asyncio.timeout rather than wait_for: on 3.11 wait_for can swallow
+                # the cancel from stop() when the event fires at the same moment
+                async with asyncio.timeout(max(delay, 0.05)):
+                    await self._wakeup.wait()
+            except TimeoutError:
+                pass
+
+    async def _poll(self, due: List[TrackedTask]) -> None:
+        for start in range(0, len(due), self.batch_size):
+            batch = due[start:start + self.batch_size]
+            ids = [t.task_id for t in batch]
+            results: Dict[str, Dict[str, Any]] = {}
+
+            if len(ids) > 1:
+                try:
+                    self.counters["batch_requests"] += 1
+                    results = await self.fetch_many(ids)
+                except Exception as e:
+                    logger.warning("Batched task refresh failed, falling back to single queries: %s", e)
+
+            # Anything the list endpoint did not return is fetched individually
+            for task_id in ids:
+                if task_id in results:
+                    continue
+                try:
+                    self.counters["single_requests"] += 1
+                    results[task_id] = await self.fetch_one(task_id)
+                except Exception as e:
+                    self.counters["errors"] += 1
+                    logger.warning("Task refresh failed - task_id: %s, error: %s", task_id, e)
+
+            for tracked in batch:
+                self._apply(tracked, results.get(tracked.task_id))
+
+    def _apply(self, tracked: TrackedTask, result: Optional[Dict[str, Any]]) -> None:
+        now = time.monotonic()
+        self.counters["polls"] += 1
+        if result is not None:
+            previous = tracked.result
+            tracked.result = result
+            if previous is None or previous.get("status") != result.get("status"):
+                # Before scheduling, so the next poll follows the backoff unless someone waits again
+                self._notify(tracked.task_id, result)
+
+        if tracked.task_id in self._watchers:
+            tracked.interval = self.watch_interval
+        else:
+            tracked.interval = min(tracked.interval * self.backoff, self.max_interval)
+        tracked.next_poll = now + tracked.interval
+
+        if result is not None:
+            for listener in self._listeners:
+                try:
+                    listener(tracked.task_id, result)
+                except Exception as e:
+                    logger.error("Task listener failed - task_id: %s, error: %s", tracked.task_id, e)
+
+        if (result is not None and is_terminal(result)) or now - tracked.registered_at > self.max_track_seconds:
+            self._tasks.pop(tracked.task_id, None)
+            self._notify(tracked.task_id, tracked.result)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "tracked": len(self._tasks),
+            "watched": len(self._watchers),
+            "running": self.running
+        }
@@ -0,0 +1,509 @@
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Optional, Dict, Any, List, Tuple, Iterable, Set
+
+
+logger = logging.getLogger(__name__)
+
+# Fields kept for every task, in addition to the last upstream payload ("result")
+TASK_FIELDS = ("id", "model", "prompt", "image_url", "status", "video_url", "error", "created_at", "updated_at")
+# Fields of an admission queue submission; "payload" is the queued request (JSON)
+SUBMISSION_FIELDS = ("id", "tenant", "priority", "payload", "status", "upstream_id", "error", "created_at", "settled_at")
+
+
+def summarize_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Pick the fields the registry indexes out of an upstream task result"""
+    error = result.get("error")
+    if isinstance(error, dict):
+        error = error.get("message") or error.get("code")
+    return {
+        "status": result.get("status"),
+        "video_url": (result.get("content") or {}).get("video_url"),
+        "error": str(error) if error else None
+    }
+
+
+class TaskStore(ABC):
+    """
+    Registry of tasks created through this service
+
+    Records prompt, image URL, creation time, last known status and result
+    URL for every task so lookups and listings do not need upstream calls.
+    Implementations must be safe to share between uvicorn workers.
+    """
+
+    async def open(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    @abstractmethod
+    async def create(self, record: Dict[str, Any]) -> None:
+        """Insert a new task record (keys from TASK_FIELDS)"""
+
+    @abstractmethod
+    async def update_result(self, task_id: str, result: Dict[str, Any]) -> None:
+        """Store the latest upstream payload and its status / result URL"""
+
+    @abstractmethod
+    async def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Return a task record including its last "result", or None"""
+
+    @abstractmethod
+    async def list(
+        self,
+        page: int,
+        page_size: int,
+        status: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """Return one page of records, newest first, and the total count"""
+
+    @abstractmethod
+    async def known(self, task_ids: List[str]) -> Set[str]:
+        """The subset of task_ids that have a record"""
+
+    @abstractmethod
+    async def stale(self, before: float, statuses: Iterable[str], limit: int) -> List[str]:
+        """Ids of up to limit tasks in one of statuses created before the given time, oldest first"""
+
+    @abstractmethod
+    async def delete(self, task_ids: List[str]) -> None:
+        """Remove task records"""
+
+    @abstractmethod
+    async def save_submission(self, submission: Dict[str, Any]) -> None:
+        """Record a queued admission submission (keys from SUBMISSION_FIELDS)"""
+
+    @abstractmethod
+    async def get_submission(self, local_id: str) -> Optional[Dict[str, Any]]:
+        """Return a submission record, or None"""
+
+    @abstractmethod
+    async def claim_submission(self, local_id: str) -> bool:
+        """Mark a queued submission as being dispatched; False if it is not queued (any more)"""
+
+    @abstractmethod
+    async def settle_submission(
+        self,
+        local_id: str,
+        status: str,
+        upstream_id: Optional[str],
+        error: Optional[str],
+        retention: float
+    ) -> None:
+        """Record a submission's outcome, kept retention seconds for local id lookups"""
+
+    @abstractmethod
+    async def queued_submissions(self, limit: int) -> List[Dict[str, Any]]:
+        """Up to limit submissions still waiting to be dispatched, oldest first"""
+
+
+class SQLiteTaskStore(TaskStore):
+    """SQLite (WAL mode) task registry; the file can be shared by local workers"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    async def open(self) -> None:
+        if self._conn is None:
+            await asyncio.to_thread(self._open)
+            logger.info("SQLite task store opened - path: %s", self.path)
+
+    def _open(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=10.0)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS tasks (
+                id TEXT PRIMARY KEY,
+                model TEXT,
+                prompt TEXT,
+                image_url TEXT,
+                status TEXT,
+                video_url TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL,
+                result TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_tasks_created ON tasks (created_at);
+            CREATE INDEX IF NOT EXISTS idx_tasks_status_created ON tasks (status, created_at);
+            CREATE TABLE IF NOT EXISTS submissions (
+                id TEXT PRIMARY KEY,
+                tenant TEXT,
+                priority TEXT,
+                payload TEXT,
+                status TEXT NOT NULL,
+                upstream_id TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                settled_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_submissions_status_created ON submissions (status, created_at);
+            CREATE INDEX IF NOT EXISTS idx_submissions_settled ON submissions (settled_at);
+            """
+        )
+        self._conn = conn
+
+    async def close(self) -> None:
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
+                self._conn = None
+
+    def _execute(self, sql: str, params: tuple = ()) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    async def create(self, record: Dict[str, Any]) -> None:
+        values = tuple(record.get(field) for field in TASK_FIELDS)
+        await asyncio.to_thread(
+            self._execute,
+            f"INSERT OR IGNORE INTO tasks ({', '.join(TASK_FIELDS)}) VALUES ({', '.join('?' * len(TASK_FIELDS))})",
+            values
+        )
+
+    async def update_result(self, task_id: str, result: Dict[str, Any]) -> None:
+        summary = summarize_result(result)
+        await asyncio.to_thread(
+            self._execute,
+            "UPDATE tasks SET status = ?, video_url = COALESCE(?, video_url), error = ?, "
+            "updated_at = ?, result = ? WHERE id = ?",
+            (summary["status"], summary["video_url"], summary["error"], time.time(), json.dumps(result), task_id)
+        )
+
+    def _row_to_record(self, row: tuple) -> Dict[str, Any]:
+        record = dict(zip(TASK_FIELDS, row[:len(TASK_FIELDS)]))
+        record["result"] = json.loads(row[-1]) if row[-1] else None
+        return record
+
+    async def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        rows = await asyncio.to_thread(
+            self._execute,
+            f"SELECT {', '.join(TASK_FIELDS)}, result FROM tasks WHERE id = ?",
+            (task_id,)
+        )
+        return self._row_to_record(rows[0]) if rows else None
+
+    async def list(
+        self,
+        page: int,
+        page_size: int,
+        status: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        where, params = ("WHERE status = ?", (status,)) if status else ("", ())
+
+        def query() -> Tuple[List[Dict[str, Any]], int]:
+            with self._lock:
+                total = self._conn.execute(f"SELECT COUNT(*) FROM tasks {where}", params).fetchone()[0]
+                rows = self._conn.execute(
+                    f"SELECT {', '.join(TASK_FIELDS)} FROM tasks {where} "
+                    "ORDER BY created_at DESC LIMIT ? OFFSET ?",
+                    params + (page_size, (page - 1) * page_size)
+                ).fetchall()
+            return [dict(zip(TASK_FIELDS, row)) for row in rows], total
+
+        return await asyncio.to_thread(query)
+
+    async def known(self, task_ids: List[str]) -> Set[str]:
+        def query() -> Set[str]:
+            found: Set[str] = set()
+            # Stay under SQLite's bound parameter limit
+            for start in range(0, len(task_ids), 500):
+                chunk = task_ids[start:start + 500]
+                found.update(row[0] for row in self._execute(
+                    f"SELECT id FROM tasks WHERE id IN ({', '.join('?' * len(chunk))})", tuple(chunk)
+                ))
+            return found
+
+        return await asyncio.to_thread(query) if task_ids else set()
+
+    async def stale(self, before: float, statuses: Iterable[str], limit: int) -> List[str]:
+        statuses = tuple(statuses)
+        rows = await asyncio.to_thread(
+            self._execute,
+            f"SELECT id FROM tasks WHERE status IN ({', '.join('?' * len(statuses))}) AND created_at < ? "
+            "ORDER BY created_at LIMIT ?",
+            statuses + (before, limit)
+        )
+        return [row[0] for row in rows]
+
+    async def delete(self, task_ids: List[str]) -> None:
+        if task_ids:
+            await asyncio.to_thread(
+                self._execute,
+                f"DELETE FROM tasks WHERE id IN ({', '.join('?' * len(task_ids))})",
+                tuple(task_ids)
+            )
+
+    def _submission(self, row: tuple) -> Dict[str, Any]:
+        record = dict(zip(SUBMISSION_FIELDS, row))
+        record["payload"] = json.loads(record["payload"]) if record["payload"] else None
+        return record
+
+    async def save_submission(self, submission: Dict[str, Any]) -> None:
+        values = tuple(
+            json.dumps(submission.get(field)) if field == "payload" else submission.get(field)
+            for field in SUBMISSION_FIELDS
+        )
+        await asyncio.to_thread(
+            self._execute,
+            f"INSERT OR REPLACE INTO submissions ({', '.join(SUBMISSION_FIELDS)}) "
+            f"VALUES ({', '.join('?' * len(SUBMISSION_FIELDS))})",
+            values
+        )
+
+    async def get_submission(self, local_id: str) -> Optional[Dict[str, Any]]:
+        rows = await asyncio.to_thread(
+            self._execute,
+            f"SELECT {', '.join(SUBMISSION_FIELDS)} FROM submissions WHERE id = ?",
+            (local_id,)
+        )
+        return self._submission(rows[0]) if rows else None
+
+    async def claim_submission(self, local_id: str) -> bool:
+        def claim() -> bool:
+            with self._lock:
+                return self._conn.execute(
+                    "UPDATE submissions SET status = 'dispatching' WHERE id = ? AND status = 'queued'",
+                    (local_id,)
+                ).rowcount == 1
+
+        return await asyncio.to_thread(claim)
+
+    async def settle_submission(
+        self,
+        local_id: str,
+        status: str,
+        upstream_id: Optional[str],
+        error: Optional[str],
+        retention: float
+    ) -> None:
+        now = time.time()
+
+        def settle() -> None:
+            with self._lock:
+                self._conn.execute(
+                    "UPDATE submissions SET status = ?, upstream_id = ?, error = ?, settled_at = ?, payload = NULL "
+                    "WHERE id = ?",
+                    (status, upstream_id, error, now, local_id)
+                )
+                # Forget ids settled longer ago than anyone asks about them
+                self._conn.execute("DELETE FROM submissions WHERE settled_at < ?", (now - retention,))
+
+        await asyncio.to_thread(settle)
+
+    async def queued_submissions(self, limit: int) -> List[Dict[str, Any]]:
+        rows = await asyncio.to_thread(
+            self._execute,
+            f"SELECT {', '.join(SUBMISSION_FIELDS)} FROM submissions WHERE status = 'queued' "
+            "ORDER BY created_at LIMIT ?",
+            (limit,)
+        )
+        return [self._submission(row) for row in rows]
+
+
+class RedisTaskStore(TaskStore):
+    """
+    Redis task registry for deployments with workers on several hosts
+
+    Each task is a hash at "<prefix>task:<id>"; sorted sets by creation time
+    (one overall, one per status) back pagination and status filters.
+    Admission submissions are hashes at "<prefix>submission:<id>", with a
+    sorted set of the ones still queued.
+    Requires the optional "redis" package.
+    """
+
+    def __init__(self, url: str, prefix: str = "sora2:"):
+        self.url = url
+        self.prefix = prefix
+        self._redis = None
+
+    async def open(self) -> None:
+        if self._redis is None:
+            try:
+                import redis.asyncio as aioredis
+            except ImportError:
+                raise RuntimeError("TASK_STORE_BACKEND=redis requires the 'redis' package")
+            self._redis = aioredis.from_url(self.url, decode_responses=True)
+            logger.info("Redis task store opened")
+
+    async def close(self) -> None:
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    def _key(self, task_id: str) -> str:
+        return f"{self.prefix}task:{task_id}"
+
+    def _index(self, status: Optional[str] = None) -> str:
+        return f"{self.prefix}tasks:status:{status}" if status else f"{self.prefix}tasks:created"
+
+    async def create(self, record: Dict[str, Any]) -> None:
+        fields = {k: json.dumps(record.get(k)) for k in TASK_FIELDS}
+        created_at = record.get("created_at") or time.time()
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self._key(record["id"]), mapping=fields)
+            pipe.zadd(self._index(), {record["id"]: created_at})
+            if record.get("status"):
+                pipe.zadd(self._index(record["status"]), {record["id"]: created_at})
+            await pipe.execute()
+
+    async def update_result(self, task_id: str, result: Dict[str, Any]) -> None:
+        key = self._key(task_id)
+        old_status, created_at = await self._redis.hmget(key, "status", "created_at")
+        if created_at is None:
+            return
+        summary = summarize_result(result)
+        fields = {
+            "status": json.dumps(summary["status"]),
+            "error": json.dumps(summary["error"]),
+            "updated_at": json.dumps(time.time()),
+            "result": json.dumps(result)
+        }
+        if summary["video_url"]:
+            fields["video_url"] = json.dumps(summary["video_url"])
+        old_status = json.loads(old_status) if old_status else None
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.hset(key, mapping=fields)
+            if old_status != summary["status"]:
+                if old_status:
+                    pipe.zrem(self._index(old_status), task_id)
+                if summary["status"]:
+                    pipe.zadd(self._index(summary["status"]), {task_id: json.loads(created_at) or 0})
+            await pipe.execute()
+
+    def _decode(self, raw: Dict[str, str]) -> Dict[str, Any]:
+        return {k: json.loads(v) for k, v in raw.items()}
+
+    async def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        raw = await self._redis.hgetall(self._key(task_id))
+        if not raw:
+            return None
+        record = self._decode(raw)
+        record.setdefault("result", None)
+        return record
+
+    async def list(
+        self,
+        page: int,
+        page_size: int,
+        status: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        index = self._index(status)
+        start = (page - 1) * page_size
+        total = await self._redis.zcard(index)
+        task_ids = await self._redis.zrevrange(index, start, start + page_size - 1)
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for task_id in task_ids:
+                pipe.hmget(self._key(task_id), *TASK_FIELDS)
+            rows = await pipe.execute()
+        items = [
+            {k: json.loads(v) if v is not None else None for k, v in zip(TASK_FIELDS, row)}
+            for row in rows if row and row[0] is not None
+        ]
+        return items, total
+
+    async def known(self, task_ids: List[str]) -> Set[str]:
+        if not task_ids:
+            return set()
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for task_id in task_ids:
+                pipe.exists(self._key(task_id))
+            found = await pipe.execute()
+        return {task_id for task_id, exists in zip(task_ids, found) if exists}
+
+    async def stale(self, before: float, statuses: Iterable[str], limit: int) -> List[str]:
+        task_ids: List[str] = []
+        for status in statuses:
+            task_ids.extend(await self._redis.zrangebyscore(
+                self._index(status), "-inf", f"({before}", start=0, num=limit - len(task_ids)
+            ))
+            if len(task_ids) >= limit:
+                break
+        return task_ids
+
+    async def delete(self, task_ids: List[str]) -> None:
+        if not task_ids:
+            return
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for task_id in task_ids:
+                pipe.hget(self._key(task_id), "status")
+            statuses = await pipe.execute()
+        async with self._redis.pipeline(transaction=True) as pipe:
+            for task_id, status in zip(task_ids, statuses):
+                pipe.delete(self._key(task_id))
+                pipe.zrem(self._index(), task_id)
+                if status:
+                    pipe.zrem(self._index(json.loads(status)), task_id)
+            await pipe.execute()
+
+    def _submission_key(self, local_id: str) -> str:
+        return f"{self.prefix}submission:{local_id}"
+
+    async def save_submission(self, submission: Dict[str, Any]) -> None:
+        fields = {k: json.dumps(submission.get(k)) for k in SUBMISSION_FIELDS}
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self._submission_key(submission["id"]), mapping=fields)
+            pipe.zadd(f"{self.prefix}submissions:queued", {submission["id"]: submission["created_at"]})
+            await pipe.execute()
+
+    async def get_submission(self, local_id: str) -> Optional[Dict[str, Any]]:
+        raw = await self._redis.hgetall(self._submission_key(local_id))
+        return self._decode(raw) if raw else None
+
+    async def claim_submission(self, local_id: str) -> bool:
+        # Only one worker removes the id from the queued set
+        return bool(await self._redis.zrem(f"{self.prefix}submissions:queued", local_id))
+
+    async def settle_submission(
+        self,
+        local_id: str,
+        status: str,
+        upstream_id: Optional[str],
+        error: Optional[str],
+        retention: float
+    ) -> None:
+        key = self._submission_key(local_id)
+        fields = {
+            "status": json.dumps(status),
+            "upstream_id": json.dumps(upstream_id),
+            "error": json.dumps(error),
+            "settled_at": json.dumps(time.time()),
+            "payload": json.dumps(None)
+        }
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.hset(key, mapping=fields)
+            pipe.expire(key, max(1, int(retention)))
+            await pipe.execute()
+
+    async def queued_submissions(self, limit: int) -> List[Dict[str, Any]]:
+        local_ids = await self._redis.zrange(f"{self.prefix}submissions:queued", 0, limit - 1)
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for local_id in local_ids:
+                pipe.hgetall(self._submission_key(local_id))
+            rows = await pipe.execute()
+        return [self._decode(raw) for raw in rows if raw]
+
+
+def create_task_store(settings) -> TaskStore:
+    """Build the task store selected by TASK_STORE_BACKEND"""
+    backend = settings.TASK_STORE_BACKEND.lower()
+    if backend == "sqlite":
+        return SQLiteTaskStore(settings.TASK_STORE_PATH)
+    if backend == "redis":
+        return RedisTaskStore(settings.REDIS_URL)
+    raise ValueError(f"Unsupported TASK_STORE_BACKEND: {settings.TASK_STORE_BACKEND}")
@@ -0,0 +1,249 @@
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from typing import Optional, Dict, Any, Callable, Awaitable, TypeVar
+
+import httpx
+
+from app.utils.rate_limit import TokenBucket
+from app.utils.deadline import DeadlineExceeded, enforce_deadline, remaining
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Outcomes reported back to the limiter and breaker
+SUCCESS = "success"
+OVERLOAD = "overload"      # 429 / timeout: upstream wants less traffic
+FAILURE = "failure"        # 5xx / connection error
+CLIENT_ERROR = "client_error"
+
+
+class CircuitOpenError(Exception):
+    """Upstream circuit breaker is open; calls fail fast"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Upstream temporarily unavailable, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+def classify(error: Optional[BaseException]) -> str:
+    """Map an upstream call result to a limiter/breaker outcome"""
+    if error is None:
+        return SUCCESS
+    if isinstance(error, httpx.HTTPStatusError):
+        code = error.response.status_code
+        if code == 429:
+            return OVERLOAD
+        if code >= 500:
+            return FAILURE
+        return CLIENT_ERROR
+    if isinstance(error, httpx.TimeoutException):
+        return OVERLOAD
+    if isinstance(error, httpx.TransportError):
+        return FAILURE
+    return CLIENT_ERROR
+
+
+class AIMDLimiter:
+    """
+    Adaptive concurrency limit
+
+    Grows additively (about +1 per limit's worth of successes) and shrinks
+    multiplicatively on overload signals, bounded by [minimum, maximum].
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int, decrease: float):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.inflight = 0
+        self._waiters: deque = deque()
+
+    async def acquire(self) -> None:
+        if self.inflight < int(self.limit) and not self._waiters:
+            self.inflight += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Slot was handed over just as we were cancelled: give it back
+                self.release(None)
+            else:
+                self._waiters.remove(future)
+            raise
+
+    def release(self, outcome: Optional[str]) -> None:
+        self.inflight -= 1
+        if outcome == SUCCESS:
+            self.limit = min(self.maximum, self.limit + 1.0 / max(self.limit, 1.0))
+        elif outcome == OVERLOAD:
+            self.limit = max(self.minimum, self.limit * self.decrease)
+        while self._waiters and self.inflight < int(self.limit):
+            future = self._waiters.popleft()
+            if not future.done():
+                self.inflight += 1
+                future.set_result(None)
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures and rejects calls for
+    cooldown seconds; then lets a single trial call through (half-open).
+    """
+
+    def __init__(self, failure_threshold: int, cooldown: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def before_call(self) -> None:
+        state = self.state
+        if state == "open":
+            raise CircuitOpenError(self.cooldown - (time.monotonic() - self.opened_at))
+        if state == "half_open":
+            if self._trial_running:
+                raise CircuitOpenError(1.0)
+            self._trial_running = True
+
+    def abandon_trial(self) -> None:
+        self._trial_running = False
+
+    def record(self, outcome: str) -> None:
+        self._trial_running = False
+        if outcome in (SUCCESS, CLIENT_ERROR):
+            self.failures = 0
+            self.opened_at = None
+            return
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning("Upstream circuit opened after %s consecutive failures", self.failures)
+            self.opened_at = time.monotonic()
+
+
+class UpstreamGuard:
+    """
+    Shared protection in front of every Ark call
+
+    Each attempt passes the circuit breaker, takes a token from the request
+    rate bucket and a slot from the adaptive concurrency limiter. Idempotent
+    calls are retried with jittered exponential backoff on 429, 5xx and
+    transport errors.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int,
+        concurrency_initial: int,
+        concurrency_min: int,
+        concurrency_max: int,
+        concurrency_decrease: float,
+        failure_threshold: int,
+        cooldown: float,
+        max_retries: int,
+        retry_base_delay: float,
+        retry_max_delay: float,
+        bucket=None
+    ):
+        # bucket: shared budget (e.g. RedisTokenBucket) instead of a local one
+        self.bucket = bucket or TokenBucket(rate=rate, capacity=burst)
+        self.limiter = AIMDLimiter(concurrency_initial, concurrency_min, concurrency_max, concurrency_decrease)
+        self.breaker = CircuitBreaker(failure_threshold, cooldown)
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.counters = {"calls": 0, "retries": 0, "rejected": 0, "overloads": 0, "failures": 0}
+
+    async def call(self, fn: Callable[[], Awaitable[T]], idempotent: bool) -> T:
+        """
+        Run fn under the guard
+
+        Waiting for capacity and retries stop at the request deadline.
+
+        Raises:
+            CircuitOpenError: Breaker is open
+            DeadlineExceeded: Request deadline passed
+            Exception: Whatever fn raised on its final attempt
+        """
+        attempt = 0
+        while True:
+            try:
+                self.breaker.before_call()
+            except CircuitOpenError:
+                self.counters["rejected"] += 1
+                raise
+
+            try:
+                async with enforce_deadline():
+                    await self.bucket.acquire()
+                    await self.limiter.acquire()
+            except (asyncio.CancelledError, DeadlineExceeded):
+                self.breaker.abandon_trial()
+                raise
+            self.counters["calls"] += 1
+            try:
+                result = await fn()
+            except (asyncio.CancelledError, DeadlineExceeded):
+                # The caller gave up; says nothing about upstream health
+                self.breaker.abandon_trial()
+                self.limiter.release(None)
+                raise
+            except Exception as e:
+                outcome = classify(e)
+                self.breaker.record(outcome)
+                self.limiter.release(outcome)
+                if outcome == OVERLOAD:
+                    self.counters["overloads"] += 1
+                elif outcome == FAILURE:
+                    self.counters["failures"] += 1
+
+                if not (idempotent and attempt < self.max_retries and outcome in (OVERLOAD, FAILURE)):
+                    raise
+                attempt += 1
+                self.counters["retries"] += 1
+                delay = self._retry_delay(attempt, e)
+                left = remaining()
+                if left is not None and left <= delay:
+                    raise
+                logger.warning("Upstream call failed, retrying in %.2fs - attempt: %s, error: %s", delay, attempt, e)
+                await asyncio.sleep(delay)
+                continue
+
+            self.breaker.record(SUCCESS)
+            self.limiter.release(SUCCESS)
+            return result
+
+    def _retry_delay(self, attempt: int, error: BaseException) -> float:
+        delay = min(self.retry_max_delay, self.retry_base_delay * (2 ** (attempt - 1)))
+        if isinstance(error, httpx.HTTPStatusError):
+            retry_after = error.response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                delay = min(self.retry_max_delay, max(delay, float(retry_after)))
+        return delay * random.uniform(0.5, 1.0)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "concurrency_limit": round(self.limiter.limit, 2),
+            "inflight": self.limiter.inflight,
+            "circuit": self.breaker.state
+        }
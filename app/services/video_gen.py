@@ -1,15 +1,46 @@
-import os
-import time  
+import time
+import asyncio
 import logging
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, AsyncIterator, Tuple, Set
 import httpx
-from byteplussdkarkruntime import Ark
 
 from app.config import settings
+from app.services.task_cache import TaskCache, is_terminal
+from app.services.task_poller import TaskPoller
+from app.services.task_store import create_task_store
+from app.services.reconciler import TaskReconciler
+from app.services.webhook import WebhookDispatcher
+from app.services.artifact_cache import ArtifactCache
+from app.services.image_preprocess import ImagePreprocessor, ImageProcessingError
+from app.services.upstream_guard import CircuitOpenError, classify, OVERLOAD, FAILURE
+from app.services.providers import (
+    VideoProvider, ProviderRouter, GenerationOptions, create_providers, make_task_id, LEGACY_PROVIDER
+)
+from app.services.estimator import CompletionEstimator
+from app.services.dedupe import SubmissionDeduper, DuplicateRequestMismatch, fingerprint_request, idempotency_scope
+from app.services.admission import AdmissionController, QueueFullError, LOCAL_ID_PREFIX
+from app.services.shared_state import SharedState
+from app.utils.metrics import observe_task_terminal
+from app.utils.http import ssl_context
+from app.utils.logger import ROUTINE, bind_task_id, get_log_stats
+from app.utils.trace import get_trace_stats
+from app.utils.deadline import (
+    DeadlineExceeded, enforce_deadline, expired as deadline_expired, remaining as deadline_remaining
+)
+from app.utils.startup import startup_timer
 
 
 logger = logging.getLogger(__name__)
 
+# Seconds clients are asked to wait when the admission queue is full
+QUEUE_FULL_RETRY_AFTER = 5.0
+
+# Seconds of a request deadline a long-poll leaves for its final status lookup
+LONG_POLL_DEADLINE_RESERVE = 0.5
+
+# Workers starting within this many seconds of each other leave queue recovery to the first
+ADMISSION_RECOVER_LEASE_SECONDS = 60.0
+
 
 class VideoGenError(Exception):
     """Base exception class for video generation service"""
@@ -31,91 +62,719 @@ class VideoGenerationError(VideoGenError):
     pass
 
 
+class TaskNotReadyError(VideoGenError):
+    """Task has not produced a result yet"""
+    pass
+
+
+class TaskNotFoundError(VideoGenError):
+    """No such task"""
+    pass
+
+
+class UpstreamUnavailableError(APIConnectionError):
+    """Upstream is being shed by the circuit breaker"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class DeadlineExceededError(APIConnectionError):
+    """The request deadline passed before the upstream answered"""
+    pass
+
+
+class ServiceBusyError(APIConnectionError):
+    """Admission queue is full; the client should retry later"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
 class VideoGenService:
     def __init__(self):
         try:
-            self.base_url = "https://ark.ap-southeast.bytepluses.com/api/v3"
-            self.api_key = settings.BYTEDANCE_ARK_API_KEY
             self.model_id = settings.BYTEDANCE_MODEL_ID
-            self.client = Ark(
-                    # This is the default path. You can configure it based on the service location
-                    base_url=self.base_url,
-                    # Get your Key authentication from the environment variable. This is the default mode and you can modify it as required
-                    api_key=settings.BYTEDANCE_ARK_API_KEY,
-                )
+            # Client for result files and reference images: third-party URLs must not get provider keys
+            self._media_http: Optional[httpx.AsyncClient] = None
+            self._opened = False
+            # Budgets and fresh task results shared by all worker processes
+            self.shared = SharedState(
+                backend=settings.SHARED_STATE_BACKEND,
+                redis_url=settings.REDIS_URL,
+                workers=settings.WEB_CONCURRENCY
+            )
+            # Each provider has its own pooled client and upstream guard; clients are built on first use
+            self.providers: Dict[str, VideoProvider] = create_providers(
+                settings, self._media_client, self.shared
+            )
+            self.routing = ProviderRouter(
+                self.providers,
+                default_queue_seconds=settings.ROUTING_DEFAULT_QUEUE_SECONDS,
+                error_penalty=settings.ROUTING_ERROR_PENALTY,
+                cost_weight=settings.ROUTING_COST_WEIGHT,
+                alpha=settings.ROUTING_EWMA_ALPHA
+            )
+            self.estimator = CompletionEstimator(
+                default_seconds_per_second=settings.ESTIMATE_DEFAULT_SECONDS_PER_VIDEO_SECOND,
+                decay=settings.ESTIMATE_DECAY
+            )
+            self.task_cache = TaskCache(
+                ttl=settings.TASK_CACHE_TTL_SECONDS,
+                max_entries=settings.TASK_CACHE_MAX_ENTRIES,
+                max_terminal_entries=settings.TASK_CACHE_MAX_TERMINAL_ENTRIES
+            )
+            self.poller = TaskPoller(
+                fetch_many=self._fetch_tasks_batch,
+                fetch_one=self._fetch_task,
+                min_interval=settings.TASK_POLLER_MIN_INTERVAL,
+                max_interval=settings.TASK_POLLER_MAX_INTERVAL,
+                backoff=settings.TASK_POLLER_BACKOFF,
+                batch_size=settings.TASK_POLLER_BATCH_SIZE,
+                max_track_seconds=settings.TASK_POLLER_MAX_TRACK_SECONDS,
+                watch_interval=settings.TASK_WATCH_INTERVAL
+            )
+            self.poller.add_listener(self._on_task_update)
+            self.task_store = create_task_store(settings)
+            self.webhooks = WebhookDispatcher(
+                db_path=settings.WEBHOOK_DB_PATH,
+                secret=settings.WEBHOOK_SECRET,
+                concurrency=settings.WEBHOOK_CONCURRENCY,
+                max_attempts=settings.WEBHOOK_MAX_ATTEMPTS,
+                backoff_base=settings.WEBHOOK_BACKOFF_BASE,
+                backoff_max=settings.WEBHOOK_BACKOFF_MAX,
+                timeout=settings.WEBHOOK_TIMEOUT
+            )
+            self._background: set = set()
+            self.artifacts = ArtifactCache(
+                directory=settings.VIDEO_CACHE_DIR,
+                max_bytes=settings.VIDEO_CACHE_MAX_BYTES
+            )
+            self.images = ImagePreprocessor(
+                cache_dir=settings.IMAGE_CACHE_DIR,
+                target_resolution=settings.IMAGE_TARGET_RESOLUTION,
+                mode=settings.IMAGE_PREPROCESS_MODE,
+                image_format=settings.IMAGE_FORMAT,
+                quality=settings.IMAGE_QUALITY,
+                max_bytes=settings.IMAGE_MAX_BYTES,
+                workers=settings.IMAGE_WORKERS,
+                cache_max_bytes=settings.IMAGE_CACHE_MAX_BYTES
+            )
+            self.deduper = SubmissionDeduper(max_entries=settings.DEDUPE_MAX_ENTRIES, shared=self.shared)
+            self.batch_bucket = self.shared.token_bucket(
+                "batch", settings.BATCH_RATE_PER_SECOND, settings.BATCH_RATE_BURST
+            )
+            self.admission = AdmissionController(
+                dispatch=self._dispatch_queued,
+                # Queues are per worker; each takes its share of the global slot limit
+                max_active=self.shared.local_share(settings.ADMISSION_MAX_ACTIVE_TASKS),
+                max_queue=settings.ADMISSION_MAX_QUEUE,
+                tenant_weights=settings.ADMISSION_TENANT_WEIGHTS,
+                active_timeout=settings.TASK_POLLER_MAX_TRACK_SECONDS,
+                store=self.task_store,
+                retention=settings.ADMISSION_ID_RETENTION_SECONDS
+            )
+            idle_seconds = settings.RECONCILE_IDLE_SECONDS
+            if idle_seconds > 0 and not self.shared.shared and self.shared.workers > 1:
+                # Each worker would only see its own clients' interest
+                logger.warning("RECONCILE_IDLE_SECONDS needs SHARED_STATE_BACKEND=redis with several workers, disabled")
+                idle_seconds = 0.0
+            self.reconciler = TaskReconciler(
+                providers=self.providers,
+                task_store=self.task_store,
+                shared=self.shared,
+                bucket=self.shared.token_bucket("reconcile", settings.RECONCILE_RATE_PER_SECOND, 1),
+                apply_result=self._on_task_update,
+                forget=self._forget_tasks,
+                client_interest=self._client_interest,
+                interval=settings.RECONCILE_INTERVAL_SECONDS,
+                page_size=settings.RECONCILE_PAGE_SIZE,
+                max_pages=settings.RECONCILE_MAX_PAGES,
+                max_load=settings.RECONCILE_MAX_LOAD,
+                max_age=settings.RECONCILE_MAX_TASK_AGE_SECONDS,
+                idle_seconds=idle_seconds,
+                cancel_unknown=settings.RECONCILE_CANCEL_UNKNOWN,
+                purge_after=settings.RECONCILE_PURGE_AFTER_SECONDS
+            )
             logger.info("VideoGenService initialized successfully")
         except Exception as e:
-            logger.error(f"VideoGenService initialization failed: {str(e)}")
-            raise APIConnectionError(f"Failed to initialize ByteDance Ark client: {str(e)}")
-        
+            logger.error("VideoGenService initialization failed: %s", e)
+            raise APIConnectionError(f"Failed to initialize video providers: {str(e)}")
+
+    async def startup(self) -> None:
+        """Open shared state and the task store and start background work"""
+        if not self._opened:
+            with startup_timer.phase("shared_state"):
+                await self.shared.open()
+            with startup_timer.phase("task_store"):
+                await self.task_store.open()
+            if not settings.HTTP_CLIENTS_LAZY:
+                with startup_timer.phase("http_clients"):
+                    self._media_client()
+                    for provider in self.providers.values():
+                        await provider.open()
+            self._opened = True
+        with startup_timer.phase("background"):
+            if settings.TASK_POLLER_ENABLED:
+                await self.poller.start()
+            if settings.WEBHOOK_ENABLED:
+                await self.webhooks.start()
+                # Resume watching tasks whose callbacks were still pending at shutdown
+                for task_id in await self.webhooks.pending_task_ids():
+                    self.poller.register(task_id)
+            if settings.ADMISSION_ENABLED:
+                await self.admission.start()
+                # Submissions still queued when the service last stopped; one worker takes them over
+                if await self.shared.acquire_lease("admission-recover", ADMISSION_RECOVER_LEASE_SECONDS):
+                    try:
+                        await self.admission.recover()
+                    finally:
+                        await self.shared.release_lease("admission-recover")
+            if settings.RECONCILE_ENABLED:
+                await self.reconciler.start()
+
+    def _media_client(self) -> httpx.AsyncClient:
+        """The media client, built on first use"""
+        if self._media_http is None:
+            self._media_http = httpx.AsyncClient(
+                timeout=httpx.Timeout(settings.VIDEO_DOWNLOAD_TIMEOUT, connect=settings.ARK_HTTP_CONNECT_TIMEOUT),
+                follow_redirects=True,
+                verify=ssl_context()
+            )
+        return self._media_http
+
+    async def shutdown(self, drain_timeout: Optional[float] = None) -> None:
+        """
+        Stop background work, then close the pooled upstream HTTP clients
+
+        Queued dispatches, registry and webhook writes and upstream calls
+        still in flight get up to drain_timeout seconds (no limit if None)
+        to finish before clients are closed; anything left is cancelled.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if drain_timeout is None else loop.time() + drain_timeout
+
+        def remaining() -> Optional[float]:
+            return None if deadline is None else max(0.0, deadline - loop.time())
+
+        await self.reconciler.stop()
+        await self.admission.stop(timeout=remaining())
+        await self.poller.stop()
+        if self._background:
+            logger.info("Draining background work - pending: %s", len(self._background))
+            _, pending = await asyncio.wait(set(self._background), timeout=remaining())
+            for task in pending:
+                task.cancel()
+            if pending:
+                logger.warning("Cancelled %s background tasks after drain timeout", len(pending))
+        while any(p.guard.limiter.inflight for p in self.providers.values()):
+            if remaining() == 0.0:
+                logger.warning("Closing upstream clients with calls still in flight")
+                break
+            await asyncio.sleep(0.05)
+        if settings.WEBHOOK_ENABLED:
+            await self.webhooks.stop()
+        await self.task_store.close()
+        self.images.shutdown()
+        for provider in self.providers.values():
+            await provider.close()
+        if self._media_http is not None:
+            await self._media_http.aclose()
+            self._media_http = None
+        await self.shared.close()
+        self._opened = False
+
+    def _on_task_update(self, task_id: str, result: Dict[str, Any]) -> None:
+        """Record a fresh upstream result: cache, task registry and completion hooks"""
+        previous = self.task_cache.get(task_id)
+        self.task_cache.put(task_id, result)
+        if self.shared.shared:
+            ttl = settings.SHARED_TASK_RESULT_TTL_SECONDS if is_terminal(result) else settings.TASK_CACHE_TTL_SECONDS
+            self._spawn(self.shared.put_result(task_id, result, ttl))
+        if previous is None or previous.get("status") != result.get("status"):
+            self._spawn(self._store_result(task_id, result))
+            if result.get("status") != "queued":
+                self.routing.task_started(task_id)
+            if is_terminal(result):
+                observe_task_terminal(result)
+                self.estimator.task_finished(task_id, result)
+                self.admission.task_finished(task_id)
+        if is_terminal(result) and settings.WEBHOOK_ENABLED:
+            self._spawn(self.webhooks.task_finished(task_id, result))
+
+    async def _store_result(self, task_id: str, result: Dict[str, Any]) -> None:
+        try:
+            await self.task_store.update_result(task_id, result)
+        except Exception as e:
+            logger.warning("Task store update failed - task_id: %s, error: %s", task_id, e)
+
+    def _note_interest(self, task_id: str) -> None:
+        """A client asked about the task: it is not abandoned"""
+        if self.reconciler.touch(task_id):
+            self._spawn(self.shared.mark_interest(task_id, self.reconciler.idle_seconds))
+
+    async def _client_interest(self, task_ids: List[str]) -> Set[str]:
+        """Tasks with a long-poll/SSE waiter on this worker or a pending webhook"""
+        interested = {task_id for task_id in task_ids if self.poller.is_watched(task_id)}
+        if settings.WEBHOOK_ENABLED:
+            interested.update(set(task_ids).intersection(await self.webhooks.pending_task_ids()))
+        return interested
+
+    async def _forget_tasks(self, task_ids: List[str]) -> None:
+        """Drop purged tasks from in-process state and the video cache"""
+        for task_id in task_ids:
+            self.task_cache.invalidate(task_id)
+            self.poller.unregister(task_id)
+
+        def remove_files() -> None:
+            for task_id in task_ids:
+                self.artifacts.remove(task_id)
+
+        await asyncio.to_thread(remove_files)
+
+    def _spawn(self, coro) -> None:
+        # Keep a reference so the task is not garbage collected mid-flight
+        task = asyncio.ensure_future(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Upstream connection usage, routing and task cache counters"""
+        return {
+            **{f"upstream_{name}": provider.get_stats() for name, provider in self.providers.items()},
+            "routing": self.routing.get_stats(),
+            "estimator": self.estimator.get_stats(),
+            "task_cache": self.task_cache.get_stats(),
+            "poller": self.poller.get_stats(),
+            "webhooks": self.webhooks.get_stats(),
+            "dedupe": self.deduper.get_stats(),
+            "admission": self.admission.get_stats(),
+            "shared_state": self.shared.get_stats(),
+            "video_cache": self.artifacts.get_stats(),
+            "images": self.images.get_stats(),
+            "reconciler": self.reconciler.get_stats(),
+            "logging": get_log_stats(),
+            "tracing": get_trace_stats()
+        }
+
     async def create_video_task(
         self, 
-        content: List[Dict[str, Any]]
+        content: List[Dict[str, Any]],
+        callback_url: Optional[str] = None,
+        idempotency_key: Optional[str] = None,
+        tenant: Optional[str] = None,
+        priority: Optional[str] = None,
+        options: Optional[GenerationOptions] = None,
+        preview: Optional[bool] = None
     ) -> Dict[str, Any]:
         """
         Create video generation task
         
         Args:
-            model: Model ID
             content: Content array with text and optional image
+            callback_url: Optional URL that receives the final result via POST
+            idempotency_key: Optional client key; repeats return the original task
+            tenant: Caller identity (API key) for fair queuing
+            priority: Admission priority class (interactive, standard, batch)
+            options: Duration, resolution, ratio and audio; unset ones use provider defaults
+            preview: Also create a short low-resolution preview task; None decides
+                automatically (interactive priority and a long expected wait)
             
         Returns:
-            Task creation result with task ID
+            Task creation result with task ID and an "estimate" of latency and
+            cost; with the admission queue enabled, a local task ID with status
+            "queued". A preview task's own result is under "preview".
             
         Raises:
             InvalidParameterError: Parameter validation failed
             APIConnectionError: API connection failed
             VideoGenerationError: Video generation failed
         """
+        options = options or GenerationOptions()
+        priority = priority or settings.ADMISSION_DEFAULT_PRIORITY
         # Parameter validation
+        self._validate_request(content, callback_url, options)
+
+        preview_options = self._preview_options(options, priority, preview)
+        preview_result = None
+        if preview_options is not None:
+            try:
+                # Best effort and never sent to callback_url: the full task is what the client waits for
+                preview_result = await self._create_deduplicated(
+                    content, None, f"{idempotency_key}:preview" if idempotency_key else None,
+                    tenant=tenant, priority="interactive", options=preview_options
+                )
+            except VideoGenError as e:
+                logger.warning("Preview task creation failed, creating the full task only: %s", e)
+
+        result = await self._create_deduplicated(
+            content, callback_url, idempotency_key, tenant=tenant, priority=priority, options=options
+        )
+        if preview_result is not None:
+            result = {**result, "preview": preview_result}
+        return result
+
+    def _preview_options(
+        self,
+        options: GenerationOptions,
+        priority: str,
+        preview: Optional[bool]
+    ) -> Optional[GenerationOptions]:
+        """Options for a preview task ahead of the full one, or None when no preview is wanted"""
+        if preview is False or (preview is None and (priority != "interactive" or settings.PREVIEW_AUTO_SECONDS <= 0)):
+            return None
+        provider = self.routing.rank(options)[0]
+        resolved = provider.resolve(options)
+        if preview is None and self.estimator.estimate(provider, resolved)["latency_seconds"] <= settings.PREVIEW_AUTO_SECONDS:
+            return None
+        preview_options = provider.capabilities.preview(resolved, settings.PREVIEW_DURATION)
+        if provider.resolve(preview_options) == resolved:
+            # The model offers nothing quicker than what was asked for
+            return None
+        return preview_options
+
+    async def create_video_tasks_batch(
+        self,
+        items: List[Dict[str, Any]],
+        tenant: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Create many video generation tasks with bounded upstream concurrency
+
+        Every item is validated before anything is sent upstream. Valid items
+        are then submitted concurrently (at most BATCH_CONCURRENCY at a time,
+        paced by a token bucket); one item failing does not affect the others.
+
+        Args:
+            items: Dicts with "content" and optional "callback_url" / "priority" / "options"
+            tenant: Caller identity (API key) for fair queuing
+
+        Returns:
+            One entry per item, in order: {"index", "ok", "data"} on success
+            or {"index", "ok", "error", "error_type"} on failure
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+        valid = []
+        for index, item in enumerate(items):
+            try:
+                self._validate_request(item["content"], item.get("callback_url"), item.get("options"))
+                valid.append(index)
+            except InvalidParameterError as e:
+                results[index] = {"index": index, "ok": False, "error": str(e), "error_type": "invalid_parameter"}
+
+        semaphore = asyncio.Semaphore(settings.BATCH_CONCURRENCY)
+
+        async def submit(index: int) -> None:
+            async with semaphore:
+                if not settings.ADMISSION_ENABLED:
+                    # Queued submissions are paced by the admission controller instead
+                    await self.batch_bucket.acquire()
+                try:
+                    data = await self._create_deduplicated(
+                        items[index]["content"], items[index].get("callback_url"),
+                        tenant=tenant, priority=items[index].get("priority") or settings.ADMISSION_BATCH_PRIORITY,
+                        options=items[index].get("options")
+                    )
+                    results[index] = {"index": index, "ok": True, "data": data}
+                except APIConnectionError as e:
+                    results[index] = {"index": index, "ok": False, "error": str(e), "error_type": "api_connection"}
+                except VideoGenError as e:
+                    results[index] = {"index": index, "ok": False, "error": str(e), "error_type": "generation"}
+
+        await asyncio.gather(*(submit(index) for index in valid))
+        logger.info("Batch task creation finished - total: %s, submitted: %s", len(items), len(valid))
+        return results
+
+    async def _create_deduplicated(
+        self,
+        content: List[Dict[str, Any]],
+        callback_url: Optional[str],
+        idempotency_key: Optional[str] = None,
+        tenant: Optional[str] = None,
+        priority: Optional[str] = None,
+        options: Optional[GenerationOptions] = None
+    ) -> Dict[str, Any]:
+        """Submit (or queue) a validated task unless an identical recent submission exists"""
+        options = options or GenerationOptions()
+        # Requests without options hash exactly as before they existed
+        params = {
+            "duration": options.duration or settings.VIDEO_DEFAULT_DURATION,
+            "generate_audio": settings.VIDEO_DEFAULT_GENERATE_AUDIO if options.generate_audio is None else options.generate_audio
+        }
+        params.update((name, value) for name, value in (("resolution", options.resolution), ("ratio", options.ratio)) if value)
+        fingerprint = fingerprint_request(content, model=self.model_id, **params)
+
+        async def submit() -> Dict[str, Any]:
+            if settings.ADMISSION_ENABLED:
+                return await self._enqueue(content, callback_url, fingerprint, tenant, priority, options)
+            return await self._submit_unique(content, callback_url, fingerprint, options)
+
+        if not idempotency_key:
+            return await submit()
+        try:
+            return await self.deduper.run(
+                idempotency_scope(tenant, idempotency_key), fingerprint, settings.IDEMPOTENCY_TTL_SECONDS, submit
+            )
+        except DuplicateRequestMismatch as e:
+            raise InvalidParameterError(str(e))
+
+    async def _submit_unique(
+        self,
+        content: List[Dict[str, Any]],
+        callback_url: Optional[str],
+        fingerprint: str,
+        options: GenerationOptions
+    ) -> Dict[str, Any]:
+        if settings.DEDUPE_ENABLED:
+            # The first submission's callback_url wins for reused tasks
+            return await self.deduper.run(
+                f"content:{fingerprint}", fingerprint, settings.DEDUPE_WINDOW_SECONDS,
+                lambda: self._submit_task(content, callback_url, options)
+            )
+        return await self._submit_task(content, callback_url, options)
+
+    async def _enqueue(
+        self,
+        content: List[Dict[str, Any]],
+        callback_url: Optional[str],
+        fingerprint: str,
+        tenant: Optional[str],
+        priority: Optional[str],
+        options: GenerationOptions
+    ) -> Dict[str, Any]:
+        """Hand a validated task to the admission queue; returns its local result"""
+        try:
+            result = await self.admission.submit(
+                {"content": content, "callback_url": callback_url, "fingerprint": fingerprint, "options": options.to_dict()},
+                tenant=tenant or "anonymous",
+                priority=priority or settings.ADMISSION_DEFAULT_PRIORITY
+            )
+        except QueueFullError as e:
+            logger.warning("Admission queue full, request rejected - tenant: %s", tenant)
+            raise ServiceBusyError(str(e), retry_after=QUEUE_FULL_RETRY_AFTER)
+        # Upstream time only; the wait in the local queue comes on top
+        provider = self.routing.rank(options)[0]
+        return {**result, "estimate": self.estimator.estimate(provider, provider.resolve(options))}
+
+    async def _dispatch_queued(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Admission controller callback: send a queued task upstream"""
+        result = await self._submit_unique(
+            payload["content"], payload["callback_url"], payload["fingerprint"], GenerationOptions(**payload["options"])
+        )
+        # Deduplication can hand back a task that already finished; its status never changes
+        # again, so report it as finished and the admission controller does not hold a slot for it
+        finished = await self._finished_result(result.get("id"))
+        if finished is not None:
+            return {**result, "status": finished["status"]}
+        return result
+
+    async def _finished_result(self, task_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """The terminal result of task_id from the task cache or registry, if it is known to have finished"""
+        if not task_id:
+            return None
+        cached = self.task_cache.get(task_id)
+        if cached is not None:
+            return cached if is_terminal(cached) else None
+        try:
+            record = await self.task_store.get(task_id)
+        except Exception as e:
+            logger.warning("Task store lookup failed - task_id: %s, error: %s", task_id, e)
+            return None
+        if record and record.get("result") and is_terminal(record["result"]):
+            return record["result"]
+        return None
+
+    def _validate_request(
+        self,
+        content: List[Dict[str, Any]],
+        callback_url: Optional[str],
+        options: Optional[GenerationOptions] = None
+    ) -> None:
         try:
             self._validate_parameters(content)
+            if callback_url and not (callback_url.startswith('http://') or callback_url.startswith('https://')):
+                raise ValueError(f"callback_url must be a valid HTTP/HTTPS URL: {callback_url}")
+            if options is not None:
+                self._validate_options(options)
         except ValueError as e:
-            logger.error(f"Parameter validation failed: {str(e)}")
+            logger.error("Parameter validation failed: %s", e)
             raise InvalidParameterError(str(e))
-        
-        # Call API to create task
+
+    def _validate_options(self, options: GenerationOptions) -> None:
+        """At least one enabled provider's model must accept the requested options"""
+        errors = []
+        for provider in self.providers.values():
+            error = provider.capabilities.check(options)
+            if error is None:
+                return
+            errors.append(f"{provider.name}: {error}" if len(self.providers) > 1 else error)
+        raise ValueError("; ".join(errors))
+
+    async def _submit_task(
+        self,
+        content: List[Dict[str, Any]],
+        callback_url: Optional[str] = None,
+        options: Optional[GenerationOptions] = None
+    ) -> Dict[str, Any]:
+        """Send an already validated task to the best-ranked provider, failing over on upstream errors"""
+        options = options or GenerationOptions()
+        candidates = self.routing.rank(options)
+        if not candidates:
+            raise InvalidParameterError("No enabled provider supports the requested generation options")
+
+        # Prepared content per frame size, so failover only reprocesses images for a different size
+        prepared: Dict[Optional[Tuple[int, int]], List[Dict[str, Any]]] = {}
+        for attempt, provider in enumerate(candidates):
+            resolved = provider.resolve(options)
+            frame_size = provider.frame_size(resolved)
+            if frame_size not in prepared:
+                prepared[frame_size] = await self._prepare_content(content, frame_size)
+            upstream_content = prepared[frame_size]
+            # Call API to create task
+            try:
+                logger.info("Starting video task creation - provider: %s, model: %s", provider.name, provider.model)
+                result = await provider.create(upstream_content, resolved)
+            except ImageProcessingError as e:
+                # A reference image the provider fetched itself; the request's fault, not the provider's
+                logger.error("Reference image fetch failed - provider: %s, error: %s", provider.name, e)
+                raise InvalidParameterError(str(e))
+            except Exception as e:
+                degraded = isinstance(e, CircuitOpenError) or classify(e) in (OVERLOAD, FAILURE)
+                if degraded:
+                    self.routing.record_create(provider.name, ok=False)
+                if degraded and attempt < len(candidates) - 1:
+                    self.routing.failovers += 1
+                    logger.warning("Provider %s failed, failing over - error: %s", provider.name, e)
+                    continue
+                raise self._upstream_error(e, "video task creation")
+
+            self.routing.record_create(provider.name, ok=True)
+            if not result.get("id"):
+                return result
+            task_id = make_task_id(provider.name, result["id"])
+            result = {**result, "id": task_id}
+            bind_task_id(task_id)
+            logger.info("Video task created successfully - task_id: %s", task_id)
+            try:
+                await self._register_task(task_id, content, provider.model)
+                if callback_url and settings.WEBHOOK_ENABLED:
+                    await self.webhooks.subscribe(task_id, callback_url)
+            except Exception as e:
+                logger.error("Video task registration failed: %s", e)
+                raise VideoGenerationError(f"Error occurred during video task creation: {str(e)}")
+            self.routing.task_submitted(task_id, provider.name)
+            self.estimator.task_submitted(task_id, provider.name, resolved)
+            self.poller.register(task_id)
+            self._note_interest(task_id)
+            return {**result, "estimate": self.estimator.estimate(provider, resolved)}
+
+    def _upstream_error(self, error: Exception, action: str) -> VideoGenError:
+        """Map a provider call failure to the service's exception types"""
+        if isinstance(error, DeadlineExceeded):
+            logger.info("Request deadline exceeded during %s", action)
+            return DeadlineExceededError(f"Request deadline exceeded during {action}")
+        if isinstance(error, CircuitOpenError):
+            logger.warning("Upstream circuit open, request rejected: %s", error)
+            return UpstreamUnavailableError(str(error), error.retry_after)
+        if isinstance(error, httpx.HTTPStatusError):
+            logger.error("API request failed with status %s: %s", error.response.status_code, error.response.text)
+            return APIConnectionError(f"API request failed: {error.response.text}")
+        if isinstance(error, httpx.TimeoutException):
+            logger.error("API request timeout: %s", error)
+            return APIConnectionError(f"API request timeout, please try again later: {str(error)}")
+        logger.error("%s failed: %s", action.capitalize(), error)
+        return VideoGenerationError(f"Error occurred during {action}: {str(error)}")
+
+    def _resolve_provider(self, task_id: str) -> Tuple[VideoProvider, str]:
+        """Split a unified task id into its provider and the provider's own task id"""
+        if task_id.startswith(LOCAL_ID_PREFIX):
+            # Local ids that resolved to an upstream task never get here
+            raise TaskNotFoundError(f"Task not found: {task_id}")
+        name, sep, native_id = task_id.partition(":")
+        if not sep:
+            name, native_id = LEGACY_PROVIDER, task_id
+        provider = self.providers.get(name)
+        if provider is None:
+            raise VideoGenerationError(f"Task belongs to a provider that is not enabled: {name}")
+        return provider, native_id
+
+    async def _prepare_content(
+        self,
+        content: List[Dict[str, Any]],
+        frame_size: Optional[Tuple[int, int]] = None
+    ) -> List[Dict[str, Any]]:
+        """Replace image URLs with inline images fitted to frame_size, when preprocessing is enabled"""
+        if not settings.IMAGE_PREPROCESS_ENABLED:
+            return content
+
+        prepared = []
+        for item in content:
+            url = item.get("image_url", {}).get("url") if item.get("type") == "image_url" else None
+            if not url or url.startswith("data:"):
+                prepared.append(item)
+                continue
+            try:
+                data_url = await self.images.to_data_url(self._media_client(), url, frame_size)
+            except ImageProcessingError as e:
+                logger.error("Image preprocessing failed - url: %s, error: %s", url, e)
+                raise InvalidParameterError(str(e))
+            prepared.append({**item, "image_url": {**item["image_url"], "url": data_url}})
+        return prepared
+
+    async def _register_task(self, task_id: str, content: List[Dict[str, Any]], model: str) -> None:
+        """Add a newly created task to the task registry"""
+        prompt = next((item.get("text") for item in content if item.get("type") == "text"), None)
+        image_url = next(
+            (item.get("image_url", {}).get("url") for item in content if item.get("type") == "image_url"),
+            None
+        )
         try:
-            logger.info(f"Starting video task creation - model: {self.model_id}")
-            
-            # async with httpx.AsyncClient(timeout=30.0) as client:
-            #     response = await client.post(
-            #         f"{self.base_url}/contents/generations/tasks",
-            #         headers={
-            #             "Content-Type": "application/json",
-            #             "Authorization": f"Bearer {self.api_key}"
-            #         },
-            #         json={
-            #             "model": self.model_id,
-            #             "content": content
-            #         }
-            #     )
-            response = self.client.content_generation.tasks.create(
-                model=self.model_id, # Model ID
-                content=content,
-                duration=12,
-                generate_audio=False
-            )
-                
-            logger.info(f"Video task created successfully - task_id: {response.id}")
-            return response
-            
-        except httpx.HTTPStatusError as e:
-            logger.error(f"API request failed with status {e.response.status_code}: {e.response.text}")
-            raise APIConnectionError(f"API request failed: {e.response.text}")
-            
-        except httpx.TimeoutException as e:
-            logger.error(f"API request timeout: {str(e)}")
-            raise APIConnectionError(f"API request timeout, please try again later: {str(e)}")
-            
+            await self.task_store.create({
+                "id": task_id,
+                "model": model,
+                "prompt": prompt,
+                "image_url": image_url,
+                "status": "queued",
+                "created_at": time.time()
+            })
         except Exception as e:
-            logger.error(f"Video task creation failed: {str(e)}")
-            raise VideoGenerationError(f"Error occurred during video task creation: {str(e)}")
-    
+            # The task exists upstream either way; never fail the create over bookkeeping
+            logger.warning("Task store insert failed - task_id: %s, error: %s", task_id, e)
+
+    async def list_tasks(
+        self,
+        page: int = 1,
+        page_size: int = 20,
+        status: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        List tasks from the local task registry, newest first
+
+        Args:
+            page: 1-based page number
+            page_size: Items per page
+            status: Optional status filter
+
+        Returns:
+            The page of task records and the total number of matching tasks
+        """
+        try:
+            return await self.task_store.list(page, page_size, status)
+        except Exception as e:
+            logger.error("Task listing failed: %s", e)
+            raise VideoGenerationError(f"Error occurred during task listing: {str(e)}")
+
     async def query_task(self, task_id: str) -> Dict[str, Any]:
         """
         Query video generation task status
-        
+
+        Live tasks are answered from the background poller's latest snapshot,
+        everything else from the task cache, then from the task registry for
+        finished tasks; concurrent queries for the same task share one
+        upstream request.
+
         Args:
             task_id: Task ID
             
@@ -123,60 +782,229 @@ class VideoGenService:
             Task status and result
             
         Raises:
+            TaskNotFoundError: Unknown local (queued) task id
+            DeadlineExceededError: Request deadline passed
             APIConnectionError: API connection failed
             VideoGenerationError: Query failed
         """
-        try:
-            logger.info(f"Querying task status - task_id: {task_id}")
-            
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.get(
-                    f"{self.base_url}/contents/generations/tasks/{task_id}",
-                    headers={
-                        "Content-Type": "application/json",
-                        "Authorization": f"Bearer {self.api_key}"
-                    }
-                )
-                
-                response.raise_for_status()
-                result = response.json()
-                
-            logger.info(f"Task query successful - task_id: {task_id}, status: {result.get('status', 'unknown')}")
+        bind_task_id(task_id)
+        if task_id.startswith(LOCAL_ID_PREFIX):
+            submission = await self.admission.find(task_id)
+            if submission is None:
+                raise TaskNotFoundError(f"Task not found: {task_id}")
+            if submission.upstream_id is None:
+                return self.admission.as_result(submission)
+            # Dispatched: answer with the upstream task
+            task_id = submission.upstream_id
+        self._note_interest(task_id)
+
+        snapshot = self.poller.get(task_id)
+        if snapshot is not None:
+            return snapshot
+
+        while True:
+            try:
+                # Shared fetches run on, for other callers, past this request's deadline
+                async with enforce_deadline():
+                    result = await self.task_cache.get_or_fetch(task_id, self._load_task)
+                break
+            except (DeadlineExceeded, DeadlineExceededError):
+                if deadline_expired():
+                    raise DeadlineExceededError("Request deadline exceeded during task query") from None
+                # The shared fetch was cut short by another caller's deadline: fetch again
+        if self.poller.running and (self.poller.is_tracked(task_id) or not is_terminal(result)):
+            # e.g. tasks created before a restart: keep them fresh from now on
+            self.poller.register(task_id, result)
+        return result
+
+    async def wait_for_task(self, task_id: str, wait: float) -> Dict[str, Any]:
+        """
+        Long-poll a task: return once its status changes or wait seconds pass
+
+        Args:
+            task_id: Task ID
+            wait: Maximum seconds to hold the request
+
+        Returns:
+            Task status and result
+        """
+        result = await self.query_task(task_id)
+        left = deadline_remaining()
+        if left is not None:
+            # Leave time to answer with a fresh status before the deadline
+            wait = min(wait, left - LONG_POLL_DEADLINE_RESERVE)
+        if wait <= 0 or is_terminal(result):
             return result
-            
+
+        if task_id.startswith(LOCAL_ID_PREFIX) and result.get("id") == task_id:
+            # Still in the local queue: wait for dispatch instead of an upstream change
+            await self.admission.wait_settled(task_id, wait)
+            return await self.query_task(task_id)
+
+        # Local ids resolve to the upstream id once dispatched
+        upstream_id = result.get("id") or task_id
+        status = result.get("status")
+        deadline = time.monotonic() + wait
+        while True:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                return result
+            if self.poller.is_tracked(upstream_id):
+                changed = await self.poller.wait_for_change(upstream_id, status, timeout=left)
+                if changed is not None:
+                    return changed
+                if self.poller.is_tracked(upstream_id):
+                    # Timed out while the poller kept watching
+                    return await self.query_task(task_id)
+            else:
+                # Not watched by the poller (disabled or tracking expired): plain polling, as watch_task does
+                await asyncio.sleep(min(left, settings.TASK_WATCH_INTERVAL))
+            result = await self.query_task(task_id)
+            if result.get("status") != status:
+                return result
+
+    async def watch_task(self, task_id: str, heartbeat: float) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """
+        Yield a task's result now and again on every status transition
+
+        Yields None every heartbeat seconds without a transition so callers
+        can keep the connection alive. Stops after a terminal status.
+        """
+        result = await self.query_task(task_id)
+        yield result
+        while not is_terminal(result):
+            upstream_id = result.get("id") or task_id
+            if self.poller.is_tracked(upstream_id):
+                changed = await self.poller.wait_for_change(upstream_id, result.get("status"), timeout=heartbeat)
+            else:
+                # Not watched by the poller (disabled or tracking expired): plain polling
+                await asyncio.sleep(min(heartbeat, settings.TASK_WATCH_INTERVAL))
+                changed = await self.query_task(task_id)
+            if changed is None or changed.get("status") == result.get("status"):
+                yield None
+                continue
+            result = changed
+            yield result
+
+    async def get_video_file(self, task_id: str) -> str:
+        """
+        Return a local path to the task's result video, downloading it once
+
+        Args:
+            task_id: Task ID
+
+        Returns:
+            Path of the cached MP4 file
+
+        Raises:
+            TaskNotFoundError: Unknown local (queued) task id
+            TaskNotReadyError: Task has not succeeded (yet)
+            APIConnectionError: Upstream or download failed
+            VideoGenerationError: Task has no video URL
+        """
+        result = await self.query_task(task_id)
+        if result.get("status") != "succeeded":
+            raise TaskNotReadyError(f"Task video is not available, current status: {result.get('status', 'unknown')}")
+        task_id = result.get("id") or task_id
+        video_url = (result.get("content") or {}).get("video_url")
+        if not video_url:
+            raise VideoGenerationError(f"Task has no video URL - task_id: {task_id}")
+        provider, native_id = self._resolve_provider(task_id)
+
+        async def download(path: str) -> int:
+            return await provider.download(native_id, result, path)
+
+        try:
+            return await self.artifacts.get_or_download(task_id, download)
         except httpx.HTTPStatusError as e:
-            logger.error(f"API request failed with status {e.response.status_code}: {e.response.text}")
-            raise APIConnectionError(f"API request failed: {e.response.text}")
-            
-        except httpx.TimeoutException as e:
-            logger.error(f"API request timeout: {str(e)}")
-            raise APIConnectionError(f"API request timeout, please try again later: {str(e)}")
-            
+            logger.error("Video download failed with status %s - task_id: %s", e.response.status_code, task_id)
+            raise APIConnectionError(f"Video download failed with status {e.response.status_code}")
+        except httpx.HTTPError as e:
+            logger.error("Video download failed - task_id: %s, error: %s", task_id, e)
+            raise APIConnectionError(f"Video download failed: {str(e)}")
+
+    async def _load_task(self, task_id: str) -> Dict[str, Any]:
+        """Cache miss path: finished tasks from the registry, then results shared by other workers, then upstream"""
+        try:
+            record = await self.task_store.get(task_id)
+        except Exception as e:
+            logger.warning("Task store lookup failed - task_id: %s, error: %s", task_id, e)
+            record = None
+        if record and record.get("result") and is_terminal(record["result"]):
+            return record["result"]
+
+        # Another worker may have fetched it moments ago
+        shared = await self.shared.get_result(task_id)
+        if shared is not None:
+            return shared
+
+        result = await self._fetch_task(task_id)
+        self._on_task_update(task_id, result)
+        return result
+
+    async def _fetch_tasks_batch(self, task_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Fetch several tasks, one batched call per provider"""
+        groups: Dict[str, List[Tuple[str, str]]] = {}
+        for task_id in task_ids:
+            provider, native_id = self._resolve_provider(task_id)
+            groups.setdefault(provider.name, []).append((task_id, native_id))
+
+        async def fetch_group(name: str, ids: List[Tuple[str, str]]) -> Dict[str, Dict[str, Any]]:
+            fetched = await self.providers[name].fetch_many([native_id for _, native_id in ids])
+            return {
+                task_id: {**fetched[native_id], "id": task_id}
+                for task_id, native_id in ids if native_id in fetched
+            }
+
+        results: Dict[str, Dict[str, Any]] = {}
+        for name, outcome in zip(groups, await asyncio.gather(
+            *(fetch_group(name, ids) for name, ids in groups.items()), return_exceptions=True
+        )):
+            # Tasks of a failed group are retried one by one by the poller
+            if isinstance(outcome, BaseException):
+                logger.warning("Batched task refresh failed - provider: %s, error: %s", name, outcome)
+                continue
+            results.update(outcome)
+        return results
+
+    async def _fetch_task(self, task_id: str) -> Dict[str, Any]:
+        """Fetch a task's status from its provider, bypassing the cache"""
+        provider, native_id = self._resolve_provider(task_id)
+        try:
+            logger.info("Querying task status - task_id: %s", task_id, extra=ROUTINE)
+            result = await provider.fetch(native_id)
+            logger.info(
+                "Task query successful - task_id: %s, status: %s", task_id, result.get("status", "unknown"), extra=ROUTINE
+            )
+            return {**result, "id": task_id}
         except Exception as e:
-            logger.error(f"Task query failed: {str(e)}")
-            raise VideoGenerationError(f"Error occurred during task query: {str(e)}")
+            raise self._upstream_error(e, "task query")
     
     def _validate_parameters(self, content: List[Dict[str, Any]]) -> None:
-        """Validate input parameters"""
-        if not content or len(content) == 0:
+        """
+        Validate input parameters
+
+        The only validation a create goes through (routes build content
+        without checking it), done in a single pass over the items.
+        """
+        if not content:
             raise ValueError("content cannot be empty")
-        
-        # Check if there's at least one text content
-        has_text = any(item.get("type") == "text" for item in content)
-        if not has_text:
-            raise ValueError("content must contain at least one text item")
-        
-        # Validate each content item
+
+        has_text = False
         for item in content:
-            if item.get("type") == "text":
+            item_type = item.get("type")
+            if item_type == "text":
                 text = item.get("text", "")
-                if not text or not text.strip():
+                if not text or text.isspace():
                     raise ValueError("text content cannot be empty")
                 if len(text) > 2000:
                     raise ValueError(f"text length cannot exceed 2000 characters, current length: {len(text)}")
-            
-            elif item.get("type") == "image_url":
+                has_text = True
+
+            elif item_type == "image_url":
                 image_url = item.get("image_url", {}).get("url", "")
-                if image_url:
-                    if not (image_url.startswith('http://') or image_url.startswith('https://')):
-                        raise ValueError(f"image_url must be a valid HTTP/HTTPS URL: {image_url}")
\ No newline at end of file
+                if image_url and not image_url.startswith(("http://", "https://")):
+                    raise ValueError(f"image_url must be a valid HTTP/HTTPS URL: {image_url}")
+
+        if not has_text:
+            raise ValueError("content must contain at least one text item")
\ No newline at end of file
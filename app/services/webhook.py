@@ -0,0 +1,369 @@
+import os
+import json
+import hmac
+import time
+import random
+import sqlite3
+import asyncio
+import hashlib
+import logging
+import threading
+from typing import Optional, Dict, Any, List, Set
+
+import httpx
+
+from app.schemas.video import TaskResponse
+from app.utils.http import ssl_context
+from app.utils.logger import bind_task_id
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds between refreshes of the queue sizes reported in stats
+QUEUE_COUNTS_REFRESH_SECONDS = 5.0
+# Wait after a failed dispatch loop iteration, doubling up to the max while failures repeat
+LOOP_ERROR_BACKOFF_SECONDS = 0.5
+LOOP_ERROR_BACKOFF_MAX_SECONDS = 30.0
+
+
+def build_task_payload(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert an upstream task result into the public TaskResponse shape"""
+    error = result.get("error")
+    if isinstance(error, dict):
+        error = error.get("message") or error.get("code")
+    return TaskResponse(
+        id=result.get("id", ""),
+        model=result.get("model", ""),
+        status=result.get("status", "unknown"),
+        created_at=result.get("created_at") or 0,
+        updated_at=result.get("updated_at"),
+        result=result.get("content"),
+        error=str(error) if error else None
+    ).model_dump()
+
+
+def sign_payload(secret: str, timestamp: str, body: bytes) -> str:
+    """HMAC-SHA256 over "<timestamp>.<body>", hex encoded"""
+    message = timestamp.encode() + b"." + body
+    return hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+class WebhookStore:
+    """SQLite-backed subscriptions and delivery queue that survive restarts"""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS subscriptions (
+                task_id TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS deliveries (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                task_id TEXT NOT NULL,
+                url TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                last_error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_deliveries_due ON deliveries (status, next_attempt_at);
+            """
+        )
+
+    def subscribe(self, task_id: str, url: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO subscriptions (task_id, url, created_at) VALUES (?, ?, ?)",
+                (task_id, url, time.time())
+            )
+
+    def subscribed_task_ids(self) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute("SELECT task_id FROM subscriptions").fetchall()
+        return [r[0] for r in rows]
+
+    def enqueue(self, task_id: str, payload: Dict[str, Any]) -> bool:
+        """Move a task's subscription into the delivery queue; False if none"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT url FROM subscriptions WHERE task_id = ?", (task_id,)
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return False
+                self._conn.execute("DELETE FROM subscriptions WHERE task_id = ?", (task_id,))
+                self._conn.execute(
+                    "INSERT INTO deliveries (task_id, url, payload, next_attempt_at) VALUES (?, ?, ?, ?)",
+                    (task_id, row[0], json.dumps(payload), time.time())
+                )
+                self._conn.execute("COMMIT")
+                return True
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def due(self, limit: int, exclude: Set[int], lease: float) -> List[Dict[str, Any]]:
+        """
+        Claim up to limit due deliveries
+
+        Claimed rows are pushed lease seconds into the future, so other
+        workers sharing the database skip them; if this worker dies mid
+        delivery the row becomes due again once the lease runs out.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT id, task_id, url, payload, attempts FROM deliveries "
+                    "WHERE status = 'pending' AND next_attempt_at <= ? "
+                    "ORDER BY next_attempt_at LIMIT ?",
+                    (now, limit + len(exclude))
+                ).fetchall()
+                rows = [r for r in rows if r[0] not in exclude][:limit]
+                self._conn.executemany(
+                    "UPDATE deliveries SET next_attempt_at = ? WHERE id = ?",
+                    [(now + lease, r[0]) for r in rows]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [
+            {"id": r[0], "task_id": r[1], "url": r[2], "payload": r[3], "attempts": r[4]}
+            for r in rows
+        ]
+
+    def next_due_at(self) -> Optional[float]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(next_attempt_at) FROM deliveries WHERE status = 'pending'"
+            ).fetchone()
+        return row[0] if row else None
+
+    def mark_delivered(self, delivery_id: int) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE deliveries SET status = 'delivered', attempts = attempts + 1, last_error = NULL WHERE id = ?",
+                (delivery_id,)
+            )
+
+    def mark_failed(self, delivery_id: int, error: str, next_attempt_at: Optional[float]) -> None:
+        """Schedule a retry, or give up when next_attempt_at is None"""
+        with self._lock:
+            if next_attempt_at is None:
+                self._conn.execute(
+                    "UPDATE deliveries SET status = 'dead', attempts = attempts + 1, last_error = ? WHERE id = ?",
+                    (error, delivery_id)
+                )
+            else:
+                self._conn.execute(
+                    "UPDATE deliveries SET attempts = attempts + 1, last_error = ?, next_attempt_at = ? WHERE id = ?",
+                    (error, next_attempt_at, delivery_id)
+                )
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM deliveries GROUP BY status").fetchall()
+            subscriptions = self._conn.execute("SELECT COUNT(*) FROM subscriptions").fetchone()[0]
+        counts = {status: count for status, count in rows}
+        counts["subscriptions"] = subscriptions
+        return counts
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class WebhookDispatcher:
+    """
+    Delivers terminal task results to client callback URLs
+
+    Deliveries are queued in SQLite and sent by a bounded pool of async
+    workers, retried with exponential backoff and jitter, and signed with
+    HMAC-SHA256 when a secret is configured.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        secret: str,
+        concurrency: int,
+        max_attempts: int,
+        backoff_base: float,
+        backoff_max: float,
+        timeout: float
+    ):
+        self.db_path = db_path
+        self.secret = secret
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.store: Optional[WebhookStore] = None
+        self._http: Optional[httpx.AsyncClient] = None
+        self._runner: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._inflight: Set[int] = set()
+        self._workers: Set[asyncio.Task] = set()
+        self.counters = {"delivered": 0, "retried": 0, "dead": 0, "loop_errors": 0}
+        # Queue sizes for stats, refreshed off the event loop by the dispatch loop
+        self._queue_counts: Dict[str, int] = {}
+        self._queue_counts_at = 0.0
+
+    def _get_store(self) -> WebhookStore:
+        if self.store is None:
+            self.store = WebhookStore(self.db_path)
+        return self.store
+
+    async def start(self) -> None:
+        if self._runner is None:
+            await asyncio.to_thread(self._get_store)
+            self._wakeup = asyncio.Event()
+            self._runner = asyncio.create_task(self._run())
+            logger.info("Webhook dispatcher started - db: %s, concurrency: %s", self.db_path, self.concurrency)
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+        if self._workers:
+            # Let in-flight deliveries finish; anything unsent stays queued on disk
+            await asyncio.gather(*self._workers, return_exceptions=True)
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+        logger.info("Webhook dispatcher stopped - stats: %s", self.counters)
+
+    async def pending_task_ids(self) -> List[str]:
+        """Tasks that still have a callback waiting for their final result"""
+        store = self._get_store()
+        return await asyncio.to_thread(store.subscribed_task_ids)
+
+    async def subscribe(self, task_id: str, url: str) -> None:
+        """Remember that a task's final result should be posted to url"""
+        store = self._get_store()
+        await asyncio.to_thread(store.subscribe, task_id, url)
+
+    async def task_finished(self, task_id: str, result: Dict[str, Any]) -> None:
+        """Queue delivery for a task that reached a terminal state"""
+        store = self._get_store()
+        if await asyncio.to_thread(store.enqueue, task_id, build_task_payload(result)):
+            logger.info("Webhook delivery queued - task_id: %s", task_id)
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        failures = 0
+        while True:
+            self._wakeup.clear()
+            try:
+                delay = await self._run_once()
+                failures = 0
+            except Exception as e:
+                # e.g. "database is locked" under WAL contention: keep the loop alive and retry
+                failures += 1
+                self.counters["loop_errors"] += 1
+                delay = min(LOOP_ERROR_BACKOFF_SECONDS * 2 ** (failures - 1), LOOP_ERROR_BACKOFF_MAX_SECONDS)
+                logger.error("Webhook dispatch loop failed, retrying in %.1fs: %s", delay, e)
+            try:
+                # asyncio.timeout rather than wait_for: on 3.11 wait_for can swallow
+                # the cancel from stop() when the event fires at the same moment
+                async with asyncio.timeout(delay):
+                    await self._wakeup.wait()
+            except TimeoutError:
+                pass
+
+    async def _run_once(self) -> float:
+        """Start due deliveries; returns seconds until the next one may be due"""
+        free = self.concurrency - len(self._inflight)
+        if free > 0:
+            try:
+                due = await asyncio.to_thread(
+                    self.store.due, free, set(self._inflight), self.timeout * 3
+                )
+            except Exception as e:
+                logger.error("Webhook queue read failed: %s", e)
+                due = []
+            for delivery in due:
+                self._inflight.add(delivery["id"])
+                worker = asyncio.create_task(self._deliver(delivery))
+                self._workers.add(worker)
+                worker.add_done_callback(self._workers.discard)
+
+        next_due = await asyncio.to_thread(self.store.next_due_at)
+        if time.monotonic() - self._queue_counts_at >= QUEUE_COUNTS_REFRESH_SECONDS:
+            try:
+                self._queue_counts = await asyncio.to_thread(self.store.counts)
+            except Exception as e:
+                logger.warning("Webhook queue count failed: %s", e)
+            self._queue_counts_at = time.monotonic()
+        return 5.0 if next_due is None else min(max(next_due - time.time(), 0.05), 5.0)
+
+    def _client(self) -> httpx.AsyncClient:
+        # Built on first delivery; most workers never send a webhook right after start
+        if self._http is None:
+            self._http = httpx.AsyncClient(timeout=self.timeout, verify=ssl_context())
+        return self._http
+
+    async def _deliver(self, delivery: Dict[str, Any]) -> None:
+        # Each delivery runs in its own asyncio task, so this only tags its own lines
+        bind_task_id(delivery["task_id"])
+        body = delivery["payload"].encode()
+        timestamp = str(int(time.time()))
+        headers = {
+            "Content-Type": "application/json",
+            "X-Webhook-Timestamp": timestamp,
+            "X-Webhook-Delivery": str(delivery["id"])
+        }
+        if self.secret:
+            headers["X-Webhook-Signature"] = f"sha256={sign_payload(self.secret, timestamp, body)}"
+
+        try:
+            response = await self._client().post(delivery["url"], content=body, headers=headers)
+            response.raise_for_status()
+            await asyncio.to_thread(self.store.mark_delivered, delivery["id"])
+            self.counters["delivered"] += 1
+            logger.info("Webhook delivered - task_id: %s", delivery["task_id"])
+        except Exception as e:
+            attempts = delivery["attempts"] + 1
+            if attempts >= self.max_attempts:
+                next_attempt_at = None
+                self.counters["dead"] += 1
+                logger.error("Webhook delivery abandoned - task_id: %s, error: %s", delivery["task_id"], e)
+            else:
+                delay = min(self.backoff_base * (2 ** (attempts - 1)), self.backoff_max)
+                next_attempt_at = time.time() + delay * random.uniform(0.5, 1.0)
+                self.counters["retried"] += 1
+                logger.warning(
+                    "Webhook delivery failed, retrying - task_id: %s, attempt: %s, error: %s",
+                    delivery["task_id"], attempts, e
+                )
+            await asyncio.to_thread(self.store.mark_failed, delivery["id"], str(e)[:500], next_attempt_at)
+        finally:
+            self._inflight.discard(delivery["id"])
+            self._wakeup.set()
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = {**self.counters, "inflight": len(self._inflight)}
+        if self.store is not None:
+            stats["queue"] = dict(self._queue_counts)
+        return stats
@@ -0,0 +1,124 @@
+import json
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Optional
+from urllib.parse import parse_qsl
+
+
+# Absolute time.monotonic() by which the current request must be answered; None: no deadline
+deadline_var: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+DEADLINE_HEADER = b"x-request-timeout"
+DEADLINE_PARAM = "timeout"
+
+
+class DeadlineExceeded(Exception):
+    """The caller's deadline passed before the upstream answered"""
+
+    def __init__(self, message: str = "Request deadline exceeded"):
+        super().__init__(message)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline, or None without one"""
+    deadline = deadline_var.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+@asynccontextmanager
+async def enforce_deadline():
+    """
+    Cut the enclosed awaits short at the current deadline
+
+    Raises DeadlineExceeded at once when it has already passed, or when it
+    passes inside the block (the awaited work is cancelled).
+    """
+    left = remaining()
+    if left is None:
+        yield
+        return
+    if left <= 0:
+        raise DeadlineExceeded()
+    try:
+        async with asyncio.timeout(left):
+            yield
+    except TimeoutError:
+        if not expired():
+            raise
+        raise DeadlineExceeded() from None
+
+
+def _parse(value: str) -> Optional[float]:
+    try:
+        seconds = float(value)
+    except ValueError:
+        return None
+    return seconds if 0 < seconds < float("inf") else None
+
+
+class DeadlineMiddleware:
+    """
+    Pure ASGI middleware setting the request deadline
+
+    The caller's budget in seconds comes from the X-Request-Timeout header
+    or the timeout query parameter (which wins), else default_seconds (0:
+    none), capped at max_seconds. Upstream calls made while serving the
+    request are cut short when it passes; invalid values are rejected with 400.
+    """
+
+    def __init__(self, app, default_seconds: float, max_seconds: float):
+        self.app = app
+        self.default_seconds = default_seconds
+        self.max_seconds = max_seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        raw = None
+        for name, value in scope.get("headers", ()):
+            if name == DEADLINE_HEADER:
+                raw = value.decode("latin-1")
+                break
+        query_string = scope.get("query_string", b"")
+        if DEADLINE_PARAM.encode() in query_string:
+            for key, value in parse_qsl(query_string.decode("latin-1")):
+                if key == DEADLINE_PARAM:
+                    raw = value
+
+        if raw is not None:
+            seconds = _parse(raw)
+            if seconds is None:
+                await self._reject(send, raw)
+                return
+        else:
+            seconds = self.default_seconds
+        if not seconds:
+            await self.app(scope, receive, send)
+            return
+
+        if self.max_seconds > 0:
+            seconds = min(seconds, self.max_seconds)
+        token = deadline_var.set(time.monotonic() + seconds)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            deadline_var.reset(token)
+
+    @staticmethod
+    async def _reject(send, raw: str) -> None:
+        body = json.dumps({"detail": f"Invalid request timeout: {raw[:32]!r}, expected seconds > 0"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 400,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,16 @@
+import ssl
+from functools import lru_cache
+
+import httpx
+
+
+@lru_cache(maxsize=None)
+def ssl_context(http2: bool = False) -> ssl.SSLContext:
+    """
+    Verified TLS context shared by every HTTP client in the process
+
+    Building one loads the CA bundle (tens of milliseconds), which httpx
+    otherwise repeats for each client. Keyed on http2 because the ALPN
+    protocols are part of the context.
+    """
+    return httpx.create_ssl_context(http2=http2)
@@ -1,24 +1,165 @@
-import logging
-import logging.config
 import sys
+import copy
+import json
+import queue
+import uuid
+import atexit
+import random
+import logging
+import logging.handlers
+from contextvars import ContextVar
+from typing import Optional, Dict, Any
 
 
-import logging
-import logging.config
-import sys
+# Correlation id of the HTTP request being served, and the task it is about
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+task_id_var: ContextVar[Optional[str]] = ContextVar("task_id", default=None)
+
+# Pass as extra= on high-volume routine lines (task status polling) so LOG_SAMPLE_RATE can thin them
+ROUTINE = {"routine": True}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional["QueueHandler"] = None
+
+
+def bind_task_id(task_id: Optional[str]) -> None:
+    """Tag the rest of the current request's log lines with task_id"""
+    task_id_var.set(task_id)
+
+
+class ContextFilter(logging.Filter):
+    """
+    Stamp records with request_id and task_id and sample routine lines
+
+    Attached to the queue handler, so it runs on the caller's thread where
+    the request's context variables are visible.
+    """
+
+    def __init__(self, sample_rate: float = 1.0):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.sample_rate < 1.0 and getattr(record, "routine", False) and random.random() >= self.sample_rate:
+            return False
+        record.request_id = request_id_var.get() or "-"
+        record.task_id = getattr(record, "task_id", None) or task_id_var.get() or "-"
+        return True
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """
+    Hand records to the listener thread without blocking the event loop
+
+    Only the message is interpolated here, since args may change after the
+    call. Timestamps, rendering and I/O happen on the listener thread. When
+    the queue is full, records are dropped and counted.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "time": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+            "task_id": getattr(record, "task_id", "-"),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RequestContextMiddleware:
+    """
+    Pure ASGI middleware assigning each request a correlation id
+
+    Uses the caller's X-Request-ID when present and echoes it back, so one
+    id follows the request through every log line it produces.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope.get("headers", ()):
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:128]
+                break
+        request_id = request_id or uuid.uuid4().hex[:16]
+        request_token = request_id_var.set(request_id)
+        task_token = task_id_var.set(None)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id_var.reset(request_token)
+            task_id_var.reset(task_token)
+
+
+def get_log_stats() -> Dict[str, Any]:
+    return {
+        "queued": _queue_handler.queue.qsize() if _queue_handler is not None else 0,
+        "dropped": _queue_handler.dropped if _queue_handler is not None else 0
+    }
+
 
 def setup_logging(settings):
+    global _listener, _queue_handler
+
     root = logging.getLogger()
 
     # wipe anything uvicorn/basicConfig added
     root.handlers.clear()
+    if _listener is not None:
+        _listener.stop()
+        atexit.unregister(_listener.stop)
 
     log_level = getattr(logging, settings.LOG_LEVEL)
 
-    if settings.ENV == "dev":
-        from rich.logging import RichHandler
+    rich_handler = None
+    if settings.ENV == "dev" and settings.LOG_FORMAT != "json":
+        # rich is a development nicety and costs ~25ms to import; production never loads it
+        try:
+            from rich.logging import RichHandler
+            rich_handler = RichHandler
+        except ImportError:
+            pass
 
-        handler = RichHandler(
+    if rich_handler is not None:
+        handler = rich_handler(
             rich_tracebacks=True,
             markup=True,
             show_time=True,
@@ -27,23 +168,40 @@ def setup_logging(settings):
         )
 
         formatter = logging.Formatter(
-            "%(name)s | %(message)s"
+            "%(name)s | %(request_id)s | %(message)s"
         )
         handler.setFormatter(formatter)
 
     else:
         handler = logging.StreamHandler(sys.stdout)
 
-        formatter = logging.Formatter(
-            "%(asctime)s | %(levelname)s | %(name)s | %(message)s",
-            datefmt="%Y-%m-%dT%H:%M:%S",
-        )
+        if settings.LOG_FORMAT == "json":
+            formatter = JsonFormatter(datefmt="%Y-%m-%dT%H:%M:%S")
+        else:
+            formatter = logging.Formatter(
+                "%(asctime)s | %(levelname)s | %(name)s | %(request_id)s %(task_id)s | %(message)s",
+                datefmt="%Y-%m-%dT%H:%M:%S",
+            )
         handler.setFormatter(formatter)
 
     handler.setLevel(log_level)
 
+    # The event loop only enqueues; a listener thread formats and writes
+    _queue_handler = QueueHandler(queue.Queue(maxsize=settings.LOG_QUEUE_SIZE))
+    _queue_handler.addFilter(ContextFilter(settings.LOG_SAMPLE_RATE))
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, handler, respect_handler_level=True)
+    _listener.start()
+    # Flush what is still queued when the worker exits
+    atexit.register(_listener.stop)
+
     root.setLevel(log_level)
-    root.addHandler(handler)
+    root.addHandler(_queue_handler)
+
+    # uvicorn's own loggers write synchronously; send them through the queue too
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers.clear()
+        uvicorn_logger.propagate = True
 
     # Optional: quiet noisy libs in prod
     if settings.ENV != "dev":
@@ -0,0 +1,241 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Optional, Callable, Dict, Any
+
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY, CollectorRegistry, generate_latest, multiprocess
+from prometheus_client.core import GaugeMetricFamily
+
+
+logger = logging.getLogger(__name__)
+
+# Set (in the environment, before start) to aggregate metrics of all uvicorn workers;
+# the directory must exist and be emptied before the server starts
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "sora2_http_request_duration_seconds",
+    "HTTP request latency by route",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "sora2_http_requests_in_flight",
+    "HTTP requests currently being served",
+    ["method"],
+    multiprocess_mode="livesum",
+)
+UPSTREAM_REQUEST_DURATION = Histogram(
+    "sora2_upstream_request_duration_seconds",
+    "Upstream provider call latency per attempt",
+    ["provider", "operation"],
+    buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_ERRORS = Counter(
+    "sora2_upstream_errors_total",
+    "Upstream call failures by error class",
+    ["provider", "operation", "error_class"],
+)
+UPSTREAM_REQUESTS_IN_FLIGHT = Gauge(
+    "sora2_upstream_requests_in_flight",
+    "Upstream calls currently in progress",
+    ["provider", "operation"],
+    multiprocess_mode="livesum",
+)
+TASK_COMPLETION_SECONDS = Histogram(
+    "sora2_task_completion_seconds",
+    "Time from task creation to a terminal state",
+    ["status"],
+    buckets=(15, 30, 60, 90, 120, 180, 240, 300, 450, 600, 900, 1800, 3600),
+)
+TASK_TERMINAL_TOTAL = Counter(
+    "sora2_task_terminal_total",
+    "Tasks observed reaching a terminal state",
+    ["status"],
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "sora2_admission_queue_depth",
+    "Submissions waiting in the admission queue",
+    ["priority"],
+    multiprocess_mode="livesum",
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    "sora2_admission_wait_seconds",
+    "Time a submission waited in the admission queue before dispatch",
+    ["priority"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 15, 30, 60, 120, 300, 600, 1800),
+)
+ADMISSION_ACTIVE_TASKS = Gauge(
+    "sora2_admission_active_tasks",
+    "Dispatched tasks holding an upstream capacity slot",
+    multiprocess_mode="livesum",
+)
+EVENT_LOOP_LAG = Histogram(
+    "sora2_event_loop_lag_seconds",
+    "Delay between a scheduled event loop wake-up and when it ran",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+STARTUP_PHASE_SECONDS = Gauge(
+    "sora2_startup_phase_seconds",
+    "Duration of each startup phase of this worker",
+    ["phase"],
+    # One series per live worker (pid label)
+    multiprocess_mode="liveall",
+)
+
+
+def classify_error(error: BaseException) -> str:
+    """Short, low-cardinality error class for upstream failures"""
+    import httpx
+
+    if isinstance(error, httpx.HTTPStatusError):
+        code = error.response.status_code
+        if code == 429:
+            return "http_429"
+        return f"http_{code // 100}xx"
+    if isinstance(error, httpx.TimeoutException):
+        return "timeout"
+    if isinstance(error, httpx.TransportError):
+        return "transport"
+    return type(error).__name__
+
+
+def observe_task_terminal(result: Dict[str, Any]) -> None:
+    """Record lifecycle metrics for a task seen in a terminal state"""
+    status = result.get("status", "unknown")
+    TASK_TERMINAL_TOTAL.labels(status=status).inc()
+    created_at, updated_at = result.get("created_at"), result.get("updated_at")
+    if isinstance(created_at, (int, float)) and isinstance(updated_at, (int, float)) and updated_at >= created_at:
+        TASK_COMPLETION_SECONDS.labels(status=status).observe(updated_at - created_at)
+
+
+def observe_startup(timings_ms: Dict[str, float]) -> None:
+    """Publish a StartupTimer report"""
+    for phase, ms in timings_ms.items():
+        STARTUP_PHASE_SECONDS.labels(phase=phase).set(ms / 1000)
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording per-route latency and in-flight requests
+
+    The route label is the matched path template (e.g. /api/v1/videos/tasks/{task_id}),
+    so task ids never become label values.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+        start = time.perf_counter()
+        in_flight = HTTP_REQUESTS_IN_FLIGHT.labels(method=method)
+        in_flight.inc()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            route = scope.get("route")
+            route_path = getattr(route, "path_format", None) or "unmatched"
+            HTTP_REQUEST_DURATION.labels(
+                method=method, route=route_path, status=str(status_code)
+            ).observe(time.perf_counter() - start)
+
+
+class ServiceStatsCollector:
+    """
+    Expose VideoGenService.get_stats() numbers as gauges at scrape time
+
+    The numbers are this worker's only; in multiprocess mode they carry a
+    pid label, as the worker answering a scrape changes from one to the next.
+    """
+
+    def __init__(self, get_stats: Callable[[], Dict[str, Any]]):
+        self.get_stats = get_stats
+
+    def collect(self):
+        pid = [str(os.getpid())] if MULTIPROC_DIR else []
+        family = GaugeMetricFamily(
+            "sora2_service_stat",
+            "Internal service counters (caches, poller, queues)",
+            labels=["component", "name"] + (["pid"] if MULTIPROC_DIR else []),
+        )
+        try:
+            stats = self.get_stats()
+        except Exception as e:
+            logger.warning("Service stats collection failed: %s", e)
+            stats = {}
+        for component, values in stats.items():
+            if not isinstance(values, dict):
+                continue
+            for name, value in values.items():
+                if isinstance(value, bool):
+                    value = int(value)
+                if isinstance(value, (int, float)):
+                    family.add_metric([component, name] + pid, value)
+                elif isinstance(value, dict):
+                    for sub_name, sub_value in value.items():
+                        if isinstance(sub_value, (int, float)):
+                            family.add_metric([component, f"{name}_{sub_name}"] + pid, sub_value)
+        yield family
+
+
+_registered_collector: Optional[ServiceStatsCollector] = None
+
+
+def register_service_stats(get_stats: Callable[[], Dict[str, Any]]) -> None:
+    """Register (or re-point) the service stats collector"""
+    global _registered_collector
+    if _registered_collector is None:
+        _registered_collector = ServiceStatsCollector(get_stats)
+        REGISTRY.register(_registered_collector)
+    else:
+        _registered_collector.get_stats = get_stats
+
+
+def render_metrics() -> bytes:
+    """
+    The /metrics exposition
+
+    Each uvicorn worker has its own registry. With PROMETHEUS_MULTIPROC_DIR
+    set, counters, histograms and gauges of all workers are read from the
+    shared directory and aggregated; otherwise only the worker answering the
+    scrape is reported.
+    """
+    if not MULTIPROC_DIR:
+        return generate_latest(REGISTRY)
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    if _registered_collector is not None:
+        registry.register(_registered_collector)
+    return generate_latest(registry)
+
+
+def worker_exited() -> None:
+    """Drop a stopping worker's live gauges from the multiprocess aggregation"""
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+async def monitor_event_loop(interval: float = 0.5) -> None:
+    """Measure event loop lag forever; run as a background task"""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(0.0, loop.time() - start - interval))
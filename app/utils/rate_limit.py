@@ -0,0 +1,96 @@
+import time
+import asyncio
+import logging
+from typing import Any, Callable
+
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Async token bucket: refills at rate tokens per second up to capacity
+
+    acquire() waits until enough tokens are available; waiters are served
+    in arrival order.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+
+# Refill and take in one atomic step; returns the seconds to wait (0 when taken).
+# Uses the Redis clock so every worker sees the same time.
+_REDIS_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= requested then
+    tokens = tokens - requested
+else
+    wait = (requested - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+return tostring(wait)
+"""
+
+
+class RedisTokenBucket:
+    """
+    Token bucket whose budget is shared by every worker through Redis
+
+    Same interface as TokenBucket. If Redis cannot be reached, acquire()
+    falls back to the given local bucket so requests are paced rather than
+    failed.
+    """
+
+    def __init__(self, client: Callable[[], Any], key: str, rate: float, capacity: float, fallback: TokenBucket):
+        self.client = client
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity
+        self.fallback = fallback
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        while True:
+            redis = self.client()
+            if redis is None:
+                await self.fallback.acquire(tokens)
+                return
+            try:
+                wait = float(await redis.eval(
+                    _REDIS_BUCKET_SCRIPT, 1, self.key, self.rate, self.capacity, tokens
+                ))
+            except Exception as e:
+                logger.warning("Shared rate limit unavailable, using local budget: %s", e)
+                await self.fallback.acquire(tokens)
+                return
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
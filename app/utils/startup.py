@@ -0,0 +1,51 @@
+import time
+import logging
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    """
+    Wall-clock durations of the worker's startup phases
+
+    Import this module before anything heavy so the "import" phase covers
+    the application's own imports; see `python -X importtime` for a per
+    module breakdown.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._last = self.started
+        self.phases: Dict[str, float] = {}
+
+    def mark(self, name: str) -> None:
+        """Close a phase that began at the previous mark"""
+        now = time.perf_counter()
+        self.phases[name] = self.phases.get(name, 0.0) + now - self._last
+        self._last = now
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+            self._last = time.perf_counter()
+
+    @property
+    def total(self) -> float:
+        return self._last - self.started
+
+    def report(self) -> Dict[str, float]:
+        """Phase durations in milliseconds, plus the total"""
+        report = {name: round(seconds * 1000, 1) for name, seconds in self.phases.items()}
+        report["total"] = round(self.total * 1000, 1)
+        return report
+
+
+# Created on first import, i.e. at the top of app.main
+startup_timer = StartupTimer()
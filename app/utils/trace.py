@@ -0,0 +1,310 @@
+import os
+import gzip
+import json
+import time
+import queue
+import random
+import shutil
+import hashlib
+import logging
+import logging.handlers
+from urllib.parse import parse_qsl, urlencode
+from contextvars import ContextVar
+from typing import Optional, Dict, Any, List
+
+from app.utils.logger import request_id_var
+
+
+logger = logging.getLogger(__name__)
+
+# Request headers kept in traces; X-API-Key is stored as a hash so tenants stay distinguishable
+TRACE_HEADERS = ("content-type", "accept", "idempotency-key", "last-event-id", "x-request-id")
+SECRET_KEYS = ("authorization", "api_key", "apikey", "x-api-key", "token", "secret", "password", "signature")
+REDACTED = "[redacted]"
+
+# Upstream calls made while serving the current request; None outside traced requests
+_current: ContextVar[Optional["_RequestTrace"]] = ContextVar("trace_request", default=None)
+
+_recorder: Optional["TraceRecorder"] = None
+
+
+def hash_secret(value: str) -> str:
+    return "sha256:" + hashlib.sha256(value.encode()).hexdigest()[:16]
+
+
+def redact(value: Any) -> Any:
+    """
+    Copy of a JSON value that is safe to store
+
+    Secret-looking keys are replaced, URL query strings (signed links,
+    tokens) are dropped and inline data URLs are reduced to their type and size.
+    """
+    if isinstance(value, dict):
+        return {
+            k: REDACTED if any(s in k.lower() for s in SECRET_KEYS) else redact(v)
+            for k, v in value.items()
+        }
+    if isinstance(value, list):
+        return [redact(v) for v in value]
+    if isinstance(value, str):
+        if value.startswith("data:"):
+            return f"{value.partition(',')[0]},[{len(value)} chars]"
+        if value.startswith(("http://", "https://")) and "?" in value:
+            return value.partition("?")[0] + "?" + REDACTED
+    return value
+
+
+def _query(query_string: bytes) -> str:
+    pairs = parse_qsl(query_string.decode("latin-1"), keep_blank_values=True)
+    return urlencode([(k, REDACTED if any(s in k.lower() for s in SECRET_KEYS) else v) for k, v in pairs])
+
+
+def _body(raw: bytes, max_bytes: int) -> Any:
+    """Redacted JSON body, or only its size when it is not small JSON"""
+    if not raw:
+        return None
+    if len(raw) <= max_bytes:
+        try:
+            return redact(json.loads(raw))
+        except ValueError:
+            pass
+    return {"bytes": len(raw)}
+
+
+class _RequestTrace:
+    __slots__ = ("upstream", "finished", "sampled")
+
+    def __init__(self, sampled: bool = True):
+        self.upstream: List[Dict[str, Any]] = []
+        self.finished = False
+        self.sampled = sampled
+
+
+class _GzipRotator:
+    """RotatingFileHandler hooks compressing rotated trace files"""
+
+    @staticmethod
+    def namer(name: str) -> str:
+        return name + ".gz"
+
+    @staticmethod
+    def rotator(source: str, dest: str) -> None:
+        with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(source)
+
+
+class TraceRecorder:
+    """
+    Append-only JSON Lines capture of served requests and upstream calls
+
+    Lines are handed to a writer thread through a bounded queue (dropped
+    and counted when full) and written to a size-rotated file; rotated
+    files are gzipped. Each worker writes its own file. Record shapes, with
+    short keys to keep lines compact:
+
+        {"k": "req", "t": start time, "rid": request id, "m": method,
+         "p": path, "r": route template, "q": query, "h": headers, "b": body,
+         "s": status, "d": ms, "rb": response body, "rn": response bytes,
+         "u": [upstream calls made while serving it]}
+        {"k": "up", "t": start time, "pv": provider, "op": operation,
+         "m": method, "p": path, "q": params, "s": status (0: no response),
+         "e": error class, "d": ms, "b": response body}
+
+    Upstream calls outside a request (poller, reconciler) are written as
+    "up" records; inside one they are nested under its "u". Calls made for
+    requests left out by sample_rate are not recorded.
+    """
+
+    def __init__(self, path: str, sample_rate: float, max_body_bytes: int, max_file_bytes: int, backups: int):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.max_body_bytes = max_body_bytes
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_file_bytes, backupCount=backups)
+        handler.namer = _GzipRotator.namer
+        handler.rotator = _GzipRotator.rotator
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        self._queue: queue.Queue = queue.Queue(maxsize=10000)
+        self._listener = logging.handlers.QueueListener(self._queue, handler)
+        self.counters = {"requests": 0, "upstream": 0, "dropped": 0}
+
+    def start(self) -> None:
+        self._listener.start()
+        logger.info("Traffic capture started - path: %s, sample rate: %s", self.path, self.sample_rate)
+
+    def stop(self) -> None:
+        # Flushes what is still queued
+        self._listener.stop()
+        for handler in self._listener.handlers:
+            handler.close()
+        logger.info("Traffic capture stopped - stats: %s", self.counters)
+
+    def write(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, separators=(",", ":"), ensure_ascii=False, default=str)
+        try:
+            self._queue.put_nowait(logging.makeLogRecord({"msg": line}))
+        except queue.Full:
+            self.counters["dropped"] += 1
+
+    def upstream_call(
+        self,
+        provider: str,
+        operation: str,
+        method: str,
+        path: str,
+        params: Any,
+        started: float,
+        elapsed: float,
+        response: Optional[Any],
+        error: Optional[str]
+    ) -> None:
+        entry: Dict[str, Any] = {
+            "t": round(started, 3), "pv": provider, "op": operation, "m": method, "p": path,
+            "q": [list(p) for p in params] if isinstance(params, list) else params,
+            "s": response.status_code if response is not None else 0,
+            "d": round(elapsed * 1000, 2)
+        }
+        if error:
+            entry["e"] = error
+        if response is not None:
+            entry["b"] = _body(response.content, self.max_body_bytes)
+        request = _current.get()
+        if request is not None and not request.sampled:
+            return
+        self.counters["upstream"] += 1
+        if request is not None and not request.finished:
+            request.upstream.append(entry)
+        else:
+            self.write({"k": "up", **entry})
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.counters, "queued": self._queue.qsize()}
+
+
+def trace_upstream(*args, **kwargs) -> None:
+    """Record one upstream call when capture is enabled (see TraceRecorder.upstream_call)"""
+    if _recorder is not None:
+        _recorder.upstream_call(*args, **kwargs)
+
+
+def setup_tracing(settings) -> Optional[TraceRecorder]:
+    """Start this worker's recorder when TRACE_CAPTURE_PATH is set"""
+    global _recorder
+    if not settings.TRACE_CAPTURE_PATH:
+        return None
+    path = settings.TRACE_CAPTURE_PATH
+    if settings.WEB_CONCURRENCY > 1:
+        # Workers never share a file, so lines cannot interleave
+        path = f"{path}.{os.getpid()}"
+    _recorder = TraceRecorder(
+        path,
+        sample_rate=settings.TRACE_SAMPLE_RATE,
+        max_body_bytes=settings.TRACE_MAX_BODY_BYTES,
+        max_file_bytes=settings.TRACE_MAX_FILE_BYTES,
+        backups=settings.TRACE_BACKUP_COUNT
+    )
+    _recorder.start()
+    return _recorder
+
+
+def stop_tracing() -> None:
+    global _recorder
+    if _recorder is not None:
+        _recorder.stop()
+        _recorder = None
+
+
+def get_trace_stats() -> Dict[str, Any]:
+    return _recorder.get_stats() if _recorder is not None else {}
+
+
+class TraceCaptureMiddleware:
+    """
+    Pure ASGI middleware writing sampled requests to the trace recorder
+
+    Request and response bodies are kept when they are small JSON
+    (TRACE_MAX_BODY_BYTES), redacted; streamed or binary responses (SSE,
+    video downloads) only record their size.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        recorder = _recorder
+        if scope["type"] != "http" or recorder is None:
+            await self.app(scope, receive, send)
+            return
+        if recorder.sample_rate < 1.0 and random.random() >= recorder.sample_rate:
+            token = _current.set(_RequestTrace(sampled=False))
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                _current.reset(token)
+            return
+
+        started = time.time()
+        start = time.perf_counter()
+        request_body = bytearray()
+        response_body = bytearray()
+        response_bytes = 0
+        status_code = 500
+        json_response = False
+        limit = recorder.max_body_bytes
+
+        async def receive_wrapper():
+            message = await receive()
+            if message["type"] == "http.request" and len(request_body) <= limit:
+                request_body.extend(message.get("body", b""))
+            return message
+
+        async def send_wrapper(message):
+            nonlocal status_code, response_bytes, json_response
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                json_response = any(
+                    name == b"content-type" and value.startswith(b"application/json")
+                    for name, value in message.get("headers", ())
+                )
+            elif message["type"] == "http.response.body":
+                chunk = message.get("body", b"")
+                response_bytes += len(chunk)
+                if json_response and len(response_body) <= limit:
+                    response_body.extend(chunk)
+            await send(message)
+
+        trace = _RequestTrace()
+        token = _current.set(trace)
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            _current.reset(token)
+            trace.finished = True
+            headers = {}
+            for name, value in scope.get("headers", ()):
+                name = name.decode("latin-1")
+                if name == "x-api-key":
+                    headers[name] = hash_secret(value.decode("latin-1"))
+                elif name in TRACE_HEADERS:
+                    headers[name] = value.decode("latin-1")
+            route = scope.get("route")
+            recorder.counters["requests"] += 1
+            recorder.write({
+                "k": "req",
+                "t": round(started, 3),
+                "rid": request_id_var.get(),
+                "m": scope["method"],
+                "p": scope["path"],
+                "r": getattr(route, "path_format", None),
+                "q": _query(scope.get("query_string", b"")),
+                "h": headers,
+                "b": _body(bytes(request_body), limit),
+                "s": status_code,
+                "d": round((time.perf_counter() - start) * 1000, 2),
+                "rb": _body(bytes(response_body), limit) if json_response else None,
+                "rn": response_bytes,
+                "u": trace.upstream
+            })
@@ -0,0 +1,348 @@
+"""
+End-to-end load benchmark against a fake Ark upstream
+
+Starts tests/fake_ark.py on a local port, points the app at it and drives
+the FastAPI app in-process with a weighted mix of create, poll and download
+requests from concurrent clients. Reports throughput, p50/p95/p99 latency
+per operation and upstream call amplification (fake Ark API calls per
+client request), and saves the run as JSON.
+
+    python tests/benchmark.py --duration 30 --concurrency 50 --label baseline
+    python tests/benchmark.py --duration 30 --concurrency 50 --compare benchmark_results/baseline.json
+
+With --compare, the run is checked against an earlier result file and the
+script exits with status 1 if throughput drops or a p95 grows by more than
+--max-regression.
+
+With --isolation, status queries run twice for --duration: alone, then
+next to --creators clients creating tasks back to back. Creates wait on
+the upstream, so the query p99 of both phases should match.
+
+    python tests/benchmark.py --isolation --duration 15 --concurrency 20 --creators 20
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from collections import defaultdict
+from typing import Dict, List, Any, Optional
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_ark import FakeArk, FakeArkConfig, FakeArkServer  # noqa: E402
+from harness import app_client  # noqa: E402
+
+API = "/api/v1/videos"
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies: List[float], errors: int) -> Dict[str, Any]:
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2)
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).strip()
+    except Exception:
+        return None
+
+
+class LoadRunner:
+    """Concurrent clients issuing a weighted request mix against the app"""
+
+    def __init__(self, client: httpx.AsyncClient, mix: Dict[str, float], seed: int):
+        self.client = client
+        self.mix = mix
+        self.random = random.Random(seed)
+        self.task_ids: List[str] = []
+        self.succeeded: List[str] = []
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.status_codes: Dict[str, int] = defaultdict(int)
+
+    async def _timed(self, operation: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[operation] += 1
+            self.status_codes["transport_error"] += 1
+            return None
+        self.latencies[operation].append(time.perf_counter() - start)
+        self.status_codes[str(response.status_code)] += 1
+        if response.status_code >= 500:
+            self.errors[operation] += 1
+        return response
+
+    async def create(self) -> None:
+        response = await self._timed(
+            "create", "POST", f"{API}/tasks",
+            json={"prompt": f"benchmark clip {self.random.randrange(10 ** 6)}"}
+        )
+        if response is not None and response.status_code == 201:
+            self.task_ids.append(response.json()["data"]["id"])
+
+    async def poll(self) -> None:
+        if not self.task_ids:
+            await self.create()
+            return
+        task_id = self.random.choice(self.task_ids)
+        response = await self._timed("poll", "GET", f"{API}/tasks/{task_id}")
+        if response is not None and response.status_code == 200:
+            if response.json()["data"].get("status") == "succeeded" and task_id not in self.succeeded:
+                self.succeeded.append(task_id)
+
+    async def download(self) -> None:
+        if not self.succeeded:
+            await self.poll()
+            return
+        task_id = self.random.choice(self.succeeded)
+        await self._timed("download", "GET", f"{API}/tasks/{task_id}/video")
+
+    async def client_loop(self, deadline: float) -> None:
+        operations = list(self.mix)
+        weights = [self.mix[o] for o in operations]
+        while time.monotonic() < deadline:
+            operation = self.random.choices(operations, weights)[0]
+            await getattr(self, operation)()
+            # A request answered from memory never suspends in-process; yield as a socket read would
+            await asyncio.sleep(0)
+
+
+async def run(args) -> Dict[str, Any]:
+    fake = FakeArk(FakeArkConfig(
+        latency=args.upstream_latency,
+        failure_rate=args.upstream_failure_rate,
+        queue_seconds=args.queue_seconds,
+        task_seconds_min=args.task_seconds_min,
+        task_seconds_max=args.task_seconds_max,
+        video_bytes=args.video_bytes
+    ), seed=args.seed)
+
+    async with FakeArkServer(fake) as server:
+        data_dir = tempfile.mkdtemp(prefix="sora2-bench-")
+        async with app_client(data_dir, ARK_BASE_URL=server.api_url) as (_, client):
+            runner = LoadRunner(client, {"create": args.create, "poll": args.poll, "download": args.download}, args.seed)
+
+            # Seed tasks so polls have something to hit, then measure from a clean slate
+            for _ in range(args.seed_tasks):
+                await runner.create()
+            runner.latencies.clear()
+            runner.errors.clear()
+            runner.status_codes.clear()
+            fake.reset_stats()
+
+            started = time.monotonic()
+            deadline = started + args.duration
+            await asyncio.gather(*(runner.client_loop(deadline) for _ in range(args.concurrency)))
+            elapsed = time.monotonic() - started
+
+    operations = {op: summarize(runner.latencies[op], runner.errors[op]) for op in ("create", "poll", "download")}
+    all_latencies = [v for values in runner.latencies.values() for v in values]
+    total = len(all_latencies) + runner.status_codes.get("transport_error", 0)
+    upstream_calls = fake.upstream_calls
+    return {
+        "label": args.label,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": git_commit(),
+        "config": {
+            "duration": args.duration,
+            "concurrency": args.concurrency,
+            "mix": {"create": args.create, "poll": args.poll, "download": args.download},
+            "upstream_latency": args.upstream_latency,
+            "upstream_failure_rate": args.upstream_failure_rate,
+            "task_seconds": [args.task_seconds_min, args.task_seconds_max],
+            "seed": args.seed
+        },
+        "results": {
+            "requests": total,
+            "elapsed_s": round(elapsed, 2),
+            "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+            "overall": summarize(all_latencies, sum(runner.errors.values())),
+            "operations": operations,
+            "status_codes": dict(runner.status_codes),
+            "upstream": {
+                "calls": upstream_calls,
+                "by_endpoint": dict(fake.calls),
+                "amplification": round(upstream_calls / total, 4) if total else 0.0
+            },
+            "tasks_created": len(runner.task_ids)
+        }
+    }
+
+
+async def isolation(args) -> Dict[str, Any]:
+    """Status query latency alone and with creates in flight"""
+    fake = FakeArk(FakeArkConfig(
+        latency=args.upstream_latency,
+        queue_seconds=args.queue_seconds,
+        task_seconds_min=args.task_seconds_min,
+        task_seconds_max=args.task_seconds_max
+    ), seed=args.seed)
+
+    phases: Dict[str, Any] = {}
+    async with FakeArkServer(fake) as server:
+        data_dir = tempfile.mkdtemp(prefix="sora2-isolation-")
+        async with app_client(data_dir, ARK_BASE_URL=server.api_url) as (_, client):
+            seeder = LoadRunner(client, {"create": 1.0}, args.seed)
+            for _ in range(args.seed_tasks):
+                await seeder.create()
+
+            for phase, creators in (("queries_alone", 0), ("with_creates", args.creators)):
+                queries = LoadRunner(client, {"poll": 1.0}, args.seed)
+                queries.task_ids = list(seeder.task_ids)
+                creates = LoadRunner(client, {"create": 1.0}, args.seed + 1)
+                fake.reset_stats()
+                deadline = time.monotonic() + args.duration
+                await asyncio.gather(
+                    *(queries.client_loop(deadline) for _ in range(args.concurrency)),
+                    *(creates.client_loop(deadline) for _ in range(creators))
+                )
+                phases[phase] = {
+                    "query": summarize(queries.latencies["poll"], queries.errors["poll"]),
+                    "create": summarize(creates.latencies["create"], creates.errors["create"]),
+                    "upstream": dict(fake.calls)
+                }
+
+    alone, loaded = phases["queries_alone"]["query"]["p99_ms"], phases["with_creates"]["query"]["p99_ms"]
+    return {
+        "label": args.label,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": git_commit(),
+        "config": {
+            "duration": args.duration,
+            "concurrency": args.concurrency,
+            "creators": args.creators,
+            "upstream_latency": args.upstream_latency,
+            "seed": args.seed
+        },
+        "results": {
+            **phases,
+            "query_p99_ratio": round(loaded / alone, 2) if alone else 0.0
+        }
+    }
+
+
+def print_isolation(result: Dict[str, Any]) -> None:
+    r = result["results"]
+    print(f"\n=== {result['label']} ({result['git_commit'] or 'unknown commit'}) ===")
+    print(f"{'phase':<15}{'queries':>9}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'creates':>9}{'create p99 ms':>15}")
+    for phase in ("queries_alone", "with_creates"):
+        query, create = r[phase]["query"], r[phase]["create"]
+        print(
+            f"{phase:<15}{query['count']:>9}{query['errors']:>8}{query['p50_ms']:>10}{query['p95_ms']:>10}"
+            f"{query['p99_ms']:>10}{create['count']:>9}{create['p99_ms']:>15}"
+        )
+    print(f"query p99 with creates / alone: {r['query_p99_ratio']}")
+
+
+def print_report(result: Dict[str, Any]) -> None:
+    r = result["results"]
+    print(f"\n=== {result['label']} ({result['git_commit'] or 'unknown commit'}) ===")
+    print(f"requests: {r['requests']}  elapsed: {r['elapsed_s']}s  throughput: {r['throughput_rps']} req/s")
+    print(f"{'operation':<10}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, op in [("overall", r["overall"])] + list(r["operations"].items()):
+        print(f"{name:<10}{op['count']:>8}{op['errors']:>8}{op['p50_ms']:>10}{op['p95_ms']:>10}{op['p99_ms']:>10}")
+    u = r["upstream"]
+    print(f"upstream calls: {u['calls']} {u['by_endpoint']}  amplification: {u['amplification']} per request")
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> bool:
+    """Print deltas against baseline; returns False on a regression beyond max_regression"""
+    ok = True
+    current, previous = result["results"], baseline["results"]
+    print(f"\n--- compared with {baseline['label']} ({baseline.get('git_commit')}) ---")
+
+    def delta(new: float, old: float) -> float:
+        return (new - old) / old if old else 0.0
+
+    change = delta(current["throughput_rps"], previous["throughput_rps"])
+    print(f"throughput: {previous['throughput_rps']} -> {current['throughput_rps']} ({change:+.1%})")
+    if change < -max_regression:
+        ok = False
+    for name in ("overall", *current["operations"]):
+        new = current["overall"] if name == "overall" else current["operations"][name]
+        old = previous["overall"] if name == "overall" else previous["operations"].get(name)
+        if not old or not old["count"] or not new["count"]:
+            continue
+        change = delta(new["p95_ms"], old["p95_ms"])
+        flag = "  REGRESSION" if change > max_regression else ""
+        print(f"{name} p95: {old['p95_ms']} -> {new['p95_ms']} ms ({change:+.1%}){flag}")
+        if flag:
+            ok = False
+    change = current["upstream"]["amplification"] - previous["upstream"]["amplification"]
+    print(f"amplification: {previous['upstream']['amplification']} -> {current['upstream']['amplification']} ({change:+.4f})")
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load benchmark against a fake Ark upstream")
+    parser.add_argument("--label", default="run")
+    parser.add_argument("--duration", type=float, default=20.0, help="Measured seconds")
+    parser.add_argument("--concurrency", type=int, default=50, help="Concurrent clients")
+    parser.add_argument("--create", type=float, default=0.1, help="Weight of create requests")
+    parser.add_argument("--poll", type=float, default=0.8, help="Weight of status polls")
+    parser.add_argument("--download", type=float, default=0.1, help="Weight of video downloads")
+    parser.add_argument("--seed-tasks", type=int, default=20)
+    parser.add_argument("--upstream-latency", type=float, default=0.05)
+    parser.add_argument("--upstream-failure-rate", type=float, default=0.0)
+    parser.add_argument("--queue-seconds", type=float, default=1.0)
+    parser.add_argument("--task-seconds-min", type=float, default=3.0)
+    parser.add_argument("--task-seconds-max", type=float, default=8.0)
+    parser.add_argument("--video-bytes", type=int, default=256 * 1024)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output-dir", default="benchmark_results")
+    parser.add_argument("--compare", help="Earlier result JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed relative regression")
+    parser.add_argument("--isolation", action="store_true", help="Compare query latency alone and with creates")
+    parser.add_argument("--creators", type=int, default=20, help="Clients creating tasks in the --isolation run")
+    args = parser.parse_args()
+    if args.isolation and args.compare:
+        parser.error("--compare applies to the mixed load run, not --isolation")
+
+    if args.isolation:
+        result = asyncio.run(isolation(args))
+        print_isolation(result)
+    else:
+        result = asyncio.run(run(args))
+        print_report(result)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, f"{args.label}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"saved: {path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if not compare(result, baseline, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Batch create throughput against sequential single creates
+
+Starts tests/fake_ark.py on a local port and drives the app in-process.
+The same number of tasks is created twice: once as --items sequential
+POST /api/v1/videos/tasks requests, the way a client submits a storyboard
+one prompt at a time, and once as a single POST /api/v1/videos/tasks:batch.
+Reports wall time, tasks per second, failed items and the upstream calls
+each approach made (creates, plus the poller's refreshes of the new tasks
+while they were being submitted).
+
+    python tests/benchmark_batch.py --items 100 --upstream-latency 0.2
+    python tests/benchmark_batch.py --items 100 --concurrency 16 --rate 50
+
+--concurrency and --rate set BATCH_CONCURRENCY and BATCH_RATE_PER_SECOND
+(burst included); with the defaults the batch runs at the app's defaults.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+from typing import Dict, Any
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_ark import FakeArk, FakeArkConfig, FakeArkServer  # noqa: E402
+from harness import app_client  # noqa: E402
+
+API = "/api/v1/videos"
+
+
+async def sequential(client: httpx.AsyncClient, items: int) -> int:
+    """One POST per task, each waiting for the previous; returns failed creates"""
+    failed = 0
+    for i in range(items):
+        response = await client.post(f"{API}/tasks", json={"prompt": f"Storyboard shot {i}, sequential"})
+        if response.status_code != 201:
+            failed += 1
+    return failed
+
+
+async def batch(client: httpx.AsyncClient, items: int) -> int:
+    """All tasks in one batch request; returns failed items"""
+    response = await client.post(
+        f"{API}/tasks:batch",
+        json={"items": [{"prompt": f"Storyboard shot {i}, batch"} for i in range(items)]}
+    )
+    response.raise_for_status()
+    return response.json()["data"]["failed"]
+
+
+async def run(args) -> Dict[str, Any]:
+    fake = FakeArk(FakeArkConfig(latency=args.upstream_latency, task_seconds_min=1e6, task_seconds_max=1e6), seed=args.seed)
+    overrides = {"DEDUPE_ENABLED": "false", "BATCH_MAX_ITEMS": str(max(args.items, 1))}
+    if args.concurrency:
+        overrides["BATCH_CONCURRENCY"] = str(args.concurrency)
+    if args.rate:
+        overrides["BATCH_RATE_PER_SECOND"] = str(args.rate)
+        overrides["BATCH_RATE_BURST"] = str(max(1, int(args.rate)))
+
+    results: Dict[str, Any] = {}
+    async with FakeArkServer(fake) as server:
+        data_dir = tempfile.mkdtemp(prefix="sora2-batch-")
+        async with app_client(data_dir, ARK_BASE_URL=server.api_url, timeout=600, **overrides) as (_, client):
+            for label, submit in (("sequential", sequential), ("batch", batch)):
+                fake.reset_stats()
+                started = time.perf_counter()
+                failed = await submit(client, args.items)
+                elapsed = time.perf_counter() - started
+                results[label] = {
+                    "items": args.items,
+                    "failed": failed,
+                    "wall_s": round(elapsed, 3),
+                    "tasks_per_s": round(args.items / elapsed, 2) if elapsed else 0.0,
+                    "upstream_creates": fake.calls["create"],
+                    "upstream_calls": fake.upstream_calls
+                }
+    results["speedup"] = round(results["sequential"]["wall_s"] / results["batch"]["wall_s"], 2) if results["batch"]["wall_s"] else 0.0
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Batch create throughput against sequential single creates")
+    parser.add_argument("--items", type=int, default=50, help="Tasks created by each approach")
+    parser.add_argument("--upstream-latency", type=float, default=0.1)
+    parser.add_argument("--concurrency", type=int, default=0, help="BATCH_CONCURRENCY (0 keeps the app default)")
+    parser.add_argument("--rate", type=float, default=0, help="BATCH_RATE_PER_SECOND and burst (0 keeps the app default)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the result JSON here")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print(f"{'approach':<12}{'items':>7}{'failed':>8}{'wall s':>9}{'tasks/s':>9}{'creates':>9}{'upstream':>10}")
+    for label in ("sequential", "batch"):
+        r = results[label]
+        print(
+            f"{label:<12}{r['items']:>7}{r['failed']:>8}{r['wall_s']:>9}{r['tasks_per_s']:>9}"
+            f"{r['upstream_creates']:>9}{r['upstream_calls']:>10}"
+        )
+    print(f"batch speedup: {results['speedup']}x")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
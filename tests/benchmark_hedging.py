@@ -0,0 +1,166 @@
+"""
+Status query tail latency with and without hedged upstream lookups
+
+Starts tests/fake_ark.py on a local port with rare slow outliers (a small
+fraction of calls delayed by --outlier-latency), then drives status queries
+through the app in-process with the task cache and poller disabled, so
+every query is one upstream lookup. The same load runs with hedging off and
+on; a last run sends X-Request-Timeout to show deadlines capping latency
+(504 once they pass). Reports p50/p95/p99/max per run and the extra
+upstream load hedging cost.
+
+    python tests/benchmark_hedging.py --requests 4000 --outlier-rate 0.02 --outlier-latency 1.0
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from collections import Counter
+from typing import Dict, Any, List, Optional
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_ark import FakeArk, FakeArkConfig, FakeArkServer  # noqa: E402
+from benchmark import percentile  # noqa: E402
+from harness import app_client  # noqa: E402
+
+API = "/api/v1/videos"
+
+
+async def drive(
+    client: httpx.AsyncClient,
+    task_ids: List[str],
+    requests: int,
+    concurrency: int,
+    seed: int,
+    headers: Optional[Dict[str, str]] = None
+) -> Dict[str, Any]:
+    """Issue status queries from concurrent clients; latencies in seconds and status codes"""
+    rng = random.Random(seed)
+    latencies: List[float] = []
+    codes: Counter = Counter()
+    remaining = requests
+
+    async def client_loop() -> None:
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            task_id = rng.choice(task_ids)
+            start = time.perf_counter()
+            response = await client.get(f"{API}/tasks/{task_id}", headers=headers)
+            latencies.append(time.perf_counter() - start)
+            codes[response.status_code] += 1
+
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    return {"latencies": latencies, "codes": codes}
+
+
+def summarize(run: Dict[str, Any], lookups: int, hedges: int) -> Dict[str, Any]:
+    latencies = run["latencies"]
+    primary = lookups - hedges
+    return {
+        "requests": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "max_ms": round(max(latencies) * 1000, 1),
+        "upstream_lookups": lookups,
+        # Hedges over the lookups the queries needed anyway (concurrent queries of a task share one)
+        "extra_load_pct": round(hedges / primary * 100, 2) if primary else 0.0,
+        "status_codes": dict(run["codes"])
+    }
+
+
+async def run(args) -> Dict[str, Any]:
+    fake = FakeArk(FakeArkConfig(
+        latency=args.upstream_latency,
+        outlier_rate=args.outlier_rate,
+        outlier_latency=args.outlier_latency,
+        # Tasks never finish, so every query goes upstream
+        task_seconds_min=1e6,
+        task_seconds_max=1e6
+    ), seed=args.seed)
+
+    async with FakeArkServer(fake) as server:
+        data_dir = tempfile.mkdtemp(prefix="sora2-hedging-")
+        results: Dict[str, Any] = {}
+        async with app_client(
+            data_dir,
+            ARK_BASE_URL=server.api_url,
+            TASK_CACHE_TTL_SECONDS="0",
+            TASK_POLLER_ENABLED="false",
+            UPSTREAM_RATE_PER_SECOND="100000",
+            UPSTREAM_RATE_BURST="100000",
+            HEDGE_ENABLED="true",
+            HEDGE_PERCENTILE=str(args.percentile),
+            HEDGE_BUDGET_PERCENT=str(args.budget_percent)
+        ) as (app, client):
+            provider = app.state.video_service.providers["ark"]
+            hedger = provider.hedger
+            task_ids = []
+            for i in range(args.tasks):
+                response = await client.post(f"{API}/tasks", json={"prompt": f"Benchmark task {i}"})
+                response.raise_for_status()
+                task_ids.append(response.json()["data"]["id"])
+
+            # Warm up: the hedger learns the latency distribution before it hedges
+            await drive(client, task_ids, hedger.min_samples * 2, args.concurrency, args.seed)
+
+            runs = (
+                ("hedging_off", None, None),
+                ("hedging_on", hedger, None),
+                (f"deadline_{args.deadline}s", hedger, {"X-Request-Timeout": str(args.deadline)}),
+            )
+            for label, run_hedger, headers in runs:
+                provider.hedger = run_hedger
+                fake.reset_stats()
+                before = dict(hedger.counters)
+                run_result = await drive(client, task_ids, args.requests, args.concurrency, args.seed, headers)
+                counts = {name: hedger.counters[name] - before[name] for name in before}
+                results[label] = {
+                    **summarize(run_result, fake.calls["get"], counts["hedged"]),
+                    "hedges": counts["hedged"],
+                    "hedge_wins": counts["hedge_wins"],
+                    "budget_denied": counts["budget_denied"]
+                }
+            provider.hedger = hedger
+            results["hedge_delay_ms"] = hedger.get_stats()["delay_ms"]
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Status query tail latency with hedged upstream lookups")
+    parser.add_argument("--requests", type=int, default=4000, help="Status queries per run")
+    parser.add_argument("--concurrency", type=int, default=20, help="Concurrent clients")
+    parser.add_argument("--tasks", type=int, default=500, help="Tasks created and queried")
+    parser.add_argument("--upstream-latency", type=float, default=0.02)
+    parser.add_argument("--outlier-rate", type=float, default=0.02)
+    parser.add_argument("--outlier-latency", type=float, default=1.0)
+    parser.add_argument("--percentile", type=float, default=0.95, help="HEDGE_PERCENTILE")
+    parser.add_argument("--budget-percent", type=float, default=5.0, help="HEDGE_BUDGET_PERCENT")
+    parser.add_argument("--deadline", type=float, default=0.3, help="X-Request-Timeout of the last run")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the result JSON here")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print(f"hedge delay after warm-up: {results.pop('hedge_delay_ms')} ms")
+    print(f"{'run':<16}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}{'extra load':>12}{'hedges':>8}{'wins':>6}{'denied':>8}  status codes")
+    for label, r in results.items():
+        print(
+            f"{label:<16}{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}{r['max_ms']:>9}"
+            f"{r['extra_load_pct']:>11}%{r['hedges']:>8}{r['hedge_wins']:>6}{r['budget_denied']:>8}  {r['status_codes']}"
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+CPU cost per request of the task endpoints
+
+Drives the app in-process (ASGI, no sockets) against a mocked upstream.
+Status polls are answered from the task cache after the first fetch, so the
+measurement is routing, validation and response encoding. Reports CPU
+microseconds per request (process time, single thread) for creates, task
+list pages and status polls.
+
+    python tests/benchmark_serialization.py --requests 5000
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+from typing import Dict, Any
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from harness import app_client  # noqa: E402
+
+# A typical succeeded Ark task as returned upstream
+TASK = {
+    "id": "ark:cgt-20260101000000-abcde",
+    "model": "seedance-1-0-pro-250528",
+    "status": "succeeded",
+    "content": {"video_url": "https://ark-content.example.com/videos/cgt-20260101000000-abcde.mp4?X-Sign=" + "x" * 200},
+    "usage": {"completion_tokens": 108900, "total_tokens": 108900},
+    "created_at": 1767225600,
+    "updated_at": 1767225690,
+    "seed": 12345,
+    "resolution": "720p",
+    "ratio": "16:9",
+    "duration": 5,
+    "framespersecond": 24,
+}
+
+
+def upstream(request: httpx.Request) -> httpx.Response:
+    if request.method == "POST":
+        return httpx.Response(200, json={"id": f"cgt-{time.monotonic_ns()}"})
+    return httpx.Response(200, json={**TASK, "id": request.url.path.rsplit("/", 1)[-1]})
+
+
+async def measure(client: httpx.AsyncClient, method: str, url: str, requests: int, **kwargs) -> Dict[str, Any]:
+    # Warm up routing and validation caches
+    for _ in range(50):
+        (await client.request(method, url, **kwargs)).raise_for_status()
+    cpu, wall = time.process_time(), time.perf_counter()
+    for _ in range(requests):
+        response = await client.request(method, url, **kwargs)
+    cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+    response.raise_for_status()
+    return {
+        "requests": requests,
+        "cpu_us_per_request": round(cpu / requests * 1e6, 1),
+        "wall_us_per_request": round(wall / requests * 1e6, 1),
+        "response_bytes": len(response.content)
+    }
+
+
+async def run(args) -> Dict[str, Any]:
+    data_dir = tempfile.mkdtemp(prefix="sora2-serialization-")
+    async with app_client(data_dir, base_url="http://bench", DEDUPE_ENABLED="false") as (app, client):
+        for provider in app.state.video_service.providers.values():
+            provider._http = httpx.AsyncClient(base_url="http://upstream", transport=httpx.MockTransport(upstream))
+
+        # Creates also fill the task registry for the list pages
+        return {
+            "create": await measure(
+                client, "POST", "/api/v1/videos/tasks", args.requests // 5,
+                json={"prompt": "A drone threads through a canyon at dawn", "image_url": "https://example.com/a.png"}
+            ),
+            "list": await measure(client, "GET", f"/api/v1/videos/tasks?page_size={args.list_size}", args.requests // 5),
+            "query": await measure(client, "GET", f"/api/v1/videos/tasks/{TASK['id']}", args.requests),
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="CPU per request of the task endpoints")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--list-size", type=int, default=20)
+    parser.add_argument("--output", help="Write the result JSON here")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    print(f"{'endpoint':<10}{'cpu us/req':>12}{'wall us/req':>13}{'bytes':>8}")
+    for name, r in result.items():
+        print(f"{name:<10}{r['cpu_us_per_request']:>12}{r['wall_us_per_request']:>13}{r['response_bytes']:>8}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
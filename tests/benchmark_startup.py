@@ -0,0 +1,157 @@
+"""
+Cold start benchmark
+
+Launches fresh interpreters that import app.main, run the app lifespan and
+create one task against the fake Ark upstream (tests/fake_ark.py), and
+reports per phase medians:
+
+    process    interpreter start to exit, measured by the parent
+    import     `from app.main import app` (settings, logging, routes)
+    startup    lifespan startup until the worker is ready to serve
+    first      first create request, including any lazily built client
+
+    python tests/benchmark_startup.py --runs 15 --env prod --label after
+    python tests/benchmark_startup.py --compare benchmark_results/startup-before.json
+    python tests/benchmark_startup.py --block rich --label no-rich
+
+For a per-module breakdown of the import phase use
+`python -X importtime -c "import app.main"`.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import statistics
+import subprocess
+from typing import Dict, List, Any
+
+import httpx
+
+from harness import app_env
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import os, sys, json, time, asyncio
+# Simulate an image without these packages installed
+for name in filter(None, os.environ.get("BENCH_BLOCK_MODULES", "").split(",")):
+    sys.modules[name] = None
+t0 = time.perf_counter()
+from app.main import app
+t1 = time.perf_counter()
+import httpx
+
+async def main():
+    async with app.router.lifespan_context(app):
+        t2 = time.perf_counter()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            response = await client.post("/api/v1/videos/tasks", json={"prompt": "cold start"})
+            response.raise_for_status()
+        t3 = time.perf_counter()
+    return t2, t3
+
+t2, t3 = asyncio.run(main())
+print(json.dumps({"import": t1 - t0, "startup": t2 - t1, "first": t3 - t2}))
+"""
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Timed out waiting for {url}")
+
+
+def run_once(env: Dict[str, str], data_dir: str, run: int) -> Dict[str, float]:
+    env = {
+        **env,
+        "TASK_STORE_PATH": os.path.join(data_dir, f"tasks-{run}.db"),
+        "WEBHOOK_DB_PATH": os.path.join(data_dir, f"webhooks-{run}.db"),
+    }
+    started = time.perf_counter()
+    output = subprocess.check_output([sys.executable, "-c", CHILD], cwd=ROOT, env=env, text=True)
+    process = time.perf_counter() - started
+    timings = json.loads(output.strip().splitlines()[-1])
+    timings["process"] = process
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Cold start benchmark")
+    parser.add_argument("--label", default="startup")
+    parser.add_argument("--runs", type=int, default=15)
+    parser.add_argument("--env", default="prod", help="ENV for the app (dev enables rich logging)")
+    parser.add_argument("--block", action="append", default=[], help="Module to treat as not installed (repeatable)")
+    parser.add_argument("--output-dir", default="benchmark_results")
+    parser.add_argument("--compare", help="Earlier result JSON to compare against")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="sora2-startup-")
+    fake_port = free_port()
+    fake = subprocess.Popen([
+        sys.executable, os.path.join(ROOT, "tests", "fake_ark.py"), "--port", str(fake_port), "--latency", "0"
+    ], stdout=subprocess.DEVNULL)
+    env = {
+        **os.environ,
+        **app_env(
+            data_dir,
+            ENV=args.env,
+            ARK_BASE_URL=f"http://127.0.0.1:{fake_port}/api/v3",
+            BENCH_BLOCK_MODULES=",".join(args.block)
+        )
+    }
+
+    try:
+        wait_ready(f"http://127.0.0.1:{fake_port}/_stats")
+        # One untimed run so every run sees warm bytecode and page caches
+        run_once(env, data_dir, -1)
+        runs: List[Dict[str, float]] = [run_once(env, data_dir, i) for i in range(args.runs)]
+    finally:
+        fake.terminate()
+        fake.wait(timeout=30)
+
+    phases = ("process", "import", "startup", "first")
+    result: Dict[str, Any] = {
+        "label": args.label,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {"runs": args.runs, "env": args.env, "blocked": args.block},
+        "median_ms": {p: round(statistics.median(r[p] for r in runs) * 1000, 1) for p in phases},
+        "min_ms": {p: round(min(r[p] for r in runs) * 1000, 1) for p in phases},
+    }
+    print(f"\n=== {args.label} (ENV={args.env}, {args.runs} runs) ===")
+    print(f"{'phase':<10}{'median ms':>12}{'min ms':>10}")
+    for p in phases:
+        print(f"{p:<10}{result['median_ms'][p]:>12}{result['min_ms'][p]:>10}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\n--- compared with {baseline['label']} ---")
+        for p in phases:
+            old, new = baseline["median_ms"][p], result["median_ms"][p]
+            change = (new - old) / old if old else 0.0
+            print(f"{p:<10}{old:>10} -> {new:<10}({change:+.1%})")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, f"{args.label}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"saved: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Query throughput scaling with uvicorn worker count
+
+For each worker count, starts the fake Ark upstream (tests/fake_ark.py) and
+`uvicorn app.main:app --workers N` as subprocesses, creates some long
+running tasks, then hammers GET /api/v1/videos/tasks/{id} from several
+client processes. Prints requests/s per worker count with speedup and
+scaling efficiency relative to one worker, and saves the run as JSON.
+
+    python tests/benchmark_workers.py --workers 1 2 4 --duration 15
+
+Client processes share the machine with the workers; use --clients so the
+load generator is not the bottleneck (roughly one client process per worker
+plus one). Scaling is bounded by the number of CPU cores.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+from typing import List, Dict, Any
+
+import httpx
+
+from harness import app_env
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Timed out waiting for {url}")
+
+
+def client_process(base_url: str, task_ids: List[str], duration: float, concurrency: int, seed: int) -> Dict[str, Any]:
+    """Run in a child process: issue queries until duration elapses"""
+
+    async def run() -> Dict[str, Any]:
+        rng = random.Random(seed)
+        count, errors = 0, 0
+        latencies: List[float] = []
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+            deadline = time.monotonic() + duration
+
+            async def loop() -> None:
+                nonlocal count, errors
+                while time.monotonic() < deadline:
+                    start = time.perf_counter()
+                    try:
+                        response = await client.get(f"/api/v1/videos/tasks/{rng.choice(task_ids)}")
+                        if response.status_code != 200:
+                            errors += 1
+                    except httpx.HTTPError:
+                        errors += 1
+                    count += 1
+                    latencies.append(time.perf_counter() - start)
+
+            await asyncio.gather(*(loop() for _ in range(concurrency)))
+        return {"count": count, "errors": errors, "latencies": latencies}
+
+    return asyncio.run(run())
+
+
+def measure(workers: int, args, fake_url: str) -> Dict[str, Any]:
+    port = free_port()
+    data_dir = tempfile.mkdtemp(prefix=f"sora2-workers-{workers}-")
+    env = {
+        **os.environ,
+        **app_env(data_dir, ARK_BASE_URL=f"{fake_url}/api/v3", WEB_CONCURRENCY=str(workers))
+    }
+
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+        cwd=ROOT, env=env
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_ready(f"{base_url}/health")
+        task_ids = []
+        with httpx.Client(base_url=base_url, timeout=30) as client:
+            for i in range(args.tasks):
+                response = client.post("/api/v1/videos/tasks", json={"prompt": f"scaling {i}"})
+                response.raise_for_status()
+                task_ids.append(response.json()["data"]["id"])
+            # Warm every worker's cache and poller
+            for task_id in task_ids * workers * 2:
+                client.get(f"/api/v1/videos/tasks/{task_id}")
+
+        with multiprocessing.get_context("spawn").Pool(args.clients) as pool:
+            started = time.monotonic()
+            outcomes = pool.starmap(client_process, [
+                (base_url, task_ids, args.duration, args.concurrency, seed) for seed in range(args.clients)
+            ])
+            elapsed = time.monotonic() - started
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+
+    latencies = sorted(v for o in outcomes for v in o["latencies"])
+    count = sum(o["count"] for o in outcomes)
+
+    def pct(q: float) -> float:
+        return round(latencies[min(len(latencies) - 1, int(q / 100 * len(latencies)))] * 1000, 2) if latencies else 0.0
+
+    return {
+        "workers": workers,
+        "requests": count,
+        "errors": sum(o["errors"] for o in outcomes),
+        "throughput_rps": round(count / args.duration, 2),
+        "elapsed_s": round(elapsed, 2),
+        "p50_ms": pct(50),
+        "p95_ms": pct(95),
+        "p99_ms": pct(99)
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Query throughput vs. uvicorn worker count")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--clients", type=int, default=None, help="Client processes (default: max workers + 1)")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent requests per client process")
+    parser.add_argument("--tasks", type=int, default=50)
+    parser.add_argument("--upstream-latency", type=float, default=0.05)
+    parser.add_argument("--output-dir", default="benchmark_results")
+    args = parser.parse_args()
+    args.clients = args.clients or max(args.workers) + 1
+
+    fake_port = free_port()
+    fake = subprocess.Popen([
+        sys.executable, os.path.join(ROOT, "tests", "fake_ark.py"), "--port", str(fake_port),
+        "--latency", str(args.upstream_latency),
+        # Tasks stay running for the whole run so queries never turn terminal
+        "--queue-seconds", "5", "--task-seconds-min", "3600", "--task-seconds-max", "3600"
+    ])
+    fake_url = f"http://127.0.0.1:{fake_port}"
+    try:
+        wait_ready(f"{fake_url}/_stats")
+        results = [measure(workers, args, fake_url) for workers in args.workers]
+    finally:
+        fake.terminate()
+        fake.wait(timeout=30)
+
+    base = results[0]["throughput_rps"] / results[0]["workers"] if results and results[0]["throughput_rps"] else 0
+    print(f"\ncpu cores: {os.cpu_count()}, clients: {args.clients} x {args.concurrency}")
+    print(f"{'workers':>8}{'req/s':>12}{'speedup':>10}{'efficiency':>12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for r in results:
+        speedup = r["throughput_rps"] / results[0]["throughput_rps"] if results[0]["throughput_rps"] else 0.0
+        r["speedup"] = round(speedup, 2)
+        r["efficiency"] = round(r["throughput_rps"] / (base * r["workers"]), 2) if base else 0.0
+        print(f"{r['workers']:>8}{r['throughput_rps']:>12}{r['speedup']:>10}{r['efficiency']:>12}"
+              f"{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}{r['errors']:>8}")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, f"workers-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w") as f:
+        json.dump({
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "cpu_count": os.cpu_count(),
+            "config": {k: v for k, v in vars(args).items() if k != "output_dir"},
+            "results": results
+        }, f, indent=2)
+    print(f"saved: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Reference image preprocessing across source modes and output formats
+
+Runs grayscale, grayscale with alpha, palette, CMYK and 16-bit sources
+through process_image for every IMAGE_FORMAT and preprocessing mode, and
+checks that each comes out at the expected size and decodes in a mode the
+format supports. Prints one line per failure and exits with status 1 if any
+failed.
+
+    python tests/check_image_modes.py
+"""
+import io
+import os
+import sys
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.image_preprocess import MIME_TYPES, process_image  # noqa: E402
+
+TARGET = (320, 180)
+OUTPUT_MODES = {"JPEG": ("RGB",), "PNG": ("RGB", "RGBA"), "WEBP": ("RGB", "RGBA")}
+
+
+def sources():
+    """Encoded test images by name"""
+    images = {
+        "L": Image.new("L", (200, 300), 128),
+        "LA": Image.new("LA", (200, 300), (128, 64)),
+        "P": Image.new("RGB", (200, 300), (200, 30, 30)).convert("P"),
+        "P+transparency": Image.new("P", (200, 300), 0),
+        "CMYK": Image.new("CMYK", (200, 300), (0, 120, 120, 0)),
+        "I;16": Image.new("I;16", (200, 300), 40000),
+        "1": Image.new("1", (200, 300), 1),
+    }
+    images["P+transparency"].info["transparency"] = 0
+    encoded = {}
+    for name, image in images.items():
+        out = io.BytesIO()
+        image.save(out, format="TIFF" if image.mode == "CMYK" else "PNG")
+        encoded[name] = out.getvalue()
+    return encoded
+
+
+def main() -> None:
+    failures = 0
+    runs = 0
+    for name, data in sources().items():
+        for image_format in MIME_TYPES:
+            for mode in ("pad", "resize"):
+                runs += 1
+                label = f"{name} -> {image_format} ({mode})"
+                try:
+                    output = process_image(data, TARGET, mode, image_format, 90)
+                    with Image.open(io.BytesIO(output)) as result:
+                        size_ok = result.size == TARGET if mode == "pad" else max(result.size) <= max(TARGET)
+                        if result.format != image_format or result.mode not in OUTPUT_MODES[image_format] or not size_ok:
+                            raise ValueError(f"got {result.format} {result.mode} {result.size}")
+                except Exception as e:
+                    failures += 1
+                    print(f"FAIL  {label}: {type(e).__name__}: {e}")
+
+    if failures:
+        print(f"\n{failures}/{runs} failed")
+        sys.exit(1)
+    print(f"all {runs} conversions passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""
+Upstream behaviour checks against the fake Ark server
+
+Runs the app in-process against tests/fake_ark.py and checks what the
+service promises about its upstream traffic:
+
+- status cache: concurrent queries for one task share a single lookup
+- poller: query volume does not reach upstream; live tasks are refreshed
+  through the task-list endpoint
+- video proxy: concurrent first downloads fetch the file once, and Range
+  requests get 206 with the matching bytes
+- guard: retries absorb 429s and shrink the concurrency limit, repeated
+  500s open the circuit (calls fail fast without reaching upstream), and it
+  closes again after the cool-down
+
+Prints one line per check and exits with status 1 if any failed.
+
+    python tests/check_upstream.py
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+from typing import Any, Dict, List
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_ark import FakeArk, FakeArkConfig, FakeArkServer  # noqa: E402
+from harness import app_client  # noqa: E402
+
+API = "/api/v1/videos"
+BREAKER_COOLDOWN = 1.0
+
+
+class Checks:
+    """Collects check outcomes"""
+
+    def __init__(self):
+        self.failed: List[str] = []
+
+    def __call__(self, name: str, ok: bool, detail: str) -> None:
+        print(f"{'PASS' if ok else 'FAIL'}  {name}: {detail}")
+        if not ok:
+            self.failed.append(name)
+
+
+async def upstream_task(server: FakeArkServer) -> str:
+    """A task created on the fake directly, so the service has never seen it"""
+    async with httpx.AsyncClient() as client:
+        response = await client.post(
+            f"{server.api_url}/contents/generations/tasks",
+            json={"model": "fake", "content": [{"type": "text", "text": "check"}]}
+        )
+        response.raise_for_status()
+        return f"ark:{response.json()['id']}"
+
+
+async def wait_status(client: httpx.AsyncClient, task_id: str, status: str, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response = await client.get(f"{API}/tasks/{task_id}")
+        if response.status_code == 200 and response.json()["data"]["status"] == status:
+            return
+        await asyncio.sleep(0.1)
+    raise RuntimeError(f"{task_id} did not reach {status}")
+
+
+def guard_stats(app: Any) -> Dict[str, Any]:
+    return app.state.video_service.providers["ark"].guard.get_stats()
+
+
+async def check_coalescing(check: Checks, fake: FakeArk, server: FakeArkServer, client: httpx.AsyncClient) -> None:
+    task_id = await upstream_task(server)
+    fake.reset_stats()
+    responses = await asyncio.gather(*(client.get(f"{API}/tasks/{task_id}") for _ in range(50)))
+    ok = all(r.status_code == 200 for r in responses)
+    check("coalescing", ok and fake.calls["get"] == 1, f"50 concurrent queries, {fake.calls['get']} upstream lookups")
+
+
+async def check_poller(check: Checks, fake: FakeArk, client: httpx.AsyncClient, args) -> None:
+    task_ids = []
+    for i in range(args.tasks):
+        response = await client.post(f"{API}/tasks", json={"prompt": f"poller check {i}"})
+        response.raise_for_status()
+        task_ids.append(response.json()["data"]["id"])
+    fake.reset_stats()
+
+    queries = 0
+    deadline = time.monotonic() + args.duration
+
+    async def poll(offset: int) -> None:
+        nonlocal queries
+        while time.monotonic() < deadline:
+            response = await client.get(f"{API}/tasks/{task_ids[(queries + offset) % len(task_ids)]}")
+            response.raise_for_status()
+            queries += 1
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(*(poll(i) for i in range(args.tasks)))
+    upstream = fake.calls["get"] + fake.calls["list"]
+    check(
+        "poller",
+        upstream * 10 < queries and fake.calls["list"] > 0,
+        f"{queries} queries for {args.tasks} tasks, {upstream} upstream calls {dict(fake.calls)}"
+    )
+
+
+async def check_download(check: Checks, fake: FakeArk, client: httpx.AsyncClient) -> None:
+    response = await client.post(f"{API}/tasks", json={"prompt": "download check"})
+    response.raise_for_status()
+    task_id = response.json()["data"]["id"]
+    await wait_status(client, task_id, "succeeded")
+    fake.reset_stats()
+
+    first, second = await asyncio.gather(client.get(f"{API}/tasks/{task_id}/video"), client.get(f"{API}/tasks/{task_id}/video"))
+    ok = first.status_code == second.status_code == 200 and first.content == second.content
+    ok = ok and len(first.content) == fake.config.video_bytes
+    check("download single-flight", ok and fake.calls["file"] == 1, f"2 concurrent downloads, {fake.calls['file']} upstream fetches")
+
+    ranged = await client.get(f"{API}/tasks/{task_id}/video", headers={"Range": "bytes=100-1123"})
+    ok = ranged.status_code == 206 and ranged.headers.get("content-length") == "1024" and ranged.content == first.content[100:1124]
+    check("download range", ok and fake.calls["file"] == 1, f"status {ranged.status_code}, {len(ranged.content)} bytes")
+
+
+async def check_guard(check: Checks, fake: FakeArk, server: FakeArkServer, client: httpx.AsyncClient, app: Any) -> None:
+    task_ids = [await upstream_task(server) for _ in range(100)]
+    limit = guard_stats(app)["concurrency_limit"]
+    before = guard_stats(app)
+
+    fake.config.rate_limit_rate = 0.2
+    semaphore = asyncio.Semaphore(10)
+
+    async def query(task_id: str) -> int:
+        async with semaphore:
+            return (await client.get(f"{API}/tasks/{task_id}")).status_code
+
+    codes = await asyncio.gather(*(query(task_id) for task_id in task_ids))
+    fake.config.rate_limit_rate = 0.0
+    after = guard_stats(app)
+    ok = codes.count(200) >= 95 and after["retries"] > before["retries"] and after["concurrency_limit"] < limit
+    check(
+        "guard retries 429",
+        ok,
+        f"{codes.count(200)}/100 answered, {after['retries'] - before['retries']} retries, "
+        f"concurrency limit {limit} -> {after['concurrency_limit']}"
+    )
+
+    # Fresh tasks: ones queried above are answered from the cache and the poller
+    fresh = [await upstream_task(server) for _ in range(23)]
+    fake.config.failure_rate = 1.0
+    codes = [(await client.get(f"{API}/tasks/{task_id}")).status_code for task_id in fresh[:3]]
+    opened = guard_stats(app)["circuit"] == "open"
+    calls = fake.calls["get"]
+    started = time.perf_counter()
+    fast = [(await client.get(f"{API}/tasks/{task_id}")).status_code for task_id in fresh[3:]]
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    ok = opened and fake.calls["get"] == calls and 200 not in codes + fast
+    check(
+        "guard opens circuit",
+        ok,
+        f"circuit {'open' if opened else 'closed'}, 20 queries in {elapsed_ms:.0f} ms with "
+        f"{fake.calls['get'] - calls} upstream calls, status {sorted(set(fast))}"
+    )
+
+    fake.config.failure_rate = 0.0
+    await asyncio.sleep(BREAKER_COOLDOWN)
+    # The poller may hold the single half-open trial call for a moment
+    for _ in range(20):
+        response = await client.get(f"{API}/tasks/{fresh[0]}")
+        if response.status_code == 200:
+            break
+        await asyncio.sleep(0.1)
+    closed = guard_stats(app)["circuit"] == "closed"
+    check("guard closes circuit", response.status_code == 200 and closed, f"status {response.status_code} after the cool-down")
+
+
+async def run(args) -> List[str]:
+    fake = FakeArk(FakeArkConfig(
+        latency=args.upstream_latency,
+        queue_seconds=0.2,
+        task_seconds_min=0.5,
+        task_seconds_max=1.0,
+        video_bytes=64 * 1024
+    ), seed=args.seed)
+    check = Checks()
+
+    async with FakeArkServer(fake) as server:
+        data_dir = tempfile.mkdtemp(prefix="sora2-check-")
+        async with app_client(
+            data_dir,
+            ARK_BASE_URL=server.api_url,
+            # Failures are expected here; only the check lines are of interest
+            LOG_LEVEL="CRITICAL",
+            HEDGE_ENABLED="false",
+            TASK_POLLER_MIN_INTERVAL="0.5",
+            UPSTREAM_BREAKER_FAILURES="5",
+            UPSTREAM_BREAKER_COOLDOWN=str(BREAKER_COOLDOWN),
+            UPSTREAM_RETRY_BASE_DELAY="0.05",
+            UPSTREAM_RETRY_MAX_DELAY="0.2"
+        ) as (app, client):
+            await check_coalescing(check, fake, server, client)
+            await check_download(check, fake, client)
+            # Long running tasks, so the poller keeps tracking them for the whole run
+            fake.config.task_seconds_min = fake.config.task_seconds_max = 1e6
+            await check_poller(check, fake, client, args)
+            await check_guard(check, fake, server, client, app)
+    return check.failed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Upstream behaviour checks against the fake Ark server")
+    parser.add_argument("--tasks", type=int, default=20, help="Live tasks in the poller check")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds of client polling in the poller check")
+    parser.add_argument("--upstream-latency", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    failed = asyncio.run(run(args))
+    if failed:
+        print(f"\n{len(failed)} failed: {', '.join(failed)}")
+        sys.exit(1)
+    print("\nall checks passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""
+In-process fake of the Ark content generation API
+
+Serves the endpoints this service calls (create, get, list, cancel/delete,
+video file)
+with configurable latency (including rare slow outliers), failure rate and task durations, so the app can
+be exercised without touching the paid API.
+
+Run standalone:
+    python tests/fake_ark.py --port 9100 --latency 0.05 --failure-rate 0.01
+
+then start the app with ARK_BASE_URL=http://127.0.0.1:9100/api/v3
+"""
+import time
+import uuid
+import random
+import asyncio
+import argparse
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+
+@dataclass
+class FakeArkConfig:
+    latency: float = 0.05            # Mean response latency in seconds (uniform 0.5x-1.5x)
+    outlier_rate: float = 0.0        # Fraction of API calls delayed by outlier_latency on top
+    outlier_latency: float = 1.0     # Extra delay of an outlier call in seconds
+    failure_rate: float = 0.0        # Fraction of API calls answered with HTTP 500
+    rate_limit_rate: float = 0.0     # Fraction of API calls answered with HTTP 429
+    queue_seconds: float = 2.0       # Time a task stays "queued"
+    task_seconds_min: float = 5.0    # Total task duration range (queued + running)
+    task_seconds_max: float = 15.0
+    task_failure_rate: float = 0.0   # Fraction of tasks that end "failed"
+    video_bytes: int = 256 * 1024    # Size of the generated video file
+
+
+@dataclass
+class FakeTask:
+    id: str
+    model: str
+    created_at: float
+    duration: float
+    fails: bool
+    cancelled: bool = False
+    extra: Dict = field(default_factory=dict)
+
+
+class FakeArk:
+    """Fake Ark upstream; `app` is an ASGI application, `calls` counts requests per endpoint"""
+
+    def __init__(self, config: Optional[FakeArkConfig] = None, seed: Optional[int] = None):
+        self.config = config or FakeArkConfig()
+        self.random = random.Random(seed)
+        self.tasks: Dict[str, FakeTask] = {}
+        self.calls: Counter = Counter()
+        self.base_url = ""
+        self.app = Starlette(routes=[
+            Route("/api/v3/contents/generations/tasks", self.create_task, methods=["POST"]),
+            Route("/api/v3/contents/generations/tasks", self.list_tasks, methods=["GET"]),
+            Route("/api/v3/contents/generations/tasks/{task_id}", self.get_task, methods=["GET"]),
+            Route("/api/v3/contents/generations/tasks/{task_id}", self.delete_task, methods=["DELETE"]),
+            Route("/files/{task_id}.mp4", self.get_file, methods=["GET"]),
+            Route("/_stats", self.stats, methods=["GET"]),
+        ])
+        self._video = bytes(self.config.video_bytes)
+
+    @property
+    def upstream_calls(self) -> int:
+        """API calls, excluding video file downloads"""
+        return sum(count for name, count in self.calls.items() if name != "file")
+
+    def reset_stats(self) -> None:
+        self.calls.clear()
+
+    async def _simulate(self, name: str) -> Optional[Response]:
+        self.calls[name] += 1
+        config = self.config
+        if config.latency > 0:
+            await asyncio.sleep(config.latency * self.random.uniform(0.5, 1.5))
+        if config.outlier_rate > 0 and self.random.random() < config.outlier_rate:
+            # Slow replica / GC pause / queueing: the tail that hedging targets
+            await asyncio.sleep(config.outlier_latency)
+        roll = self.random.random()
+        if roll < config.failure_rate:
+            return JSONResponse({"error": {"code": "InternalServiceError", "message": "fake failure"}}, status_code=500)
+        if roll < config.failure_rate + config.rate_limit_rate:
+            return JSONResponse(
+                {"error": {"code": "RateLimitExceeded", "message": "fake rate limit"}},
+                status_code=429, headers={"Retry-After": "1"}
+            )
+        return None
+
+    def _status(self, task: FakeTask) -> str:
+        if task.cancelled:
+            return "cancelled"
+        elapsed = time.time() - task.created_at
+        if elapsed < min(self.config.queue_seconds, task.duration):
+            return "queued"
+        if elapsed < task.duration:
+            return "running"
+        return "failed" if task.fails else "succeeded"
+
+    def _render(self, task: FakeTask) -> Dict:
+        status = self._status(task)
+        result = {
+            "id": task.id,
+            "model": task.model,
+            "status": status,
+            "created_at": int(task.created_at),
+            "updated_at": int(min(time.time(), task.created_at + task.duration)),
+            **task.extra
+        }
+        if status == "succeeded":
+            result["content"] = {"video_url": f"{self.base_url}/files/{task.id}.mp4"}
+        elif status == "failed":
+            result["error"] = {"code": "OutputVideoSensitiveContentDetected", "message": "fake task failure"}
+        return result
+
+    async def create_task(self, request: Request) -> Response:
+        error = await self._simulate("create")
+        if error is not None:
+            return error
+        body = await request.json()
+        if not body.get("content"):
+            return JSONResponse({"error": {"code": "InvalidParameter", "message": "content is required"}}, status_code=400)
+        config = self.config
+        task = FakeTask(
+            id=f"cgt-{uuid.uuid4().hex[:20]}",
+            model=body.get("model", ""),
+            created_at=time.time(),
+            duration=self.random.uniform(config.task_seconds_min, config.task_seconds_max),
+            fails=self.random.random() < config.task_failure_rate,
+            extra={k: body[k] for k in ("duration", "generate_audio", "resolution", "ratio") if k in body}
+        )
+        self.tasks[task.id] = task
+        return JSONResponse({"id": task.id})
+
+    async def get_task(self, request: Request) -> Response:
+        error = await self._simulate("get")
+        if error is not None:
+            return error
+        task = self.tasks.get(request.path_params["task_id"])
+        if task is None:
+            return JSONResponse({"error": {"code": "ResourceNotFound", "message": "task not found"}}, status_code=404)
+        return JSONResponse(self._render(task))
+
+    async def list_tasks(self, request: Request) -> Response:
+        error = await self._simulate("list")
+        if error is not None:
+            return error
+        page_num = int(request.query_params.get("page_num", 1))
+        page_size = int(request.query_params.get("page_size", 10))
+        ids = request.query_params.getlist("filter.task_ids")
+        status = request.query_params.get("filter.status")
+        model = request.query_params.get("filter.model")
+        tasks = [self.tasks[i] for i in ids if i in self.tasks] if ids else list(self.tasks.values())
+        if model:
+            tasks = [t for t in tasks if t.model == model]
+        items = [self._render(t) for t in tasks]
+        if status:
+            items = [item for item in items if item["status"] == status]
+        start = (page_num - 1) * page_size
+        return JSONResponse({"items": items[start:start + page_size], "total": len(items)})
+
+    async def delete_task(self, request: Request) -> Response:
+        """Like Ark: cancels queued tasks, deletes finished ones, refuses running or cancelled ones"""
+        error = await self._simulate("delete")
+        if error is not None:
+            return error
+        task = self.tasks.get(request.path_params["task_id"])
+        if task is None:
+            return JSONResponse({"error": {"code": "ResourceNotFound", "message": "task not found"}}, status_code=404)
+        status = self._status(task)
+        if status == "queued":
+            task.cancelled = True
+        elif status in ("succeeded", "failed"):
+            del self.tasks[task.id]
+        else:
+            return JSONResponse(
+                {"error": {"code": "InvalidParameter", "message": f"cannot delete a {status} task"}}, status_code=400
+            )
+        return JSONResponse({})
+
+    async def get_file(self, request: Request) -> Response:
+        self.calls["file"] += 1
+        task = self.tasks.get(request.path_params["task_id"])
+        if task is None or self._status(task) != "succeeded":
+            return Response(status_code=404)
+        return Response(self._video, media_type="video/mp4")
+
+    async def stats(self, request: Request) -> Response:
+        return JSONResponse({"calls": dict(self.calls), "tasks": len(self.tasks)})
+
+
+class FakeArkServer:
+    """Run a FakeArk on a local port inside the current event loop"""
+
+    def __init__(self, fake: FakeArk, host: str = "127.0.0.1", port: int = 0):
+        self.fake = fake
+        self.host = host
+        self.port = port
+        self._server = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def api_url(self) -> str:
+        return f"{self.fake.base_url}/api/v3"
+
+    async def __aenter__(self) -> "FakeArkServer":
+        import uvicorn
+
+        config = uvicorn.Config(self.fake.app, host=self.host, port=self.port, log_level="warning", access_log=False)
+        self._server = uvicorn.Server(config)
+        self._task = asyncio.create_task(self._server.serve())
+        while not self._server.started:
+            if self._task.done():
+                self._task.result()
+            await asyncio.sleep(0.01)
+        port = self._server.servers[0].sockets[0].getsockname()[1]
+        self.fake.base_url = f"http://{self.host}:{port}"
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self._server.should_exit = True
+        await self._task
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fake Ark content generation API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--outlier-rate", type=float, default=0.0)
+    parser.add_argument("--outlier-latency", type=float, default=1.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--queue-seconds", type=float, default=2.0)
+    parser.add_argument("--task-seconds-min", type=float, default=5.0)
+    parser.add_argument("--task-seconds-max", type=float, default=15.0)
+    parser.add_argument("--task-failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    fake = FakeArk(FakeArkConfig(
+        latency=args.latency,
+        outlier_rate=args.outlier_rate,
+        outlier_latency=args.outlier_latency,
+        failure_rate=args.failure_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        queue_seconds=args.queue_seconds,
+        task_seconds_min=args.task_seconds_min,
+        task_seconds_max=args.task_seconds_max,
+        task_failure_rate=args.task_failure_rate
+    ))
+    fake.base_url = f"http://{args.host}:{args.port}"
+    print(f"Fake Ark listening on {fake.base_url}/api/v3")
+    uvicorn.run(fake.app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+App setup shared by the benchmark and replay scripts
+
+app_env builds the environment of an app instance that keeps its state
+under a throwaway data directory; app_client applies it, runs the app's
+lifespan and yields a client that calls the app in-process (ASGI, no
+sockets). Scripts that start uvicorn pass app_env to the subprocess.
+
+    data_dir = tempfile.mkdtemp(prefix="sora2-bench-")
+    async with app_client(data_dir, ARK_BASE_URL=server.api_url) as (app, client):
+        await client.get("/api/v1/videos/tasks")
+"""
+import os
+from contextlib import asynccontextmanager
+from typing import Dict, Tuple, AsyncIterator, Any
+
+import httpx
+
+# Required settings; kept when already set in the environment
+PLACEHOLDER_KEYS = ("OPENAI_API_KEY", "BYTEDANCE_ARK_API_KEY", "BYTEDANCE_MODEL_ID")
+
+
+def app_env(data_dir: str, **overrides: str) -> Dict[str, str]:
+    """Settings for an app whose stores and caches live in data_dir; overrides win"""
+    env = {
+        "VIDEO_PROVIDERS": "ark",
+        "TASK_STORE_PATH": os.path.join(data_dir, "tasks.db"),
+        "WEBHOOK_DB_PATH": os.path.join(data_dir, "webhooks.db"),
+        "VIDEO_CACHE_DIR": os.path.join(data_dir, "videos"),
+        "IMAGE_CACHE_DIR": os.path.join(data_dir, "images"),
+        "LOG_LEVEL": "WARNING",
+        "ENV": "prod",
+    }
+    for key in PLACEHOLDER_KEYS:
+        env[key] = os.environ.get(key) or "benchmark"
+    env.update(overrides)
+    return env
+
+
+@asynccontextmanager
+async def app_client(
+    data_dir: str,
+    base_url: str = "http://benchmark",
+    timeout: float = 60.0,
+    **overrides: str
+) -> AsyncIterator[Tuple[Any, httpx.AsyncClient]]:
+    """Start the app in this process with app_env settings; yields (app, client)"""
+    os.environ.update(app_env(data_dir, **overrides))
+
+    # Settings are read at import, so only after the environment is in place
+    from app.main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=timeout) as client:
+            yield app, client
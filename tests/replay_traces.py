@@ -0,0 +1,414 @@
+"""
+Replay captured traffic against the app offline
+
+Reads trace files written with TRACE_CAPTURE_PATH (plain or rotated .gz),
+then sends the recorded requests through the app in-process (ASGI, no
+sockets) at their recorded offsets. Every provider's HTTP client is
+replaced by the recorded upstream:
+
+    create      the next recorded create response of that provider, in order
+    task status the task's latest recorded snapshot at the replay clock
+                (single fetches and task-list pages alike), "queued" before
+                the first one
+    cancel      accepted
+
+Upstream delays are the recorded ones, sampled per provider and operation.
+Time is scaled by --speed: 1 keeps the recorded timing, 10 compresses it
+tenfold, and 0 sends requests as fast as --concurrency allows, without
+upstream delays. Task ids from the recording (including local admission
+ids) are mapped to the ids the replayed creates return. The app runs with
+this environment's settings, so export production's (ADMISSION_*,
+DEDUPE_*, ...) to reproduce them. Video downloads are skipped because the
+recorded video URLs are redacted.
+
+--profile cprofile writes one .prof file per route and prints its top
+functions. Requests run one at a time in this mode, so each profile only
+covers its own route. Background work that runs while a request waits is
+included. --profile sample samples the event loop thread's stack every
+--sample-ms instead. The requests keep their concurrency, and samples are
+attributed to a route when it is the only one in flight; time the loop
+spends waiting for I/O counts as idle. Samples are written as folded stacks (<route>.folded) for flamegraph.pl or speedscope.
+
+    python tests/replay_traces.py data/traces.jsonl --speed 10
+    python tests/replay_traces.py data/traces.jsonl* --speed 0 --profile cprofile
+    python tests/replay_traces.py data/traces.jsonl --profile sample --output benchmark_results/replay.json
+"""
+import os
+import re
+import sys
+import json
+import gzip
+import time
+import random
+import asyncio
+import argparse
+import bisect
+import cProfile
+import pstats
+import tempfile
+import threading
+import statistics
+from collections import Counter, defaultdict, deque
+from typing import Dict, Any, List, Optional, Tuple
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from harness import app_client  # noqa: E402
+
+
+def load_records(paths: List[str]) -> List[Dict[str, Any]]:
+    records = []
+    for path in paths:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # A worker killed mid-write leaves a partial last line
+                    continue
+    records.sort(key=lambda r: r.get("t", 0))
+    return records
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class RecordedUpstream:
+    """Answers provider HTTP calls from the recorded upstream traffic"""
+
+    def __init__(self, records: List[Dict[str, Any]], speed: float):
+        self.speed = speed
+        self.clock_start = records[0]["t"] if records else 0.0
+        self.replay_started = time.monotonic()
+        self.last_dispatched = self.clock_start
+        # (provider, native id) -> recorded snapshots, by time
+        self.snapshots: Dict[Tuple[str, str], List[Tuple[float, Dict[str, Any]]]] = defaultdict(list)
+        self.creates: Dict[str, deque] = defaultdict(deque)
+        self.latency_ms: Dict[Tuple[str, str], List[float]] = defaultdict(list)
+        self.counters: Counter = Counter()
+
+        for record in records:
+            calls = record.get("u", []) if record.get("k") == "req" else [record] if record.get("k") == "up" else []
+            for call in calls:
+                self.latency_ms[(call["pv"], call["op"])].append(call["d"])
+                body = call.get("b") if isinstance(call.get("b"), dict) else {}
+                if call["op"] == "create":
+                    self.creates[call["pv"]].append(call)
+                    if body.get("id"):
+                        # Known from creation on, "queued" until a later snapshot
+                        self.snapshots[(call["pv"], body["id"])]
+                items = body.get("items") if isinstance(body.get("items"), list) else [body]
+                for item in items:
+                    if isinstance(item, dict) and item.get("id") and item.get("status"):
+                        self.snapshots[(call["pv"], item["id"])].append((call["t"], item))
+        for snapshots in self.snapshots.values():
+            snapshots.sort(key=lambda s: s[0])
+
+    def now(self) -> float:
+        """Recorded time the replay has reached"""
+        if self.speed > 0:
+            return self.clock_start + (time.monotonic() - self.replay_started) * self.speed
+        return self.last_dispatched
+
+    def snapshot(self, provider: str, native_id: str) -> Optional[Dict[str, Any]]:
+        snapshots = self.snapshots.get((provider, native_id))
+        if snapshots is None:
+            return None
+        index = bisect.bisect_right([t for t, _ in snapshots], self.now())
+        return snapshots[index - 1][1] if index else {"id": native_id, "status": "queued"}
+
+    async def delay(self, provider: str, operation: str, recorded_ms: Optional[float] = None) -> None:
+        if self.speed <= 0:
+            return
+        if recorded_ms is None:
+            samples = self.latency_ms.get((provider, operation))
+            recorded_ms = random.choice(samples) if samples else 0.0
+        await asyncio.sleep(recorded_ms / 1000 / self.speed)
+
+    def transport(self, provider: str) -> httpx.MockTransport:
+        async def handle(request: httpx.Request) -> httpx.Response:
+            path = request.url.path
+            if request.method == "POST":
+                self.counters["create"] += 1
+                call = self.creates[provider].popleft() if self.creates[provider] else None
+                await self.delay(provider, "create", call["d"] if call else None)
+                if call is None:
+                    self.counters["create_synthesized"] += 1
+                    return httpx.Response(200, json={"id": f"replay-{self.counters['create']}", "status": "queued"})
+                if call["s"] == 0:
+                    raise httpx.ReadTimeout("recorded upstream timeout", request=request)
+                body = call.get("b")
+                return httpx.Response(call["s"], json=body if isinstance(body, dict) and "bytes" not in body else {})
+            if request.method == "DELETE":
+                await self.delay(provider, "cancel")
+                return httpx.Response(200, json={})
+
+            task_ids = request.url.params.get_list("filter.task_ids")
+            if path.rstrip("/").endswith("/tasks"):
+                # Ark task-list: by ids (poller) or by status (reconciler)
+                await self.delay(provider, "list")
+                if task_ids:
+                    items = [s for s in (self.snapshot(provider, i) for i in task_ids) if s is not None]
+                else:
+                    status = request.url.params.get("filter.status")
+                    items = [
+                        s for s in (self.snapshot(provider, i) for p, i in self.snapshots if p == provider)
+                        if s is not None and (not status or s.get("status") == status)
+                    ]
+                self.counters["list"] += 1
+                return httpx.Response(200, json={"items": items, "total": len(items)})
+
+            await self.delay(provider, "query")
+            self.counters["query"] += 1
+            snapshot = self.snapshot(provider, path.rstrip("/").rsplit("/", 1)[-1])
+            if snapshot is None:
+                self.counters["query_unknown"] += 1
+                return httpx.Response(404, json={"error": {"code": "ResourceNotFound", "message": "not in trace"}})
+            return httpx.Response(200, json=snapshot)
+
+        return httpx.MockTransport(handle)
+
+
+class StackSampler:
+    """Samples the event loop thread's stack, attributing samples to the only route in flight"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.in_flight: Counter = Counter()
+        self.stacks: Dict[str, Counter] = defaultdict(Counter)
+        self._thread_id = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            routes = [route for route, n in self.in_flight.items() if n > 0]
+            if not routes or stack[0] == "selectors.py:select":
+                # The loop is waiting for I/O (upstream delays), not running a route
+                label = "(idle)"
+            else:
+                label = routes[0] if len(routes) == 1 else "(concurrent)"
+            self.stacks[label][";".join(reversed(stack))] += 1
+
+
+class Profiler:
+    def __init__(self, mode: str, directory: str, sample_ms: float):
+        self.mode = mode
+        self.directory = directory
+        self.profiles: Dict[str, cProfile.Profile] = {}
+        self.lock = asyncio.Lock()
+        self.sampler = StackSampler(sample_ms / 1000) if mode == "sample" else None
+
+    async def run(self, route: str, call):
+        if self.mode == "cprofile":
+            async with self.lock:
+                profile = self.profiles.setdefault(route, cProfile.Profile())
+                profile.enable()
+                try:
+                    return await call()
+                finally:
+                    profile.disable()
+        if self.sampler is not None:
+            self.sampler.in_flight[route] += 1
+            try:
+                return await call()
+            finally:
+                self.sampler.in_flight[route] -= 1
+        return await call()
+
+    def write(self, top: int) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        slug = lambda route: re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+        for route, profile in self.profiles.items():
+            path = os.path.join(self.directory, f"{slug(route)}.prof")
+            profile.dump_stats(path)
+            print(f"\n--- {route} (cProfile, {path}) ---")
+            pstats.Stats(profile).sort_stats("cumulative").print_stats(top)
+        if self.sampler is not None:
+            for route, stacks in self.sampler.stacks.items():
+                path = os.path.join(self.directory, f"{slug(route)}.folded")
+                with open(path, "w") as f:
+                    for stack, count in stacks.most_common():
+                        f.write(f"{stack} {count}\n")
+                leaves = Counter()
+                for stack, count in stacks.items():
+                    leaves[stack.rsplit(";", 1)[-1]] += count
+                total = sum(stacks.values())
+                print(f"\n--- {route} ({total} samples, {path}) ---")
+                for leaf, count in leaves.most_common(top):
+                    print(f"{count / total:>7.1%}  {leaf}")
+
+
+async def replay(args, records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    requests = [r for r in records if r.get("k") == "req"]
+    providers = sorted({c["pv"] for r in records for c in (r.get("u", []) if r.get("k") == "req" else [r]) if "pv" in c})
+    data_dir = tempfile.mkdtemp(prefix="sora2-replay-")
+
+    upstream = RecordedUpstream(records, args.speed)
+    profiler = Profiler(args.profile, args.profile_dir, args.sample_ms) if args.profile else None
+    ids: Dict[str, str] = {}
+    results: Dict[str, Dict[str, list]] = defaultdict(lambda: {"recorded": [], "replayed": [], "mismatch": []})
+    skipped: Counter = Counter()
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    def map_ids(recorded: Any, replayed: Any) -> None:
+        """Remember which replayed ids stand for the recorded ones (task, preview)"""
+        if isinstance(recorded, dict) and isinstance(replayed, dict):
+            if isinstance(recorded.get("id"), str) and isinstance(replayed.get("id"), str):
+                ids[recorded["id"]] = replayed["id"]
+            map_ids(recorded.get("preview"), replayed.get("preview"))
+            for a, b in zip(recorded.get("items") or [], replayed.get("items") or []):
+                map_ids(a.get("data"), b.get("data"))
+
+    async def send(client: httpx.AsyncClient, record: Dict[str, Any]) -> None:
+        route = f"{record['m']} {record.get('r') or record['p']}"
+        body = record.get("b")
+        if record["p"].endswith("/video") or (isinstance(body, dict) and set(body) == {"bytes"}):
+            skipped[route] += 1
+            return
+        path = record["p"]
+        for recorded_id, replayed_id in ids.items():
+            if recorded_id in path:
+                path = path.replace(recorded_id, replayed_id)
+        headers = {k: v for k, v in (record.get("h") or {}).items() if k != "content-length"}
+        async def timed():
+            # Inside the profiler, so waiting for cProfile's turn is not counted
+            started = time.perf_counter()
+            response = await client.request(record["m"], path, params=record.get("q") or None, headers=headers, json=body)
+            return response, (time.perf_counter() - started) * 1000
+
+        response, elapsed_ms = await (profiler.run(route, timed) if profiler else timed())
+        results[route]["replayed"].append(elapsed_ms)
+        results[route]["recorded"].append(record["d"])
+        results[route]["mismatch"].append(response.status_code != record["s"])
+        recorded_data = (record.get("rb") or {}).get("data") if isinstance(record.get("rb"), dict) else None
+        if recorded_data is not None and response.headers.get("content-type", "").startswith("application/json"):
+            map_ids(recorded_data, response.json().get("data"))
+
+    async with app_client(
+        data_dir,
+        base_url="http://replay",
+        timeout=300,
+        VIDEO_PROVIDERS=",".join(providers) or "ark",
+        LOG_LEVEL=os.environ.get("LOG_LEVEL", "WARNING"),
+        TRACE_CAPTURE_PATH="",
+        WEBHOOK_ENABLED="false",
+        IMAGE_PREPROCESS_ENABLED="false",
+        RECONCILE_ENABLED="false"
+    ) as (app, client):
+        for name, provider in app.state.video_service.providers.items():
+            provider._http = httpx.AsyncClient(base_url="http://recorded", transport=upstream.transport(name))
+
+        if profiler and profiler.sampler:
+            profiler.sampler.start()
+        started = time.monotonic()
+        upstream.replay_started = started
+        pending = []
+        for record in requests:
+            if args.route and args.route not in (record.get("r") or record["p"]):
+                continue
+            if args.speed > 0:
+                offset = (record["t"] - upstream.clock_start) / args.speed
+                await asyncio.sleep(max(0.0, offset - (time.monotonic() - started)))
+            else:
+                await semaphore.acquire()
+            upstream.last_dispatched = record["t"]
+
+            async def run(record=record) -> None:
+                try:
+                    await send(client, record)
+                except Exception as e:
+                    skipped[f"error: {type(e).__name__}"] += 1
+                finally:
+                    if args.speed <= 0:
+                        semaphore.release()
+
+            pending.append(asyncio.create_task(run()))
+        await asyncio.gather(*pending)
+        elapsed = time.monotonic() - started
+        if profiler and profiler.sampler:
+            profiler.sampler.stop()
+
+    report = {
+        "requests": len(requests),
+        "speed": args.speed,
+        "elapsed_seconds": round(elapsed, 2),
+        "routes": {
+            route: {
+                "count": len(r["replayed"]),
+                "recorded_p50_ms": round(percentile(r["recorded"], 0.50), 1),
+                "recorded_p99_ms": round(percentile(r["recorded"], 0.99), 1),
+                "replay_p50_ms": round(percentile(r["replayed"], 0.50), 1),
+                "replay_p95_ms": round(percentile(r["replayed"], 0.95), 1),
+                "replay_p99_ms": round(percentile(r["replayed"], 0.99), 1),
+                "replay_max_ms": round(max(r["replayed"]), 1),
+                "replay_mean_ms": round(statistics.fmean(r["replayed"]), 1),
+                "status_mismatches": sum(r["mismatch"]),
+            }
+            for route, r in sorted(results.items())
+        },
+        "skipped": dict(skipped),
+        "upstream": dict(upstream.counters),
+    }
+    if profiler:
+        profiler.write(args.top)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay captured traffic against the app")
+    parser.add_argument("traces", nargs="+", help="Trace files (TRACE_CAPTURE_PATH, rotated .gz too)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Time compression; 0 = as fast as possible")
+    parser.add_argument("--concurrency", type=int, default=16, help="In-flight requests when --speed 0")
+    parser.add_argument("--route", help="Only replay requests whose route contains this")
+    parser.add_argument("--profile", choices=("cprofile", "sample"), help="Profile per route")
+    parser.add_argument("--profile-dir", default="benchmark_results/profiles")
+    parser.add_argument("--sample-ms", type=float, default=5.0, help="Sampling interval for --profile sample")
+    parser.add_argument("--top", type=int, default=15, help="Functions printed per route profile")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for sampled upstream delays")
+    parser.add_argument("--output", help="Write the report JSON here")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    records = load_records(args.traces)
+    if not any(r.get("k") == "req" for r in records):
+        sys.exit("No request records in the given traces")
+    report = asyncio.run(replay(args, records))
+
+    print(f"\n{'route':<48}{'n':>6}{'rec p50':>9}{'rec p99':>9}{'p50':>8}{'p95':>8}{'p99':>8}{'max':>8}{'status!=':>9}")
+    for route, r in report["routes"].items():
+        print(
+            f"{route:<48}{r['count']:>6}{r['recorded_p50_ms']:>9}{r['recorded_p99_ms']:>9}{r['replay_p50_ms']:>8}"
+            f"{r['replay_p95_ms']:>8}{r['replay_p99_ms']:>8}{r['replay_max_ms']:>8}{r['status_mismatches']:>9}"
+        )
+    if report["skipped"]:
+        print(f"skipped: {report['skipped']}")
+    print(f"upstream: {report['upstream']}, elapsed: {report['elapsed_seconds']}s")
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()